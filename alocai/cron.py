@@ -0,0 +1,29 @@
+"""
+Rotas das tarefas periódicas.
+
+Na Vercel não há processo contínuo: as tarefas que os comandos de manutenção
+executam em servidores próprios são rotas chamadas pelo cron da plataforma
+(ver vercel.json), que envia `Authorization: Bearer <CRON_SECRET>`. Sem
+CRON_SECRET configurado as rotas ficam desativadas.
+"""
+import hmac
+
+from django.conf import settings
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+class RotaDeCron(APIView):
+    """A subclasse implementa `executar()`, cujo retorno é o corpo da resposta."""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def executar(self):
+        raise NotImplementedError
+
+    def get(self, request):
+        esperado = f'Bearer {settings.CRON_SECRET}'
+        if not settings.CRON_SECRET or not hmac.compare_digest(request.headers.get('Authorization', ''), esperado):
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        return Response(self.executar())
@@ -0,0 +1,112 @@
+"""
+Paginação por chave (keyset) das listagens.
+
+A paginação é opcional: sem `?tamanho=` nem `?cursor=` a listagem vem
+inteira, como antes. Paginando, o corpo da resposta continua sendo a lista de
+itens; os cursores opacos da página seguinte e da anterior vão no cabeçalho
+Link (rel="next" e rel="prev"), exposto ao frontend por CORS_EXPOSE_HEADERS.
+Cada página é buscada com um filtro sobre a chave de ordenação do último item
+visto, sem OFFSET, de modo que o custo não cresce com a posição na listagem.
+
+A view define a chave em `ordenacao_chave`, uma tupla de campos com a mesma
+direção terminada por um campo único (normalmente a pk).
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime, time
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _serializar(valor):
+    if isinstance(valor, (date, datetime, time)):
+        return valor.isoformat()
+    return valor
+
+
+class PaginacaoPorChave(BasePagination):
+    tamanho_pagina = 50
+    tamanho_maximo = 200
+    parametro_cursor = 'cursor'
+    parametro_tamanho = 'tamanho'
+    mensagem_cursor_invalido = 'Cursor inválido.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not any(parametro in request.query_params for parametro in (self.parametro_cursor, self.parametro_tamanho)):
+            return None
+        self.url = request.build_absolute_uri()
+        ordenacao = tuple(view.ordenacao_chave)
+        self.campos = [campo.lstrip('-') for campo in ordenacao]
+        decrescente = ordenacao[0].startswith('-')
+        tamanho = self._tamanho(request)
+
+        cursor = request.query_params.get(self.parametro_cursor)
+        voltando = False
+        if cursor:
+            voltando, valores = self._decodificar(cursor, queryset.model)
+            # Voltando, a busca anda no sentido contrário da ordenação
+            queryset = queryset.filter(self._depois_de(valores, decrescente != voltando))
+
+        if voltando:
+            ordenacao = tuple(campo[1:] if campo.startswith('-') else f'-{campo}' for campo in ordenacao)
+
+        itens = list(queryset.order_by(*ordenacao)[:tamanho + 1])
+        ha_mais = len(itens) > tamanho
+        itens = itens[:tamanho]
+        if voltando:
+            itens.reverse()
+
+        # Quem chegou por um cursor sempre tem a página de onde veio do outro lado
+        tem_proxima = bool(itens) and (ha_mais if not voltando else True)
+        tem_anterior = bool(itens) and (ha_mais if voltando else bool(cursor))
+        self.proxima = self._codificar(False, itens[-1]) if tem_proxima else None
+        self.anterior = self._codificar(True, itens[0]) if tem_anterior else None
+        return itens
+
+    def get_paginated_response(self, data):
+        links = []
+        if self.proxima:
+            links.append(f'<{replace_query_param(self.url, self.parametro_cursor, self.proxima)}>; rel="next"')
+        if self.anterior:
+            links.append(f'<{replace_query_param(self.url, self.parametro_cursor, self.anterior)}>; rel="prev"')
+        headers = {'Link': ', '.join(links)} if links else None
+        return Response(data, headers=headers)
+
+    def _tamanho(self, request):
+        try:
+            tamanho = int(request.query_params[self.parametro_tamanho])
+        except (KeyError, ValueError):
+            return self.tamanho_pagina
+        return max(1, min(tamanho, self.tamanho_maximo))
+
+    def _depois_de(self, valores, decrescente):
+        """Q dos itens posteriores à chave `valores` (comparação lexicográfica)."""
+        operador = 'lt' if decrescente else 'gt'
+        filtro = Q()
+        for posicao, campo in enumerate(self.campos):
+            iguais = {anterior: valores[indice] for indice, anterior in enumerate(self.campos[:posicao])}
+            filtro |= Q(**iguais, **{f'{campo}__{operador}': valores[posicao]})
+        return filtro
+
+    def _codificar(self, voltando, item):
+        dados = [voltando, [_serializar(getattr(item, campo)) for campo in self.campos]]
+        return base64.urlsafe_b64encode(json.dumps(dados).encode()).decode()
+
+    def _decodificar(self, cursor, modelo):
+        try:
+            voltando, valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(valores) != len(self.campos):
+                raise ValueError
+            valores = [
+                (modelo._meta.pk if campo == 'pk' else modelo._meta.get_field(campo)).to_python(valor)
+                for campo, valor in zip(self.campos, valores)
+            ]
+        except (binascii.Error, TypeError, ValueError, ValidationError):
+            raise NotFound(self.mensagem_cursor_invalido)
+        return bool(voltando), valores
@@ -87,6 +87,17 @@ DATABASES = {
     )
 }
 
+# Cache das consultas de disponibilidade. Com mais de um processo (gunicorn com
+# vários workers, serverless) use REDIS_URL, para que as invalidações valham
+# para todos. Sem ele o cache é por processo e as respostas não são cacheadas
+# (RESPOSTAS_EM_CACHE), para nenhum processo servir dados desatualizados
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+RESPOSTAS_EM_CACHE = bool(REDIS_URL)
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator'},
@@ -114,6 +125,8 @@ if 'test' in sys.argv or 'test_coverage' in sys.argv:
         'NAME': ':memory:'
     }
     PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    # Um único processo: o cache local vale para todas as requisições
+    RESPOSTAS_EM_CACHE = True
     MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -141,6 +154,8 @@ _cors_extra = config('CORS_EXTRA_ORIGINS', default='')
 _extra_origins = [n for o in _cors_extra.split(',') if (n := _normalize_cors_origin(o))] if _cors_extra else []
 CORS_ALLOWED_ORIGINS = _cors_defaults + _extra_origins
 CORS_ALLOW_CREDENTIALS = True
+# Cursores da paginação (ver alocai.paginacao)
+CORS_EXPOSE_HEADERS = ['Link']
 CSRF_TRUSTED_ORIGINS = CORS_ALLOWED_ORIGINS.copy()
 
 
@@ -217,4 +232,6 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+# Segredo da rota de cron que envia os e-mails pendentes (ver notification.envio)
+CRON_SECRET = config('CRON_SECRET', default='')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
\ No newline at end of file
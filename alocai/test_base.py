@@ -3,6 +3,7 @@ from django.core.cache import cache
 from login.models import Usuario
 from user_profile.models import PerfilAcesso
 from resources.models import Recurso
+from booking.expiracao import esquecer_proxima_verificacao
 from booking.models import Agendamento, AgendamentoPai
 from notification.models import Notificacao
 
@@ -37,4 +38,5 @@ class BaseTestCase(APITestCase):
         )
 
     def setUp(self):
-        cache.clear()
\ No newline at end of file
+        cache.clear()
+        esquecer_proxima_verificacao()
\ No newline at end of file
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import include, path
 from login.views import health_check, CookieTokenRefreshView
-from resources.views import RecursoListView, DashboardView, CalendarAgendamentosView
+from resources.views import RecursoListView, RecursosLivresView, RecursosOcupadosView, DashboardView, CalendarAgendamentosView
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 urlpatterns = [
@@ -15,7 +15,9 @@ urlpatterns = [
 
     path('api/dashboard/', DashboardView.as_view(), name='dashboard'),
     path('api/dashboard/calendar/', CalendarAgendamentosView.as_view(), name='dashboard-calendar'),
+    path('api/dashboard/ocupados/', RecursosOcupadosView.as_view(), name='dashboard-ocupados'),
     path('api/recursos/', RecursoListView.as_view(), name='listar-recursos'),
+    path('api/recursos/livres/', RecursosLivresView.as_view(), name='listar-recursos-livres'),
     path('api/admin/', include('resources.urls')),
 
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
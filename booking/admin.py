@@ -21,7 +21,7 @@ class AgendamentoPaiAdmin(admin.ModelAdmin):
 class AgendamentoAdmin(admin.ModelAdmin):
     list_display = ('id_agendamento', 'agendamento_pai', 'data_inicio', 'hora_inicio', 'hora_fim', 'status_agendamento')
     list_filter = ('status_agendamento', 'data_inicio')
-    search_fields = ('agendamento_pai__id_recurso__nome_recurso',)
+    search_fields = ('id_recurso__nome_recurso',)
     readonly_fields = ('data_ultima_atualizacao',)
 
 
@@ -30,4 +30,4 @@ class UsoImediatoAdmin(admin.ModelAdmin):
     list_display = ('id_uso', 'id_usuario', 'id_recurso', 'duracao_minutos', 'ativo', 'data_inicio')
     list_filter = ('ativo', 'data_inicio')
     search_fields = ('id_usuario__nome', 'id_recurso__nome_recurso')
-    readonly_fields = ('data_inicio',)
+    readonly_fields = ('data_inicio', 'expira_em')
@@ -0,0 +1,89 @@
+"""
+Cache das consultas de horários aprovados e de ocupação por recurso.
+
+Cada recurso tem um contador de versão no cache do Django e as chaves das
+respostas cacheadas incluem essa versão. Toda gravação que altera agendamentos
+de um recurso chama `invalidar_recursos`, que avança o contador: as entradas
+antigas deixam de ser lidas e expiram sozinhas, sem varredura. Um contador
+global, avançado junto, versiona as respostas que reúnem todos os recursos.
+
+As respostas só são cacheadas com um cache compartilhado por todos os
+processos (settings.RESPOSTAS_EM_CACHE, ligado com REDIS_URL): com o cache
+local de cada processo, a invalidação feita em um não alcançaria os outros.
+Os contadores de versão continuam sendo mantidos em qualquer caso.
+
+As gravações feitas por save()/delete() são cobertas pelos sinais em
+booking.signals; update() e bulk_create() não disparam sinais, então quem os
+usa chama `invalidar_recursos` explicitamente.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Tempo de vida das respostas; a versão garante que nenhuma fique desatualizada
+TTL_RESPOSTA = 60 * 60
+
+
+def respostas_em_cache():
+    """Se as respostas podem ser lidas e gravadas no cache (cache compartilhado)."""
+    return settings.RESPOSTAS_EM_CACHE
+
+
+# Versão avançada junto com a de qualquer recurso, para respostas que reúnem todos
+CHAVE_VERSAO_GLOBAL = 'recursos:versao'
+
+
+def _chave_versao(recurso_id):
+    return f'recurso:{recurso_id}:versao'
+
+
+def _versao(chave):
+    versao = cache.get(chave)
+    if versao is None:
+        # Um valor novo baseado no relógio, para nunca reaproveitar uma versão
+        # anterior caso o contador tenha sido descartado do cache
+        cache.add(chave, time.time_ns(), timeout=None)
+        versao = cache.get(chave)
+    return versao
+
+
+def versao_recurso(recurso_id):
+    """Versão atual dos agendamentos do recurso."""
+    return _versao(_chave_versao(recurso_id))
+
+
+def versao_global():
+    """Versão que muda sempre que a de algum recurso muda."""
+    return _versao(CHAVE_VERSAO_GLOBAL)
+
+
+def _avancar_versoes(recurso_ids):
+    for chave in [*(_chave_versao(recurso_id) for recurso_id in recurso_ids), CHAVE_VERSAO_GLOBAL]:
+        try:
+            cache.incr(chave)
+        except ValueError:
+            cache.set(chave, time.time_ns(), timeout=None)
+
+
+def invalidar_recursos(*recurso_ids):
+    """
+    Avança a versão dos recursos informados após o commit da transação
+    corrente, para que nenhuma leitura anterior ao commit seja cacheada com a
+    versão nova.
+    """
+    recurso_ids = {recurso_id for recurso_id in recurso_ids if recurso_id is not None}
+    if recurso_ids:
+        transaction.on_commit(lambda: _avancar_versoes(recurso_ids))
+
+
+def prefixo_versionado(prefixo, recurso_id):
+    """Prefixo das chaves do recurso na versão atual, para montar várias chaves com uma leitura."""
+    return f'{prefixo}:{recurso_id}:{versao_recurso(recurso_id)}'
+
+
+def chave_resposta(prefixo, recurso_id, *partes):
+    """Chave de uma resposta cacheada do recurso, atrelada à versão atual."""
+    sufixo = ':'.join(str(parte) for parte in partes)
+    return f'{prefixo_versionado(prefixo, recurso_id)}:{sufixo}'
@@ -0,0 +1,177 @@
+"""
+Motor de detecção de conflitos de horário entre agendamentos.
+
+Todas as verificações de conflito da aplicação passam por aqui: os agendamentos
+do recurso são carregados em uma única consulta, limitada à janela de datas
+necessária, e as sobreposições são resolvidas em memória com um índice
+ordenado por dia.
+
+No PostgreSQL, as buscas por agendamentos aprovados usam o operador `&&` sobre
+a coluna "periodo" (tstzrange), servida pelo índice GiST da restrição de
+exclusão criada em 0004_agendamento_periodo.
+
+As ocorrências ainda não gravadas de séries aprovadas (ver booking.series)
+entram nas verificações contra aprovados, geradas a partir da regra.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Agendamento, StatusAgendamento
+from .series import ocorrencias_virtuais
+
+
+def _campos(item):
+    """Extrai (data, hora_inicio, hora_fim) de um Agendamento ou de um dict validado."""
+    if isinstance(item, dict):
+        return item['data_inicio'], item['hora_inicio'], item['hora_fim']
+    return item.data_inicio, item.hora_inicio, item.hora_fim
+
+
+class IndiceIntervalos:
+    """
+    Índice estático de intervalos de horário agrupados por dia.
+
+    Em cada dia os intervalos ficam ordenados pelo início, acompanhados do
+    maior fim acumulado. Um intervalo [inicio, fim) sobrepõe algum item do dia
+    se, entre os itens que começam antes de `fim`, o maior fim for posterior a
+    `inicio` — uma busca binária por consulta.
+    """
+
+    def __init__(self, itens):
+        por_dia = defaultdict(list)
+        for item in itens:
+            data, inicio, fim = _campos(item)
+            por_dia[data].append((inicio, fim, item))
+
+        self._dias = {}
+        for data, entradas in por_dia.items():
+            entradas.sort(key=lambda entrada: entrada[0])
+            inicios = []
+            maiores_fins = []
+            maior = None
+            for inicio, fim, item in entradas:
+                if maior is None or fim > maior[0]:
+                    maior = (fim, item)
+                inicios.append(inicio)
+                maiores_fins.append(maior)
+            self._dias[data] = (inicios, maiores_fins)
+
+    def buscar(self, data, inicio, fim):
+        """Retorna um item que sobrepõe o intervalo informado, ou None."""
+        dia = self._dias.get(data)
+        if dia is None:
+            return None
+        inicios, maiores_fins = dia
+        posicao = bisect_left(inicios, fim)
+        if posicao and maiores_fins[posicao - 1][0] > inicio:
+            return maiores_fins[posicao - 1][1]
+        return None
+
+
+def _usa_periodo(status):
+    """Indica se a busca pode usar a coluna de intervalo nativa do PostgreSQL."""
+    return connection.vendor == 'postgresql' and status == StatusAgendamento.APROVADO
+
+
+def agendamentos_na_janela(recurso, intervalos, status, excluir_ids=()):
+    """
+    Retorna os agendamentos do recurso com o status dado cujas datas estão
+    entre a menor e a maior data dos intervalos.
+    """
+    datas = [_campos(intervalo)[0] for intervalo in intervalos]
+    if not datas:
+        return Agendamento.objects.none()
+
+    queryset = Agendamento.objects.filter(id_recurso=recurso, status_agendamento=status)
+
+    if _usa_periodo(status):
+        inicio = timezone.make_aware(datetime.combine(min(datas), time.min))
+        fim = timezone.make_aware(datetime.combine(max(datas) + timedelta(days=1), time.min))
+        queryset = queryset.filter(RawSQL(
+            '"agendamento"."periodo" && tstzrange(%s, %s, %s)',
+            (inicio, fim, '[)'),
+            output_field=BooleanField()
+        ))
+    else:
+        queryset = queryset.filter(data_inicio__range=(min(datas), max(datas)))
+
+    if excluir_ids:
+        queryset = queryset.exclude(id_agendamento__in=list(excluir_ids))
+    return queryset
+
+
+def aprovados_na_janela(recurso, intervalos, excluir_ids=(), excluir_pai=None):
+    """
+    Lista os horários aprovados do recurso na janela dos intervalos: os
+    agendamentos gravados e as ocorrências ainda não gravadas de séries
+    aprovadas (exceto as da série `excluir_pai`).
+    """
+    intervalos = list(intervalos)
+    aprovados = list(agendamentos_na_janela(recurso, intervalos, StatusAgendamento.APROVADO, excluir_ids))
+    if intervalos:
+        datas = [_campos(intervalo)[0] for intervalo in intervalos]
+        aprovados.extend(ocorrencias_virtuais(recurso, min(datas), max(datas), excluir_pai=excluir_pai))
+    return aprovados
+
+
+def encontrar_conflitos(recurso, intervalos, status=StatusAgendamento.PENDENTE, excluir_ids=()):
+    """
+    Retorna os agendamentos do recurso, com o status dado, que sobrepõem
+    algum dos intervalos informados.
+    """
+    intervalos = list(intervalos)
+    indice = IndiceIntervalos(intervalos)
+    candidatos = agendamentos_na_janela(recurso, intervalos, status, excluir_ids).select_related(
+        'agendamento_pai', 'agendamento_pai__id_usuario'
+    )
+    return [candidato for candidato in candidatos if indice.buscar(*_campos(candidato)) is not None]
+
+
+def conflitos_por_intervalo(recurso, intervalos, excluir_pai=None):
+    """
+    Para cada intervalo, na ordem recebida, retorna o horário aprovado do
+    recurso com que ele colide, ou None.
+    """
+    intervalos = list(intervalos)
+    indice = IndiceIntervalos(aprovados_na_janela(recurso, intervalos, excluir_pai=excluir_pai))
+    return [indice.buscar(*_campos(intervalo)) for intervalo in intervalos]
+
+
+def primeiro_conflito(recurso, intervalos, status=StatusAgendamento.APROVADO, excluir_ids=(), excluir_pai=None):
+    """
+    Retorna a tupla (intervalo, agendamento) do primeiro intervalo, na ordem
+    recebida, que colide com um agendamento do recurso; ou None.
+    """
+    intervalos = list(intervalos)
+    if status == StatusAgendamento.APROVADO:
+        existentes = aprovados_na_janela(recurso, intervalos, excluir_ids, excluir_pai)
+    else:
+        existentes = agendamentos_na_janela(recurso, intervalos, status, excluir_ids)
+    indice = IndiceIntervalos(existentes)
+    for intervalo in intervalos:
+        conflito = indice.buscar(*_campos(intervalo))
+        if conflito is not None:
+            return intervalo, conflito
+    return None
+
+
+def primeira_sobreposicao(intervalos):
+    """
+    Retorna o primeiro par (anterior, intervalo) de intervalos da própria lista
+    que se sobrepõem, em ordem de data e início; ou None.
+    """
+    maior_fim_por_dia = {}
+    for intervalo in sorted(intervalos, key=lambda item: _campos(item)[:2]):
+        data, inicio, fim = _campos(intervalo)
+        anterior = maior_fim_por_dia.get(data)
+        if anterior is not None and _campos(anterior)[2] > inicio:
+            return anterior, intervalo
+        if anterior is None or fim > _campos(anterior)[2]:
+            maior_fim_por_dia[data] = intervalo
+    return None
@@ -0,0 +1,167 @@
+"""
+Aprovação e negação de muitas solicitações de uma vez.
+
+Os horários pendentes do lote são decididos em uma transação. Na aprovação,
+dentro de cada recurso vence quem pediu primeiro (data de criação da
+solicitação, depois data e hora do horário): cada horário é conferido contra
+os aprovados já existentes e contra os aprovados antes dele no próprio lote,
+com os recursos envolvidos travados (ver booking.locks).
+Os perdedores, e os pendentes de fora do lote que colidem com os novos
+aprovados, são negados com um único UPDATE.
+
+Séries longas do lote são decididas antes, também em ordem de chegada e por
+inteiro: as ocorrências ainda não gravadas de cada uma (até
+JANELA_VERIFICACAO_SEMANAS) são conferidas contra os aprovados e contra as das
+séries aceitas antes dela, e passam a ocupar o recurso na decisão dos
+horários gravados do lote.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import invalidar_recursos
+from .conflitos import IndiceIntervalos, aprovados_na_janela, encontrar_conflitos
+from .expiracao import com_status_efetivo
+from .locks import travar_recursos
+from .models import Agendamento, AgendamentoPai, StatusAgendamento
+from .series import JANELA_VERIFICACAO_SEMANAS, conflito_da_serie, ocorrencias_futuras
+
+
+def _ordem_de_chegada(agendamento):
+    pai = agendamento.agendamento_pai
+    return (pai.data_criacao, pai.pk, agendamento.data_inicio, agendamento.hora_inicio, agendamento.pk)
+
+
+def _sobrepoe(aceitos_no_dia, agendamento):
+    return any(
+        aceito.hora_inicio < agendamento.hora_fim and agendamento.hora_inicio < aceito.hora_fim
+        for aceito in aceitos_no_dia
+    )
+
+
+def _resolver_series(series):
+    """
+    Separa as séries do lote em (aceitas, com_conflito), em ordem de chegada.
+    Retorna também, por recurso, as ocorrências não gravadas das aceitas.
+    """
+    limite = timezone.localdate() + timedelta(weeks=JANELA_VERIFICACAO_SEMANAS)
+    reservadas = defaultdict(list)
+    aceitas, com_conflito = [], []
+
+    for pai in sorted(series, key=lambda pai: (pai.data_criacao, pai.pk)):
+        ocorrencias = ocorrencias_futuras(pai, limite)
+        do_lote = IndiceIntervalos(reservadas[pai.id_recurso_id])
+        if conflito_da_serie(pai) or any(
+            do_lote.buscar(ocorrencia.data_inicio, ocorrencia.hora_inicio, ocorrencia.hora_fim)
+            for ocorrencia in ocorrencias
+        ):
+            com_conflito.append(pai)
+        else:
+            aceitas.append(pai)
+            reservadas[pai.id_recurso_id].extend(ocorrencias)
+    return aceitas, com_conflito, reservadas
+
+
+def _resolver_aprovacoes(pendentes, reservadas=()):
+    """
+    Separa os pendentes de um recurso em (aprovados, negados), em ordem de
+    chegada. `reservadas` são ocorrências de séries aceitas no próprio lote.
+    """
+    existentes = IndiceIntervalos([*aprovados_na_janela(pendentes[0].id_recurso_id, pendentes), *reservadas])
+    aceitos_por_dia = defaultdict(list)
+    aprovados, negados = [], []
+
+    for agendamento in sorted(pendentes, key=_ordem_de_chegada):
+        aceitos_no_dia = aceitos_por_dia[agendamento.data_inicio]
+        if existentes.buscar(agendamento.data_inicio, agendamento.hora_inicio, agendamento.hora_fim) \
+                or _sobrepoe(aceitos_no_dia, agendamento):
+            negados.append(agendamento)
+        else:
+            aceitos_no_dia.append(agendamento)
+            aprovados.append(agendamento)
+    return aprovados, negados
+
+
+def decidir_em_lote(novo_status, administrador, ids_agendamento_pai=(), ids_agendamento=()):
+    """
+    Aplica `novo_status` ('aprovado' ou 'negado') aos horários pendentes das
+    solicitações e horários informados.
+
+    Retorna um dict com as listas 'aprovados', 'negados' (pela decisão do
+    administrador), 'negados_por_conflito', 'series_decididas' (pais cuja
+    série longa recebeu `novo_status`) e 'series_com_conflito' (pais cuja
+    série longa não pôde ser aprovada; como no endpoint por solicitação, nenhum
+    horário deles é aprovado e todos seguem pendentes).
+    """
+    resultado = {
+        'aprovados': [], 'negados': [], 'negados_por_conflito': [],
+        'series_decididas': [], 'series_com_conflito': [],
+    }
+
+    with transaction.atomic():
+        # Status efetivo: pendentes cujo horário já passou não entram no lote
+        do_lote = com_status_efetivo(Agendamento.objects.filter(
+            Q(agendamento_pai_id__in=list(ids_agendamento_pai)) | Q(id_agendamento__in=list(ids_agendamento)),
+            status_agendamento=StatusAgendamento.PENDENTE
+        )).filter(status_efetivo=StatusAgendamento.PENDENTE)
+        if novo_status == StatusAgendamento.APROVADO:
+            # Trava antes de ler os pendentes, para que a leitura já reflita as aprovações concorrentes
+            travar_recursos(
+                *do_lote.values_list('id_recurso', flat=True).distinct(),
+                *AgendamentoPai.objects.filter(pk__in=list(ids_agendamento_pai)).values_list('id_recurso', flat=True)
+            )
+        pendentes = list(do_lote.select_related('agendamento_pai__id_usuario', 'agendamento_pai__id_recurso'))
+        series = list(
+            AgendamentoPai.objects.filter(
+                pk__in=list(ids_agendamento_pai), status_serie=StatusAgendamento.PENDENTE
+            ).select_related('id_usuario', 'id_recurso')
+        )
+
+        if novo_status == StatusAgendamento.NEGADO:
+            resultado['negados'] = pendentes
+        else:
+            # Série com conflito além do horizonte: a solicitação inteira fica de fora
+            series, resultado['series_com_conflito'], reservadas = _resolver_series(series)
+            com_conflito = {pai.pk for pai in resultado['series_com_conflito']}
+            pendentes = [agendamento for agendamento in pendentes if agendamento.agendamento_pai_id not in com_conflito]
+
+            por_recurso = defaultdict(list)
+            for agendamento in pendentes:
+                por_recurso[agendamento.id_recurso_id].append(agendamento)
+
+            for recurso, pendentes_do_recurso in por_recurso.items():
+                aprovados, perdedores = _resolver_aprovacoes(pendentes_do_recurso, reservadas[recurso])
+                resultado['aprovados'].extend(aprovados)
+                resultado['negados_por_conflito'].extend(perdedores)
+
+                ids_do_lote = [agendamento.pk for agendamento in pendentes_do_recurso]
+                if aprovados:
+                    resultado['negados_por_conflito'].extend(encontrar_conflitos(
+                        recurso, aprovados, status=StatusAgendamento.PENDENTE, excluir_ids=ids_do_lote
+                    ))
+
+        if resultado['aprovados']:
+            Agendamento.objects.filter(
+                id_agendamento__in=[agendamento.pk for agendamento in resultado['aprovados']]
+            ).update(status_agendamento=StatusAgendamento.APROVADO, gerenciado_por=administrador)
+        if resultado['negados']:
+            Agendamento.objects.filter(
+                id_agendamento__in=[agendamento.pk for agendamento in resultado['negados']]
+            ).update(status_agendamento=StatusAgendamento.NEGADO, gerenciado_por=administrador)
+        if resultado['negados_por_conflito']:
+            Agendamento.objects.filter(
+                id_agendamento__in=[agendamento.pk for agendamento in resultado['negados_por_conflito']]
+            ).update(status_agendamento=StatusAgendamento.NEGADO)
+        if series:
+            AgendamentoPai.objects.filter(pk__in=[pai.pk for pai in series]).update(status_serie=novo_status)
+        resultado['series_decididas'] = series
+
+        invalidar_recursos(
+            *(agendamento.id_recurso_id for lista in ('aprovados', 'negados', 'negados_por_conflito') for agendamento in resultado[lista]),
+            *(pai.id_recurso_id for pai in series)
+        )
+
+    return resultado
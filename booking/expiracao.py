@@ -0,0 +1,144 @@
+"""
+Expiração de agendamentos cujo horário já passou.
+
+As leituras usam o status efetivo (anotação `status_efetivo`), calculado
+contra o horário atual, sem escrever no banco. A gravação física do novo
+status é feita pelo comando `python manage.py expirar_agendamentos`, fora do
+ciclo das requisições.
+
+Os usos imediatos vencidos são marcados como finalizados por
+`finalizar_usos_expirados`, com um UPDATE servido pelo índice do fim previsto
+(`expira_em`) e pulado enquanto o próximo vencimento não chega.
+"""
+from datetime import timedelta
+
+from django.db.models import Case, CharField, F, Min, Q, Value, When
+from django.utils import timezone
+
+from .cache import invalidar_recursos
+from .models import Agendamento, StatusAgendamento, UsoImediato
+
+TAMANHO_LOTE = 500
+
+# (status atual, status após expirar)
+TRANSICOES_EXPIRACAO = (
+    (StatusAgendamento.APROVADO, StatusAgendamento.CONCLUIDO),
+    (StatusAgendamento.PENDENTE, StatusAgendamento.NEGADO),
+)
+
+
+def filtro_expirados(agora):
+    """Q dos agendamentos que terminaram antes de `agora` (horário local)."""
+    return Q(data_fim__lt=agora.date()) | Q(data_fim=agora.date(), hora_fim__lt=agora.time())
+
+
+def status_efetivo_expr(agora=None):
+    """Expressão Case/When com o status do agendamento considerando a expiração."""
+    agora = agora or timezone.localtime()
+    expirado = filtro_expirados(agora)
+    return Case(
+        *[
+            When(expirado & Q(status_agendamento=origem), then=Value(destino))
+            for origem, destino in TRANSICOES_EXPIRACAO
+        ],
+        default=F('status_agendamento'),
+        output_field=CharField()
+    )
+
+
+def com_status_efetivo(queryset, agora=None):
+    """Anota `status_efetivo` em um queryset de Agendamento."""
+    return queryset.annotate(status_efetivo=status_efetivo_expr(agora))
+
+
+def status_efetivo(agendamento, agora=None):
+    """Status efetivo de uma instância; usa a anotação quando presente."""
+    anotado = getattr(agendamento, 'status_efetivo', None)
+    if anotado is not None:
+        return anotado
+
+    agora = agora or timezone.localtime()
+    expirado = agendamento.data_fim < agora.date() or (
+        agendamento.data_fim == agora.date() and agendamento.hora_fim < agora.time()
+    )
+    if expirado:
+        for origem, destino in TRANSICOES_EXPIRACAO:
+            if agendamento.status_agendamento == origem:
+                return destino
+    return agendamento.status_agendamento
+
+
+def expirar_agendamentos(agora=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Move aprovados vencidos para concluído e pendentes vencidos para negado,
+    em lotes limitados percorridos pelo índice (status, data_fim, hora_fim).
+
+    Retorna um dict {status de destino: quantidade atualizada}.
+    """
+    agora = agora or timezone.localtime()
+    totais = {}
+
+    for origem, destino in TRANSICOES_EXPIRACAO:
+        total = 0
+        while True:
+            lote = list(
+                Agendamento.objects.filter(filtro_expirados(agora), status_agendamento=origem)
+                .order_by('data_fim', 'hora_fim')
+                .values_list('id_agendamento', 'id_recurso')[:tamanho_lote]
+            )
+            if not lote:
+                break
+            ids = [id_agendamento for id_agendamento, _ in lote]
+            # Repete o filtro de status para não sobrescrever alterações concorrentes
+            total += Agendamento.objects.filter(
+                id_agendamento__in=ids, status_agendamento=origem
+            ).update(status_agendamento=destino)
+            invalidar_recursos(*(id_recurso for _, id_recurso in lote))
+            if len(ids) < tamanho_lote:
+                break
+        totais[destino] = total
+
+    return totais
+
+
+# Próximo vencimento de uso imediato conhecido por este processo; antes dele
+# a verificação é pulada. Usos criados em outros processos não o antecipam, por
+# isso ele nunca fica mais de INTERVALO_MAXIMO_VERIFICACAO à frente.
+INTERVALO_MAXIMO_VERIFICACAO = timedelta(seconds=60)
+_proxima_verificacao = None
+
+
+def registrar_expiracao(expira_em):
+    """Antecipa a próxima verificação, se `expira_em` vier antes dela."""
+    global _proxima_verificacao
+    if _proxima_verificacao is not None and expira_em < _proxima_verificacao:
+        _proxima_verificacao = expira_em
+
+
+def esquecer_proxima_verificacao():
+    """Força a próxima chamada de `finalizar_usos_expirados` a consultar o banco."""
+    global _proxima_verificacao
+    _proxima_verificacao = None
+
+
+def finalizar_usos_expirados(agora=None):
+    """
+    Marca como finalizados os usos imediatos ativos que passaram da duração
+    prevista. A ocupação do recurso não depende disso (ver booking.ocupacao);
+    aqui só se atualiza o registro do uso.
+
+    Até o próximo vencimento conhecido não faz nenhuma consulta. Depois dele,
+    um UPDATE pelo índice de `expira_em` e a leitura do vencimento seguinte.
+    Retorna quantos usos foram finalizados.
+    """
+    global _proxima_verificacao
+    agora = agora or timezone.now()
+    if _proxima_verificacao is not None and agora <= _proxima_verificacao:
+        return 0
+
+    total = UsoImediato.objects.filter(ativo=True, expira_em__lt=agora).update(ativo=False, data_fim=agora)
+    proximo_vencimento = UsoImediato.objects.filter(ativo=True).aggregate(Min('expira_em'))['expira_em__min']
+
+    limite = agora + INTERVALO_MAXIMO_VERIFICACAO
+    _proxima_verificacao = min(proximo_vencimento, limite) if proximo_vencimento else limite
+    return total
@@ -0,0 +1,128 @@
+"""
+Busca de horários livres de um recurso.
+
+A ocupação de cada dia é um inteiro de SLOTS_POR_DIA bits, um por faixa de
+MINUTOS_POR_SLOT minutos (bit 0 = 00:00-00:15), com o bit ligado quando algum
+agendamento aprovado ocupa a faixa, ainda que em parte. Os mapas são montados
+com uma consulta por bloco de dias e guardados no cache por recurso e dia, sob
+a versão do recurso (ver booking.cache); a busca em si são operações de bits.
+"""
+from datetime import time, timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .cache import TTL_RESPOSTA, prefixo_versionado, respostas_em_cache
+from .models import Agendamento, StatusAgendamento
+from .series import ocorrencias_virtuais
+
+MINUTOS_POR_SLOT = 15
+SLOTS_POR_DIA = 24 * 60 // MINUTOS_POR_SLOT
+
+HORARIO_ABERTURA = time(7, 0)
+HORARIO_FECHAMENTO = time(22, 0)
+
+# Dias carregados por consulta enquanto a busca avança
+DIAS_POR_BLOCO = 28
+
+
+def _slot(horario, arredondar_para_cima=False):
+    minutos = horario.hour * 60 + horario.minute + (horario.second > 0)
+    if arredondar_para_cima:
+        return -(-minutos // MINUTOS_POR_SLOT)
+    return minutos // MINUTOS_POR_SLOT
+
+
+def _mascara(inicio, fim):
+    """Bits dos slots de `inicio` (inclusive) a `fim` (exclusive)."""
+    if fim <= inicio:
+        return 0
+    return ((1 << (fim - inicio)) - 1) << inicio
+
+
+def _horario(slot):
+    if slot >= SLOTS_POR_DIA:
+        return time(23, 59)
+    minutos = slot * MINUTOS_POR_SLOT
+    return time(minutos // 60, minutos % 60)
+
+
+def _montar_mapas(recurso_id, inicio, fim):
+    """Mapas de ocupação de todos os dias entre `inicio` e `fim`, com uma consulta."""
+    mapas = {inicio + timedelta(days=dias): 0 for dias in range((fim - inicio).days + 1)}
+    aprovados = list(
+        Agendamento.objects.filter(
+            id_recurso=recurso_id,
+            status_agendamento=StatusAgendamento.APROVADO,
+            data_inicio__range=(inicio, fim)
+        ).only('data_inicio', 'hora_inicio', 'hora_fim')
+    )
+    aprovados.extend(ocorrencias_virtuais(recurso_id, inicio, fim))
+    for agendamento in aprovados:
+        mapas[agendamento.data_inicio] |= _mascara(
+            _slot(agendamento.hora_inicio), _slot(agendamento.hora_fim, arredondar_para_cima=True)
+        )
+    return mapas
+
+
+def mapas_de_ocupacao(recurso_id, inicio, fim):
+    """Dict {data: bits ocupados} entre `inicio` e `fim`, lido do cache quando possível."""
+    if not respostas_em_cache():
+        return _montar_mapas(recurso_id, inicio, fim)
+
+    prefixo = prefixo_versionado('ocupacao', recurso_id)
+    dias = [inicio + timedelta(days=dias) for dias in range((fim - inicio).days + 1)]
+    chaves = {dia: f'{prefixo}:{dia.isoformat()}' for dia in dias}
+
+    em_cache = cache.get_many(chaves.values())
+    mapas = {dia: em_cache[chave] for dia, chave in chaves.items() if chave in em_cache}
+
+    faltantes = [dia for dia in dias if dia not in mapas]
+    if faltantes:
+        novos = _montar_mapas(recurso_id, min(faltantes), max(faltantes))
+        cache.set_many({chaves[dia]: novos[dia] for dia in faltantes}, TTL_RESPOSTA)
+        mapas.update({dia: novos[dia] for dia in faltantes})
+    return mapas
+
+
+def buscar_horarios_livres(recurso_id, inicio, fim, duracao_minutos, quantidade,
+                           abertura=HORARIO_ABERTURA, fechamento=HORARIO_FECHAMENTO, agora=None):
+    """
+    Retorna até `quantidade` janelas livres (data, início, fim) de pelo menos
+    `duracao_minutos`, dentro do horário de funcionamento, em ordem
+    cronológica. Cada janela é o trecho livre completo, não só a duração pedida.
+    """
+    tamanho = -(-duracao_minutos // MINUTOS_POR_SLOT)
+    expediente = _mascara(_slot(abertura, arredondar_para_cima=True), _slot(fechamento))
+    agora = agora or timezone.localtime()
+
+    janelas = []
+    bloco_inicio = max(inicio, agora.date())
+    while bloco_inicio <= fim and len(janelas) < quantidade:
+        bloco_fim = min(fim, bloco_inicio + timedelta(days=DIAS_POR_BLOCO - 1))
+        mapas = mapas_de_ocupacao(recurso_id, bloco_inicio, bloco_fim)
+
+        for dia in sorted(mapas):
+            livres = ~mapas[dia] & expediente
+            if dia == agora.date():
+                # Descarta o que já passou hoje
+                livres &= ~_mascara(0, _slot(agora.time(), arredondar_para_cima=True))
+
+            # Bits que iniciam `tamanho` slots livres consecutivos
+            inicios = livres
+            for deslocamento in range(1, tamanho):
+                inicios &= livres >> deslocamento
+
+            while inicios and len(janelas) < quantidade:
+                slot_inicio = (inicios & -inicios).bit_length() - 1
+                # Estende até o primeiro slot ocupado
+                restante = livres >> slot_inicio
+                slot_fim = slot_inicio + ((~restante & (restante + 1)).bit_length() - 1)
+                janelas.append((dia, _horario(slot_inicio), _horario(slot_fim)))
+                inicios &= ~_mascara(0, slot_fim)
+
+            if len(janelas) >= quantidade:
+                break
+        bloco_inicio = bloco_fim + timedelta(days=1)
+
+    return janelas
@@ -0,0 +1,80 @@
+"""
+Travas por recurso para as aprovações.
+
+Aprovar é "verificar conflito e depois gravar": sem trava, dois
+administradores podem aprovar o mesmo horário ao mesmo tempo. A trava é por
+recurso, então aprovações em recursos diferentes seguem em paralelo e só as do
+mesmo recurso esperam umas pelas outras. Ela vale até o fim da transação
+corrente, e deve ser tomada antes da verificação de conflito.
+
+- PostgreSQL: pg_advisory_xact_lock, sem bloquear a linha do recurso (que o
+  uso imediato atualiza).
+- Bancos com SELECT ... FOR UPDATE: trava a linha do recurso.
+- SQLite: um UPDATE sem efeito na linha do recurso, que obriga a transação a
+  tomar já o bloqueio de escrita do banco.
+
+Falhas de serialização e deadlocks (e o "database is locked" do SQLite) são
+tratados por `executar_com_retentativas`, que refaz a transação inteira.
+"""
+import logging
+import time
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+
+from resources.models import Recurso
+
+logger = logging.getLogger(__name__)
+
+# Primeira chave das travas consultivas, separando-as de outros usos no banco
+NAMESPACE_TRAVA = 0x616C6F63
+
+TENTATIVAS = 3
+ESPERA_INICIAL = 0.05
+
+# serialization_failure e deadlock_detected
+_CODIGOS_RETENTAVEIS = {'40001', '40P01'}
+
+
+def travar_recursos(*recurso_ids):
+    """
+    Trava os recursos informados até o fim da transação corrente. As travas
+    são tomadas em ordem crescente de id, para que duas transações que travam
+    os mesmos recursos não entrem em deadlock.
+    """
+    recurso_ids = sorted({recurso_id for recurso_id in recurso_ids if recurso_id is not None})
+    if not recurso_ids:
+        return
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for recurso_id in recurso_ids:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [NAMESPACE_TRAVA, recurso_id])
+    elif connection.features.has_select_for_update:
+        list(Recurso.objects.select_for_update().filter(pk__in=recurso_ids).order_by('pk').values_list('pk', flat=True))
+    else:
+        Recurso.objects.filter(pk__in=recurso_ids).update(id_recurso=F('id_recurso'))
+
+
+def _retentavel(erro):
+    causa = erro.__cause__
+    if getattr(causa, 'pgcode', None) in _CODIGOS_RETENTAVEIS or getattr(causa, 'sqlstate', None) in _CODIGOS_RETENTAVEIS:
+        return True
+    return 'database is locked' in str(erro)
+
+
+def executar_com_retentativas(funcao, tentativas=TENTATIVAS):
+    """
+    Executa `funcao` em uma transação, refazendo-a (com espera crescente) se o
+    banco a abortar por falha de serialização ou deadlock. Na última
+    tentativa o erro é propagado.
+    """
+    for tentativa in range(1, tentativas + 1):
+        try:
+            with transaction.atomic():
+                return funcao()
+        except OperationalError as erro:
+            if tentativa == tentativas or not _retentavel(erro):
+                raise
+            logger.info('Transação abortada pelo banco (%s); tentativa %s de %s', erro, tentativa + 1, tentativas)
+            time.sleep(ESPERA_INICIAL * 2 ** (tentativa - 1))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from booking.expiracao import TAMANHO_LOTE, expirar_agendamentos, finalizar_usos_expirados
+
+
+class Command(BaseCommand):
+    help = (
+        'Conclui agendamentos aprovados e nega pendentes cujo horário já passou, '
+        'e encerra os usos imediatos vencidos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Executa continuamente, aguardando --intervalo segundos entre as execuções.'
+        )
+        parser.add_argument('--intervalo', type=int, default=60, help='Segundos entre execuções no modo --loop.')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help='Quantidade máxima de linhas por UPDATE.')
+
+    def handle(self, *args, **options):
+        while True:
+            totais = expirar_agendamentos(tamanho_lote=options['lote'])
+            usos = finalizar_usos_expirados()
+            self.stdout.write(self.style.SUCCESS(
+                f"{totais['concluido']} agendamento(s) concluído(s), {totais['negado']} negado(s), "
+                f"{usos} uso(s) imediato(s) encerrado(s)."
+            ))
+            if not options['loop']:
+                return
+            time.sleep(options['intervalo'])
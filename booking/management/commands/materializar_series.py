@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from booking.series import HORIZONTE_SEMANAS, materializar_series
+
+
+class Command(BaseCommand):
+    help = f'Grava as ocorrências das séries recorrentes longas até {HORIZONTE_SEMANAS} semanas à frente.'
+
+    def handle(self, *args, **options):
+        total = materializar_series()
+        self.stdout.write(self.style.SUCCESS(f"{total} ocorrência(s) materializada(s)."))
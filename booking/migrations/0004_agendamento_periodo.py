@@ -0,0 +1,138 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# O recurso dos agendamentos existentes é preenchido antes da restrição: com
+# id_recurso nulo ela não enxerga nenhum conflito. Aprovados que já se
+# sobrepõem (a aprovação por solicitação não conferia conflitos com outros
+# aprovados) impediriam a criação da restrição. Os que já terminaram passam a
+# concluído, a mesma transição de `expirar_agendamentos`; se restarem
+# sobreposições futuras, a migração para e lista os ids, por recurso, para um
+# administrador resolver (negar ou cancelar um dos lados) antes de rodá-la de
+# novo. Nenhuma decisão sobre horários futuros é alterada aqui.
+#
+# A coluna e a restrição são criadas apenas no PostgreSQL. Em outros bancos
+# (SQLite em dev/testes) a detecção de conflitos continua sendo feita pela
+# aplicação (booking.conflitos).
+
+TAMANHO_LOTE = 1000
+
+SQL_CRIAR_PERIODO = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE agendamento ADD COLUMN periodo tstzrange GENERATED ALWAYS AS (
+    tstzrange(
+        (data_inicio + hora_inicio) AT TIME ZONE '{tz}',
+        (data_fim + hora_fim) AT TIME ZONE '{tz}',
+        '[)'
+    )
+) STORED;
+"""
+
+# Aprovados envolvidos em alguma sobreposição no mesmo recurso
+SQL_SOBREPOSTOS = """
+SELECT DISTINCT b.id_recurso_id, b.id_agendamento
+FROM agendamento a
+JOIN agendamento b
+    ON a.id_recurso_id = b.id_recurso_id
+    AND a.id_agendamento <> b.id_agendamento
+    AND a.periodo && b.periodo
+WHERE a.status_agendamento = 'aprovado' AND b.status_agendamento = 'aprovado'
+ORDER BY b.id_recurso_id, b.id_agendamento
+"""
+
+# Aprovados sobrepostos que já terminaram seguem para concluído
+SQL_CONCLUIR_SOBREPOSTOS_PASSADOS = """
+UPDATE agendamento SET status_agendamento = 'concluido'
+WHERE status_agendamento = 'aprovado' AND upper(periodo) <= now() AND id_agendamento IN (
+    SELECT b.id_agendamento
+    FROM agendamento a
+    JOIN agendamento b
+        ON a.id_recurso_id = b.id_recurso_id
+        AND a.id_agendamento <> b.id_agendamento
+        AND a.periodo && b.periodo
+    WHERE a.status_agendamento = 'aprovado' AND b.status_agendamento = 'aprovado'
+)
+"""
+
+SQL_CRIAR_RESTRICAO = """
+ALTER TABLE agendamento ADD CONSTRAINT agendamento_aprovado_sem_sobreposicao
+    EXCLUDE USING gist (id_recurso_id WITH =, periodo WITH &&)
+    WHERE (status_agendamento = 'aprovado');
+"""
+
+SQL_REMOVER = """
+ALTER TABLE agendamento DROP CONSTRAINT IF EXISTS agendamento_aprovado_sem_sobreposicao;
+ALTER TABLE agendamento DROP COLUMN IF EXISTS periodo;
+"""
+
+
+def preencher_id_recurso(apps, schema_editor):
+    """Copia o recurso do agendamento pai para os agendamentos existentes, em lotes por pk."""
+    Agendamento = apps.get_model('booking', 'Agendamento')
+    AgendamentoPai = apps.get_model('booking', 'AgendamentoPai')
+
+    recurso_do_pai = Subquery(
+        AgendamentoPai.objects.filter(pk=OuterRef('agendamento_pai')).values('id_recurso')[:1]
+    )
+
+    ultimo_id = 0
+    while True:
+        ids = list(
+            Agendamento.objects.filter(
+                pk__gt=ultimo_id,
+                id_recurso__isnull=True,
+                agendamento_pai__isnull=False
+            ).order_by('pk').values_list('pk', flat=True)[:TAMANHO_LOTE]
+        )
+        if not ids:
+            break
+        Agendamento.objects.filter(pk__in=ids).update(id_recurso=recurso_do_pai)
+        ultimo_id = ids[-1]
+
+
+def conferir_aprovados_sobrepostos(apps, schema_editor):
+    """
+    Conclui os aprovados sobrepostos que já terminaram e interrompe a migração
+    se ainda houver aprovados futuros sobrepostos no mesmo recurso.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(SQL_CONCLUIR_SOBREPOSTOS_PASSADOS)
+        cursor.execute(SQL_SOBREPOSTOS)
+        sobrepostos = cursor.fetchall()
+
+    if sobrepostos:
+        por_recurso = {}
+        for id_recurso, id_agendamento in sobrepostos:
+            por_recurso.setdefault(id_recurso, []).append(id_agendamento)
+        detalhes = '\n'.join(f'  recurso {id_recurso}: agendamentos {ids}' for id_recurso, ids in por_recurso.items())
+        raise RuntimeError(
+            'Há agendamentos aprovados sobrepostos no mesmo recurso. Negue ou cancele um dos '
+            f'lados de cada conflito e execute a migração novamente:\n{detalhes}'
+        )
+
+
+def criar_periodo(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(SQL_CRIAR_PERIODO.format(tz=settings.TIME_ZONE))
+    conferir_aprovados_sobrepostos(apps, schema_editor)
+    schema_editor.execute(SQL_CRIAR_RESTRICAO)
+
+
+def remover_periodo(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(SQL_REMOVER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0003_agendamento_id_recurso'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_id_recurso, migrations.RunPython.noop),
+        migrations.RunPython(criar_periodo, remover_periodo),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_agendamento_periodo'),
+        ('resources', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['id_recurso', 'status_agendamento', 'data_inicio', 'hora_inicio'], name='agendamento_rec_status_data'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(condition=models.Q(('status_agendamento', 'pendente')), fields=['id_recurso', 'data_inicio', 'hora_inicio'], name='agendamento_pendente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(condition=models.Q(('status_agendamento', 'aprovado')), fields=['id_recurso', 'data_inicio', 'hora_inicio'], name='agendamento_aprovado_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0005_agendamento_indices'),
+        ('resources', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['status_agendamento', 'data_fim', 'hora_fim'], name='agendamento_expiracao_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0007_agendamento_expiracao_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamentopai',
+            name='regra_recorrencia',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0008_agendamentopai_regra_recorrencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamentopai',
+            name='materializado_ate',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='agendamentopai',
+            name='status_serie',
+            field=models.CharField(blank=True, choices=[('pendente', 'Pendente'), ('aprovado', 'Aprovado'), ('negado', 'Negado'), ('cancelado', 'Cancelado'), ('concluido', 'Concluído')], max_length=20, null=True),
+        ),
+    ]
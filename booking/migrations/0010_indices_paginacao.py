@@ -0,0 +1,28 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0009_agendamentopai_serie_parcial'),
+        ('resources', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(condition=models.Q(('status_agendamento', 'aprovado')), fields=['data_inicio', 'hora_inicio', 'id_agendamento'], name='agendamento_calendario_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamentopai',
+            index=models.Index(fields=['data_criacao', 'id_agendamento_pai'], name='agendamento_pai_criacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamentopai',
+            index=models.Index(fields=['id_usuario', 'data_criacao', 'id_agendamento_pai'], name='agendamento_pai_usuario_idx'),
+        ),
+    ]
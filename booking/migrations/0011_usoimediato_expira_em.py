@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+import django.utils.timezone
+from django.db import migrations, models
+
+TAMANHO_LOTE = 1000
+
+
+def preencher_expira_em(apps, schema_editor):
+    """Grava o fim previsto (início + duração) dos usos existentes, em lotes por pk."""
+    UsoImediato = apps.get_model('booking', 'UsoImediato')
+
+    ultimo_id = 0
+    while True:
+        usos = list(
+            UsoImediato.objects.filter(pk__gt=ultimo_id, expira_em__isnull=True)
+            .order_by('pk').only('pk', 'data_inicio', 'duracao_minutos')[:TAMANHO_LOTE]
+        )
+        if not usos:
+            break
+        for uso in usos:
+            uso.expira_em = uso.data_inicio + timedelta(minutes=uso.duracao_minutos)
+        UsoImediato.objects.bulk_update(usos, ['expira_em'])
+        ultimo_id = usos[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0010_indices_paginacao'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usoimediato',
+            name='data_inicio',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='usoimediato',
+            name='expira_em',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(preencher_expira_em, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='usoimediato',
+            name='expira_em',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='usoimediato',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['expira_em'], name='uso_imediato_expiracao_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.2 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0011_usoimediato_expira_em'),
+        ('resources', '0003_remover_status_reservado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usoimediato',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['id_recurso', 'expira_em'], name='uso_imediato_ocupacao_idx'),
+        ),
+    ]
@@ -1,7 +1,16 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
-from resources.models import Recurso, StatusRecurso
+from resources.models import Recurso
+from .cache import invalidar_recursos
+
+class StatusAgendamento(models.TextChoices):
+    PENDENTE = 'pendente', 'Pendente'
+    APROVADO = 'aprovado', 'Aprovado'
+    NEGADO = 'negado', 'Negado'
+    CANCELADO = 'cancelado', 'Cancelado'
+    CONCLUIDO = 'concluido', 'Concluído'
+
 
 class AgendamentoPai(models.Model):
     id_agendamento_pai = models.AutoField(primary_key=True)
@@ -23,20 +32,43 @@ class AgendamentoPai(models.Model):
         related_name="responsabilidades_pai"
     )
     data_criacao = models.DateTimeField(auto_now_add=True)
+    # Regra semanal usada para gerar os filhos (ver booking.recorrencia); nula para datas avulsas
+    regra_recorrencia = models.JSONField(null=True, blank=True)
+    # Séries longas ficam só parcialmente gravadas em Agendamento (ver booking.series):
+    # materializado_ate é a última data já gravada (nula quando a série está completa)
+    # e status_serie o status das ocorrências ainda não gravadas
+    materializado_ate = models.DateField(null=True, blank=True)
+    status_serie = models.CharField(
+        max_length=20,
+        choices=StatusAgendamento.choices,
+        null=True,
+        blank=True
+    )
 
     class Meta:
         db_table = 'agendamento_pai'
+        # Chaves da paginação das listagens (ver alocai.paginacao)
+        indexes = [
+            models.Index(fields=['data_criacao', 'id_agendamento_pai'], name='agendamento_pai_criacao_idx'),
+            models.Index(
+                fields=['id_usuario', 'data_criacao', 'id_agendamento_pai'],
+                name='agendamento_pai_usuario_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"Solicitação #{self.id_agendamento_pai} - {self.id_recurso}"
 
-
-class StatusAgendamento(models.TextChoices):
-    PENDENTE = 'pendente', 'Pendente'
-    APROVADO = 'aprovado', 'Aprovado'
-    NEGADO = 'negado', 'Negado'
-    CANCELADO = 'cancelado', 'Cancelado'
-    CONCLUIDO = 'concluido', 'Concluído'
+    def save(self, *args, **kwargs):
+        criando = self._state.adding
+        super().save(*args, **kwargs)
+        if not criando:
+            # Propaga uma eventual troca de recurso para a cópia desnormalizada dos filhos
+            desatualizados = self.agendamentos_filhos.exclude(id_recurso=self.id_recurso_id)
+            anteriores = set(desatualizados.values_list('id_recurso', flat=True).distinct())
+            if anteriores:
+                desatualizados.update(id_recurso=self.id_recurso_id)
+                invalidar_recursos(*anteriores)
 
 
 class Agendamento(models.Model):
@@ -65,13 +97,54 @@ class Agendamento(models.Model):
         null=True,
         blank=True
     )
-    
+    # Cópia do recurso do agendamento pai, evitando o JOIN nas consultas de conflito.
+    # No PostgreSQL também compõe a restrição de exclusão sobre a coluna "periodo".
+    id_recurso = models.ForeignKey(
+        Recurso,
+        on_delete=models.CASCADE,
+        related_name="agendamentos",
+        null=True,
+        blank=True,
+        editable=False
+    )
+
     class Meta:
         db_table = 'agendamento'
+        indexes = [
+            models.Index(
+                fields=['id_recurso', 'status_agendamento', 'data_inicio', 'hora_inicio'],
+                name='agendamento_rec_status_data'
+            ),
+            models.Index(
+                fields=['id_recurso', 'data_inicio', 'hora_inicio'],
+                name='agendamento_pendente_idx',
+                condition=models.Q(status_agendamento='pendente')
+            ),
+            models.Index(
+                fields=['id_recurso', 'data_inicio', 'hora_inicio'],
+                name='agendamento_aprovado_idx',
+                condition=models.Q(status_agendamento='aprovado')
+            ),
+            models.Index(
+                fields=['status_agendamento', 'data_fim', 'hora_fim'],
+                name='agendamento_expiracao_idx'
+            ),
+            models.Index(
+                fields=['data_inicio', 'hora_inicio', 'id_agendamento'],
+                name='agendamento_calendario_idx',
+                condition=models.Q(status_agendamento='aprovado')
+            ),
+        ]
 
     def __str__(self):
         return f"Agendamento #{self.id_agendamento} - {self.data_inicio} {self.hora_inicio}-{self.hora_fim} ({self.status_agendamento})"
 
+    def save(self, *args, **kwargs):
+        # Mantém o recurso desnormalizado em sincronia com o agendamento pai
+        if self.agendamento_pai_id is not None:
+            self.id_recurso_id = self.agendamento_pai.id_recurso_id
+        super().save(*args, **kwargs)
+
 
 class UsoImediato(models.Model):
     """Registro de uso imediato de recurso por Terceirizado."""
@@ -93,17 +166,41 @@ class UsoImediato(models.Model):
         default=120,
         help_text='Duração prevista em minutos'
     )
-    data_inicio = models.DateTimeField(auto_now_add=True)
+    data_inicio = models.DateTimeField(default=timezone.now, editable=False)
     data_fim = models.DateTimeField(null=True, blank=True)
     ativo = models.BooleanField(default=True)
+    # Fim previsto (data_inicio + duracao_minutos), gravado para que a busca
+    # por usos vencidos seja servida por índice
+    expira_em = models.DateTimeField(editable=False)
 
     class Meta:
         db_table = 'uso_imediato'
         ordering = ['-data_inicio']
+        indexes = [
+            models.Index(
+                fields=['expira_em'],
+                name='uso_imediato_expiracao_idx',
+                condition=models.Q(ativo=True)
+            ),
+            models.Index(
+                fields=['id_recurso', 'expira_em'],
+                name='uso_imediato_ocupacao_idx',
+                condition=models.Q(ativo=True)
+            ),
+        ]
 
     def __str__(self):
         return f"Uso #{self.id_uso} - {self.id_recurso} ({'ativo' if self.ativo else 'finalizado'})"
 
+    def save(self, *args, **kwargs):
+        # Mantém o fim previsto em sincronia com o início e a duração
+        from datetime import timedelta
+        self.expira_em = self.data_inicio + timedelta(minutes=self.duracao_minutos)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'data_inicio', 'duracao_minutos'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'expira_em'}
+        super().save(*args, **kwargs)
+
     @property
     def expirado(self):
         """Verifica se o uso excedeu a duração prevista."""
@@ -114,14 +211,7 @@ class UsoImediato(models.Model):
         return timezone.now() > limite
 
     def finalizar(self):
-        """Finaliza o uso e libera o recurso se não houver outros usos ativos."""
+        """Finaliza o uso; a ocupação do recurso é calculada (ver booking.ocupacao)."""
         self.ativo = False
         self.data_fim = timezone.now()
         self.save(update_fields=['ativo', 'data_fim'])
-        # Só libera o recurso se não houver outros usos ativos para ele
-        outros_ativos = UsoImediato.objects.filter(
-            id_recurso=self.id_recurso, ativo=True
-        ).exclude(pk=self.pk).exists()
-        if not outros_ativos:
-            self.id_recurso.status_recurso = StatusRecurso.DISPONIVEL
-            self.id_recurso.save(update_fields=['status_recurso'])
\ No newline at end of file
@@ -0,0 +1,133 @@
+"""
+Ocupação atual dos recursos.
+
+Um recurso está ocupado agora se tem um uso imediato ativo que ainda não
+venceu ou um agendamento aprovado cujo horário contém o instante atual. A
+ocupação é calculada a partir do horário, como anotação `ocupado` em
+querysets de Recurso, e não é gravada no recurso: não há status a restaurar
+quando um uso termina ou um agendamento é cancelado.
+
+Cada parte é uma busca de ponto em intervalo servida por índice parcial:
+(id_recurso, expira_em) dos usos ativos e (id_recurso, data_inicio,
+hora_inicio) dos aprovados. As ocorrências ainda não gravadas de séries longas
+ficam de fora: o horizonte gravado (ver booking.series) sempre cobre o dia
+atual.
+
+O quadro de ocupação (`quadro_de_ocupacao`) lista os recursos ocupados agora.
+Ele só muda quando algum horário começa ou termina, então fica no cache até a
+próxima dessas fronteiras, sob a versão global de booking.cache, que as
+gravações avançam.
+"""
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Exists, Min, OuterRef
+from django.utils import timezone
+
+from .cache import TTL_RESPOSTA, respostas_em_cache, versao_global
+from .models import Agendamento, StatusAgendamento, UsoImediato
+
+
+def uso_em_andamento(agora):
+    """Usos imediatos ativos em andamento em `agora` (filtrar por id_recurso)."""
+    return UsoImediato.objects.filter(ativo=True, data_inicio__lte=agora, expira_em__gt=agora)
+
+
+def agendamento_em_andamento(agora):
+    """Agendamentos aprovados em andamento em `agora` (horário local)."""
+    return Agendamento.objects.filter(
+        status_agendamento=StatusAgendamento.APROVADO,
+        data_inicio=agora.date(),
+        hora_inicio__lte=agora.time(),
+        hora_fim__gt=agora.time()
+    )
+
+
+def ocupado_expr(agora=None):
+    """Expressão booleana: o recurso (OuterRef('pk')) está ocupado em `agora`."""
+    agora = timezone.localtime(agora)
+    return (
+        Exists(uso_em_andamento(agora).filter(id_recurso=OuterRef('pk')))
+        | Exists(agendamento_em_andamento(agora).filter(id_recurso=OuterRef('pk')))
+    )
+
+
+def com_ocupacao(queryset, agora=None):
+    """Anota `ocupado` em um queryset de Recurso."""
+    return queryset.annotate(ocupado=ocupado_expr(agora))
+
+
+def _fronteira(data, hora):
+    return timezone.make_aware(datetime.combine(data, hora))
+
+
+def _montar_quadro(agora):
+    """Retorna (itens do quadro, instante da próxima fronteira)."""
+    itens = []
+    fronteiras = [_fronteira(agora.date() + timedelta(days=1), time.min)]
+
+    usos = uso_em_andamento(agora).select_related('id_recurso', 'id_usuario')
+    for uso in usos:
+        fim = timezone.localtime(uso.expira_em)
+        fronteiras.append(fim)
+        itens.append({
+            'id_recurso': uso.id_recurso_id,
+            'recurso': uso.id_recurso.nome_recurso,
+            'localizacao': uso.id_recurso.localizacao,
+            'tipo': 'uso_imediato',
+            'usuario': uso.id_usuario.nome,
+            'finalidade': uso.finalidade,
+            'inicio': timezone.localtime(uso.data_inicio),
+            'fim': fim,
+        })
+
+    agendamentos = agendamento_em_andamento(agora).select_related('id_recurso', 'agendamento_pai__id_usuario')
+    for agendamento in agendamentos:
+        fim = _fronteira(agendamento.data_inicio, agendamento.hora_fim)
+        fronteiras.append(fim)
+        itens.append({
+            'id_recurso': agendamento.id_recurso_id,
+            'recurso': agendamento.id_recurso.nome_recurso,
+            'localizacao': agendamento.id_recurso.localizacao,
+            'tipo': 'agendamento',
+            'usuario': agendamento.agendamento_pai.id_usuario.nome,
+            'finalidade': agendamento.agendamento_pai.finalidade,
+            'inicio': _fronteira(agendamento.data_inicio, agendamento.hora_inicio),
+            'fim': fim,
+        })
+
+    # Próximo aprovado a começar hoje; usos imediatos começam com uma gravação
+    proximo_inicio = Agendamento.objects.filter(
+        status_agendamento=StatusAgendamento.APROVADO,
+        data_inicio=agora.date(),
+        hora_inicio__gt=agora.time()
+    ).aggregate(Min('hora_inicio'))['hora_inicio__min']
+    if proximo_inicio is not None:
+        fronteiras.append(_fronteira(agora.date(), proximo_inicio))
+
+    itens.sort(key=lambda item: (item['recurso'], item['id_recurso'], item['inicio']))
+    return itens, min(fronteiras)
+
+
+def quadro_de_ocupacao(agora=None):
+    """
+    Lista os usos imediatos e agendamentos aprovados em andamento em `agora`,
+    com o recurso, quem o usa e até quando. Lido do cache enquanto nenhuma
+    fronteira de horário passou e nenhuma gravação avançou a versão global.
+    """
+    agora = timezone.localtime(agora)
+    if not respostas_em_cache():
+        return _montar_quadro(agora)[0]
+    chave = f'ocupacao:quadro:{versao_global()}'
+
+    em_cache = cache.get(chave)
+    if em_cache is not None:
+        calculado_em, valido_ate, itens = em_cache
+        if calculado_em <= agora < valido_ate:
+            return itens
+
+    itens, valido_ate = _montar_quadro(agora)
+    segundos = min(TTL_RESPOSTA, (valido_ate - agora).total_seconds())
+    if segundos >= 1:
+        cache.set(chave, (agora, valido_ate, itens), int(segundos))
+    return itens
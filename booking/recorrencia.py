@@ -0,0 +1,74 @@
+"""
+Regras de recorrência semanais das solicitações de agendamento.
+
+Uma regra é um dict com:
+    data_inicio  -- primeira data possível da série
+    hora_inicio / hora_fim -- horário de cada ocorrência
+    dias_semana  -- dias da semana (0 = segunda ... 6 = domingo)
+    intervalo    -- repete a cada N semanas (padrão 1)
+    ate          -- última data possível (opcional)
+    quantidade   -- número máximo de ocorrências (opcional)
+    excecoes     -- datas a pular; como no EXDATE do iCalendar, contam para
+                    a `quantidade`
+
+É guardada em AgendamentoPai.regra_recorrencia no formato JSON (datas e
+horários como texto ISO).
+"""
+from datetime import date, time, timedelta
+
+# Limite de ocorrências expandidas de uma única solicitação
+LIMITE_OCORRENCIAS = 1000
+
+
+def expandir_regra(regra, desde=None, ate=None):
+    """
+    Gera, em ordem, as datas das ocorrências da regra.
+
+    `desde` e `ate` restringem a janela gerada. Sem `ate` e sem limite na
+    própria regra o gerador é infinito.
+    """
+    inicio = regra['data_inicio']
+    dias = sorted(set(regra['dias_semana']))
+    intervalo = regra.get('intervalo') or 1
+    quantidade = regra.get('quantidade')
+    excecoes = set(regra.get('excecoes') or ())
+
+    limite = regra.get('ate')
+    if ate is not None:
+        limite = ate if limite is None else min(limite, ate)
+
+    semana = inicio - timedelta(days=inicio.weekday())
+    if desde is not None and quantidade is None and desde > semana:
+        # Sem contagem a respeitar, salta direto para a semana da série que contém `desde`
+        saltos = (desde - semana).days // (7 * intervalo)
+        semana += timedelta(weeks=saltos * intervalo)
+
+    geradas = 0
+    while True:
+        for dia in dias:
+            data = semana + timedelta(days=dia)
+            if data < inicio:
+                continue
+            if limite is not None and data > limite:
+                return
+            if quantidade is not None and geradas >= quantidade:
+                return
+            geradas += 1
+            if data in excecoes or (desde is not None and data < desde):
+                continue
+            yield data
+        semana += timedelta(weeks=intervalo)
+
+
+def regra_de_json(dados):
+    """Converte a regra gravada em JSON de volta para datas e horários."""
+    return {
+        'data_inicio': date.fromisoformat(dados['data_inicio']),
+        'hora_inicio': time.fromisoformat(dados['hora_inicio']),
+        'hora_fim': time.fromisoformat(dados['hora_fim']),
+        'dias_semana': dados['dias_semana'],
+        'intervalo': dados.get('intervalo') or 1,
+        'ate': date.fromisoformat(dados['ate']) if dados.get('ate') else None,
+        'quantidade': dados.get('quantidade'),
+        'excecoes': [date.fromisoformat(d) for d in dados.get('excecoes') or []],
+    }
@@ -1,8 +1,36 @@
+from datetime import timedelta
+from itertools import islice
+
+from django.db import transaction
 from rest_framework import serializers
-from .models import Agendamento, AgendamentoPai, UsoImediato
+from rest_framework.settings import api_settings
+from .models import Agendamento, AgendamentoPai, StatusAgendamento, UsoImediato
+from .cache import invalidar_recursos
+from .conflitos import conflitos_por_intervalo, primeira_sobreposicao, primeiro_conflito
+from .expiracao import status_efetivo
+from .locks import travar_recursos
+from .recorrencia import LIMITE_OCORRENCIAS, expandir_regra
+from .series import horizonte
+
+
+class StatusEfetivoField(serializers.Field):
+    """
+    Exibe o status_agendamento já considerando a expiração, sem depender de
+    o comando expirar_agendamentos ter gravado o novo status.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, agendamento):
+        return status_efetivo(agendamento)
 
 
 class AgendamentoFilhoSerializer(serializers.ModelSerializer):
+    status_agendamento = StatusEfetivoField()
+
     class Meta:
         model = Agendamento
         fields = [
@@ -33,34 +61,144 @@ class AgendamentoFilhoInputSerializer(serializers.Serializer):
         return data
 
 
+class RegraRecorrenciaSerializer(serializers.Serializer):
+    """Serializer da regra de recorrência semanal (ver booking.recorrencia)."""
+    data_inicio = serializers.DateField()
+    hora_inicio = serializers.TimeField()
+    hora_fim = serializers.TimeField()
+    dias_semana = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6), min_length=1, max_length=7
+    )
+    intervalo = serializers.IntegerField(min_value=1, max_value=52, default=1)
+    ate = serializers.DateField(required=False, allow_null=True, default=None)
+    quantidade = serializers.IntegerField(min_value=1, required=False, allow_null=True, default=None)
+    excecoes = serializers.ListField(child=serializers.DateField(), required=False, default=list)
+
+    def validate(self, data):
+        if data['hora_fim'] <= data['hora_inicio']:
+            raise serializers.ValidationError(
+                f"hora_fim ({data['hora_fim']}) deve ser posterior a hora_inicio ({data['hora_inicio']})."
+            )
+        if data['ate'] is not None and data['ate'] < data['data_inicio']:
+            raise serializers.ValidationError(
+                f"ate ({data['ate']}) não pode ser anterior a data_inicio ({data['data_inicio']})."
+            )
+        return data
+
+
+class AgendamentoCriadoSerializer(AgendamentoFilhoSerializer):
+    """Filho recém-criado, indicando se o horário já estava aprovado para outro agendamento."""
+    conflito = serializers.SerializerMethodField()
+
+    class Meta(AgendamentoFilhoSerializer.Meta):
+        fields = AgendamentoFilhoSerializer.Meta.fields + ['conflito']
+
+    def get_conflito(self, obj):
+        return getattr(obj, 'conflito', False)
+
+
+def _mensagem_conflito(agendamento_data):
+    return (
+        f"Conflito de horário no dia {agendamento_data['data_inicio'].strftime('%d/%m/%Y')} "
+        f"entre {agendamento_data['hora_inicio'].strftime('%H:%M')} e {agendamento_data['hora_fim'].strftime('%H:%M')}."
+    )
+
+
+TAMANHO_LOTE_CRIACAO = 500
+
+
 class AgendamentoPaiCreateSerializer(serializers.ModelSerializer):
     datas_agendamento = serializers.ListField(
-        child=AgendamentoFilhoInputSerializer(), write_only=True, min_length=1
+        child=AgendamentoFilhoInputSerializer(), write_only=True, min_length=1, required=False
     )
+    recorrencia = RegraRecorrenciaSerializer(write_only=True, required=False)
+    # Modo estrito: recusa a solicitação se algum horário já estiver aprovado para outro agendamento
+    estrito = serializers.BooleanField(write_only=True, required=False, default=False)
+    agendamentos_filhos = serializers.SerializerMethodField()
 
     class Meta:
         model = AgendamentoPai
         fields = [
             'id_agendamento_pai', 'id_recurso', 'finalidade', 'observacoes',
             'software_necessario', 'id_responsavel', 'id_usuario', 'data_criacao',
-            'datas_agendamento',
+            'datas_agendamento', 'recorrencia', 'estrito', 'regra_recorrencia', 'materializado_ate', 'status_serie',
+            'agendamentos_filhos',
         ]
-        read_only_fields = ('id_usuario', 'data_criacao')
+        read_only_fields = ('id_usuario', 'data_criacao', 'regra_recorrencia', 'materializado_ate', 'status_serie')
+
+    def validate(self, data):
+        regra = data.pop('recorrencia', None)
+        if ('datas_agendamento' in data) == (regra is not None):
+            raise serializers.ValidationError("Informe 'datas_agendamento' ou 'recorrencia' (apenas um deles).")
+
+        if regra is not None:
+            # Expande a regra no servidor: as ocorrências já nascem válidas, sem validação item a item.
+            # Só o trecho até o horizonte é gravado; o restante fica na regra (ver booking.series)
+            limite = horizonte()
+            datas = list(islice(expandir_regra(regra, ate=limite), LIMITE_OCORRENCIAS + 1))
+            parcial = next(expandir_regra(regra, desde=limite + timedelta(days=1)), None) is not None
+            if not datas and not parcial:
+                raise serializers.ValidationError({'recorrencia': 'A regra não gera nenhuma ocorrência.'})
+            if len(datas) > LIMITE_OCORRENCIAS:
+                raise serializers.ValidationError(
+                    {'recorrencia': f'A regra gera mais de {LIMITE_OCORRENCIAS} ocorrências.'}
+                )
+            data['datas_agendamento'] = [
+                {
+                    'data_inicio': dia, 'hora_inicio': regra['hora_inicio'],
+                    'data_fim': dia, 'hora_fim': regra['hora_fim'],
+                }
+                for dia in datas
+            ]
+            data['regra_recorrencia'] = dict(RegraRecorrenciaSerializer(regra).data)
+            if parcial:
+                data['materializado_ate'] = limite
+                data['status_serie'] = StatusAgendamento.PENDENTE
+
+        # Confere todas as datas contra os horários já aprovados em uma única passada
+        estrito = data.pop('estrito', False)
+        conflitos = conflitos_por_intervalo(data['id_recurso'].pk, data['datas_agendamento'])
+        for agendamento_data, conflito in zip(data['datas_agendamento'], conflitos):
+            if conflito is not None and estrito:
+                raise serializers.ValidationError(_mensagem_conflito(agendamento_data))
+            agendamento_data['conflito'] = conflito is not None
+        return data
 
     def create(self, validated_data):
         datas_agendamento = validated_data.pop('datas_agendamento')
-        agendamento_pai = AgendamentoPai.objects.create(**validated_data)
-        for data in datas_agendamento:
-            Agendamento.objects.create(
-                agendamento_pai=agendamento_pai,
-                data_inicio=data['data_inicio'],
-                hora_inicio=data['hora_inicio'],
-                data_fim=data['data_fim'],
-                hora_fim=data['hora_fim'],
-                status_agendamento='pendente'
+        datas_agendamento.sort(key=lambda data: (data['data_inicio'], data['hora_inicio']))
+
+        with transaction.atomic():
+            agendamento_pai = AgendamentoPai.objects.create(**validated_data)
+            # bulk_create não chama save(), então o recurso desnormalizado é preenchido aqui
+            filhos = Agendamento.objects.bulk_create(
+                [
+                    Agendamento(
+                        agendamento_pai=agendamento_pai,
+                        id_recurso_id=agendamento_pai.id_recurso_id,
+                        data_inicio=data['data_inicio'],
+                        hora_inicio=data['hora_inicio'],
+                        data_fim=data['data_fim'],
+                        hora_fim=data['hora_fim'],
+                        status_agendamento='pendente'
+                    )
+                    for data in datas_agendamento
+                ],
+                batch_size=TAMANHO_LOTE_CRIACAO
             )
+        for filho, data in zip(filhos, datas_agendamento):
+            filho.conflito = data.get('conflito', False)
+
+        # Guardados para a resposta e para o e-mail aos admins, sem recarregá-los
+        self.filhos_criados = filhos
         return agendamento_pai
 
+    def get_agendamentos_filhos(self, obj):
+        filhos = getattr(self, 'filhos_criados', None)
+        if filhos is None:
+            filhos = obj.agendamentos_filhos.order_by('data_inicio', 'hora_inicio')
+        return AgendamentoCriadoSerializer(filhos, many=True).data
+
 class AgendamentoPaiDetailSerializer(serializers.ModelSerializer):
     agendamentos_filhos = AgendamentoFilhoSerializer(many=True, read_only=True)
     recurso = serializers.CharField(source='id_recurso.nome_recurso', read_only=True)
@@ -70,12 +208,14 @@ class AgendamentoPaiDetailSerializer(serializers.ModelSerializer):
         model = AgendamentoPai
         fields = [
             'id_agendamento_pai', 'recurso', 'finalidade', 'observacoes',
-            'software_necessario', 'responsavel', 'data_criacao', 'agendamentos_filhos'
+            'software_necessario', 'responsavel', 'data_criacao', 'regra_recorrencia',
+            'materializado_ate', 'status_serie', 'agendamentos_filhos'
         ]
 
 
 # Serializers do ADM
 class AdminAgendamentoSerializer(serializers.ModelSerializer):
+    status_agendamento = StatusEfetivoField()
     gerenciado_por_nome = serializers.CharField(source='gerenciado_por.nome', read_only=True, allow_null=True)
     class Meta:
         model = Agendamento
@@ -94,13 +234,19 @@ class AdminAgendamentoPaiSerializer(serializers.ModelSerializer):
         model = AgendamentoPai
         fields = [
             'id_agendamento_pai', 'recurso', 'finalidade', 'observacoes',
-            'software_necessario', 'solicitante', 'data_criacao',
-            'agendamentos_filhos', 'id_responsavel', 'gerenciado_info'
+            'software_necessario', 'solicitante', 'data_criacao', 'regra_recorrencia',
+            'materializado_ate', 'status_serie', 'agendamentos_filhos', 'id_responsavel', 'gerenciado_info'
         ]
 
     def get_gerenciado_info(self, obj):
-        # Pega o agendamento filho que foi atualizado mais recentemente
-        last_updated_child = obj.agendamentos_filhos.order_by('-data_ultima_atualizacao').first()
+        # Pega o agendamento filho que foi atualizado mais recentemente. Nas listagens
+        # os filhos já vêm do prefetch (com gerenciado_por) e a escolha é feita em memória
+        if 'agendamentos_filhos' in getattr(obj, '_prefetched_objects_cache', {}):
+            last_updated_child = max(
+                obj.agendamentos_filhos.all(), key=lambda filho: filho.data_ultima_atualizacao, default=None
+            )
+        else:
+            last_updated_child = obj.agendamentos_filhos.select_related('gerenciado_por').order_by('-data_ultima_atualizacao').first()
         if last_updated_child and last_updated_child.gerenciado_por:
             return {
                 'nome': last_updated_child.gerenciado_por.nome,
@@ -146,58 +292,108 @@ class AdminAgendamentoPaiUpdateSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         agendamentos_data = data.get('agendamentos_filhos', [])
-        recurso = self.instance.id_recurso
-        agendamento_pai_id = self.instance.id_agendamento_pai
-
-        for agendamento_data in agendamentos_data:
-            data_inicio = agendamento_data.get('data_inicio')
-            hora_inicio = agendamento_data.get('hora_inicio')
-            hora_fim = agendamento_data.get('hora_fim')
-            agendamento_id = agendamento_data.get('id_agendamento')
-
-            conflitos = Agendamento.objects.filter(
-                agendamento_pai__id_recurso=recurso,
-                data_inicio=data_inicio,
-                hora_inicio__lt=hora_fim,
-                hora_fim__gt=hora_inicio,
-                status_agendamento='aprovado'
-            )
 
-            if agendamento_id:
-                conflitos = conflitos.exclude(id_agendamento=agendamento_id)
-
-            if conflitos.exists():
-                raise serializers.ValidationError(
-                    f"Conflito de horário no dia {data_inicio.strftime('%d/%m/%Y')} entre {hora_inicio.strftime('%H:%M')} e {hora_fim.strftime('%H:%M')}."
-                )
+        sobreposicao = primeira_sobreposicao(agendamentos_data)
+        if sobreposicao:
+            anterior, atual = sobreposicao
+            raise serializers.ValidationError(
+                f"Os horários do dia {atual['data_inicio'].strftime('%d/%m/%Y')} se sobrepõem: "
+                f"{anterior['hora_inicio'].strftime('%H:%M')}-{anterior['hora_fim'].strftime('%H:%M')} e "
+                f"{atual['hora_inicio'].strftime('%H:%M')}-{atual['hora_fim'].strftime('%H:%M')}."
+            )
         return data
 
+    def _conferir_conflitos(self, instance, agendamentos_data):
+        """Confere os horários contra os aprovados de outros pedidos; chamado sob a trava do recurso."""
+        # Depois da edição os filhos do pai são exatamente os do payload, então suas posições atuais não contam
+        ids_filhos = list(instance.agendamentos_filhos.values_list('id_agendamento', flat=True))
+        conflito = primeiro_conflito(
+            instance.id_recurso_id, agendamentos_data, excluir_ids=ids_filhos, excluir_pai=instance.pk
+        )
+        if conflito:
+            agendamento_data, _ = conflito
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [_mensagem_conflito(agendamento_data)]})
+
     def update(self, instance, validated_data):
-        from django.db import transaction
+        """
+        Aplica a diferença entre os filhos gravados e os do payload. O recurso
+        fica travado da conferência de conflitos à gravação, como nas
+        aprovações (ver booking.locks). Erros de integridade (restrição de
+        exclusão do PostgreSQL) são tratados pela view.
+        """
+        campos_horario = ['data_inicio', 'hora_inicio', 'data_fim', 'hora_fim']
+        children_data = validated_data.get('agendamentos_filhos', [])
+
         with transaction.atomic():
+            travar_recursos(instance.id_recurso_id)
+            self._conferir_conflitos(instance, children_data)
+
             instance.finalidade = validated_data.get('finalidade', instance.finalidade)
             instance.observacoes = validated_data.get('observacoes', instance.observacoes)
             instance.id_responsavel_id = validated_data.get('id_responsavel', instance.id_responsavel_id)
             instance.save()
 
-            children_data = validated_data.get('agendamentos_filhos', [])
-            
-            children_ids_from_payload = {item.get('id_agendamento') for item in children_data if item.get('id_agendamento')}
-
-            instance.agendamentos_filhos.exclude(id_agendamento__in=children_ids_from_payload).delete()
+            existentes = {
+                filho.pk: filho
+                for filho in instance.agendamentos_filhos.only(
+                    'id_agendamento', 'agendamento_pai', 'status_agendamento', *campos_horario
+                )
+            }
 
+            # Ids de outros pais são ignorados, como antes
+            alterados, novos, mantidos = [], [], set()
             for child_data in children_data:
                 child_id = child_data.get('id_agendamento')
-                child_data.pop('id_agendamento', None)
-
-                if child_id:
-                    Agendamento.objects.filter(id_agendamento=child_id, agendamento_pai=instance).update(**child_data)
-                else:
-                    Agendamento.objects.create(agendamento_pai=instance, status_agendamento='pendente', **child_data)
+                if not child_id:
+                    novos.append(Agendamento(
+                        agendamento_pai=instance,
+                        id_recurso_id=instance.id_recurso_id,
+                        status_agendamento=StatusAgendamento.PENDENTE,
+                        **{campo: child_data[campo] for campo in campos_horario}
+                    ))
+                    continue
+                filho = existentes.get(child_id)
+                if filho is None:
+                    continue
+                mantidos.add(child_id)
+                if any(getattr(filho, campo) != child_data[campo] for campo in campos_horario):
+                    for campo in campos_horario:
+                        setattr(filho, campo, child_data[campo])
+                    alterados.append(filho)
+
+            removidos = [pk for pk in existentes if pk not in mantidos]
+            if removidos:
+                Agendamento.objects.filter(pk__in=removidos).delete()
+            if alterados:
+                # A restrição de exclusão é conferida linha a linha: aprovados que trocam de
+                # horário entre si colidiriam no meio do UPDATE. Eles saem da restrição
+                # (como pendentes) durante a troca e voltam a aprovados no estado final.
+                aprovados = [filho.pk for filho in alterados if filho.status_agendamento == StatusAgendamento.APROVADO]
+                if aprovados:
+                    Agendamento.objects.filter(pk__in=aprovados).update(status_agendamento=StatusAgendamento.PENDENTE)
+                Agendamento.objects.bulk_update(alterados, campos_horario)
+                if aprovados:
+                    Agendamento.objects.filter(pk__in=aprovados).update(status_agendamento=StatusAgendamento.APROVADO)
+            if novos:
+                Agendamento.objects.bulk_create(novos)
+
+            invalidar_recursos(instance.id_recurso_id)
 
         return instance
 
 
+class DecisaoEmLoteSerializer(serializers.Serializer):
+    """Aprovação ou negação de várias solicitações e/ou horários de uma vez."""
+    status_agendamento = serializers.ChoiceField(choices=[StatusAgendamento.APROVADO, StatusAgendamento.NEGADO])
+    ids_agendamento_pai = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=1000)
+    ids_agendamento = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=5000)
+
+    def validate(self, data):
+        if not data['ids_agendamento_pai'] and not data['ids_agendamento']:
+            raise serializers.ValidationError("Informe 'ids_agendamento_pai' e/ou 'ids_agendamento'.")
+        return data
+
+
 class UsoImediatoSerializer(serializers.ModelSerializer):
     recurso_nome = serializers.CharField(source='id_recurso.nome_recurso', read_only=True)
     usuario_nome = serializers.CharField(source='id_usuario.nome', read_only=True)
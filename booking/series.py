@@ -0,0 +1,160 @@
+"""
+Materialização parcial de séries recorrentes longas.
+
+Uma série que se estende além do horizonte (HORIZONTE_SEMANAS a partir de
+hoje) grava em Agendamento apenas as ocorrências até o horizonte; o restante é
+descrito pela regra em AgendamentoPai.regra_recorrencia. Nesses pais:
+
+    materializado_ate -- última data já gravada (nula quando a série está completa)
+    status_serie      -- status das ocorrências ainda não gravadas
+
+As verificações de conflito e a disponibilidade do recurso consultam as
+ocorrências não gravadas de séries aprovadas a partir da própria regra
+(`ocorrencias_virtuais`). O comando `python manage.py materializar_series`
+avança o horizonte periodicamente.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .cache import invalidar_recursos
+from .locks import travar_recursos
+from .models import Agendamento, AgendamentoPai, StatusAgendamento
+from .recorrencia import expandir_regra, regra_de_json
+
+logger = logging.getLogger(__name__)
+
+HORIZONTE_SEMANAS = 8
+
+# Até onde as ocorrências não gravadas de uma série são conferidas ao aprová-la
+JANELA_VERIFICACAO_SEMANAS = 52
+
+# Status de série que ainda recebem novas ocorrências
+STATUS_SERIE_ATIVA = (StatusAgendamento.PENDENTE, StatusAgendamento.APROVADO)
+
+
+def horizonte(hoje=None):
+    """Última data materializada de uma série longa."""
+    return (hoje or timezone.localdate()) + timedelta(weeks=HORIZONTE_SEMANAS)
+
+
+def _ocorrencias(pai, regra, desde, ate, status):
+    return [
+        Agendamento(
+            agendamento_pai=pai,
+            id_recurso_id=pai.id_recurso_id,
+            data_inicio=dia,
+            hora_inicio=regra['hora_inicio'],
+            data_fim=dia,
+            hora_fim=regra['hora_fim'],
+            status_agendamento=status
+        )
+        for dia in expandir_regra(regra, desde=desde, ate=ate)
+    ]
+
+
+def ocorrencias_futuras(pai, ate):
+    """Ocorrências ainda não gravadas da série até `ate`, como instâncias não salvas."""
+    if pai.materializado_ate is None or pai.materializado_ate >= ate:
+        return []
+    regra = regra_de_json(pai.regra_recorrencia)
+    return _ocorrencias(pai, regra, pai.materializado_ate + timedelta(days=1), ate, pai.status_serie)
+
+
+def _series_aprovadas(fim):
+    return AgendamentoPai.objects.filter(status_serie=StatusAgendamento.APROVADO, materializado_ate__lt=fim)
+
+
+def _expandir_series(series, inicio, fim):
+    ocorrencias = []
+    for pai in series:
+        regra = regra_de_json(pai.regra_recorrencia)
+        desde = max(inicio, pai.materializado_ate + timedelta(days=1))
+        ocorrencias.extend(_ocorrencias(pai, regra, desde, fim, StatusAgendamento.APROVADO))
+    return ocorrencias
+
+
+def ocorrencias_virtuais(recurso, inicio, fim, excluir_pai=None):
+    """
+    Ocorrências ainda não gravadas das séries aprovadas do recurso entre
+    `inicio` e `fim`, como instâncias de Agendamento não salvas.
+    """
+    series = _series_aprovadas(fim).filter(id_recurso=recurso)
+    if excluir_pai is not None:
+        series = series.exclude(pk=excluir_pai)
+    return _expandir_series(series, inicio, fim)
+
+
+def ocorrencias_virtuais_dos_recursos(recursos, inicio, fim):
+    """Como `ocorrencias_virtuais`, para vários recursos em uma única consulta."""
+    return _expandir_series(_series_aprovadas(fim).filter(id_recurso__in=recursos), inicio, fim)
+
+
+def conflito_da_serie(pai, hoje=None):
+    """
+    Confere as ocorrências não gravadas da série contra os horários aprovados
+    do recurso, até JANELA_VERIFICACAO_SEMANAS à frente. Retorna a tupla
+    (ocorrência, agendamento) do primeiro conflito, ou None.
+    """
+    from .conflitos import primeiro_conflito
+
+    limite = (hoje or timezone.localdate()) + timedelta(weeks=JANELA_VERIFICACAO_SEMANAS)
+    ocorrencias = ocorrencias_futuras(pai, limite)
+    if not ocorrencias:
+        return None
+    return primeiro_conflito(pai.id_recurso_id, ocorrencias, excluir_pai=pai.pk)
+
+
+def materializar_serie(pai, hoje=None):
+    """
+    Grava as ocorrências da série até o horizonte atual. Ocorrências de uma
+    série aprovada que colidem com um horário já aprovado são gravadas como
+    pendentes, para análise do administrador. Retorna quantas foram gravadas.
+
+    O recurso fica travado da conferência à gravação, como nas aprovações
+    (ver booking.locks).
+    """
+    from .conflitos import IndiceIntervalos, aprovados_na_janela
+
+    limite = horizonte(hoje)
+    with transaction.atomic():
+        travar_recursos(pai.id_recurso_id)
+        # Relido sob a trava: a série pode ter sido decidida ou avançada nesse meio tempo
+        pai.refresh_from_db(fields=['status_serie', 'materializado_ate'])
+        if pai.status_serie not in STATUS_SERIE_ATIVA:
+            return 0
+        novas = ocorrencias_futuras(pai, limite)
+
+        if novas and pai.status_serie == StatusAgendamento.APROVADO:
+            ocupados = IndiceIntervalos(aprovados_na_janela(pai.id_recurso_id, novas, excluir_pai=pai.pk))
+            for ocorrencia in novas:
+                if ocupados.buscar(ocorrencia.data_inicio, ocorrencia.hora_inicio, ocorrencia.hora_fim):
+                    ocorrencia.status_agendamento = StatusAgendamento.PENDENTE
+
+        regra = regra_de_json(pai.regra_recorrencia)
+        completa = next(expandir_regra(regra, desde=limite + timedelta(days=1)), None) is None
+        pai.materializado_ate = None if completa else limite
+
+        Agendamento.objects.bulk_create(novas)
+        # update() em vez de save(): o recurso não muda e save() propagaria aos filhos
+        AgendamentoPai.objects.filter(pk=pai.pk).update(materializado_ate=pai.materializado_ate)
+        invalidar_recursos(pai.id_recurso_id)
+    return len(novas)
+
+
+def materializar_series(hoje=None):
+    """Avança o horizonte de todas as séries ativas. Retorna o total de ocorrências gravadas."""
+    series = AgendamentoPai.objects.filter(
+        materializado_ate__lt=horizonte(hoje),
+        status_serie__in=STATUS_SERIE_ATIVA
+    )
+    total = 0
+    for pai in series.iterator():
+        try:
+            total += materializar_serie(pai, hoje)
+        except IntegrityError:
+            # Restrição de exclusão do PostgreSQL: a série fica para a próxima execução, sem parar as demais
+            logger.exception('Falha ao materializar a série %s', pai.pk)
+    return total
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidar_recursos
+from .expiracao import registrar_expiracao
+from .models import Agendamento, AgendamentoPai, UsoImediato
+from resources.models import Recurso
+
+
+@receiver([post_save, post_delete], sender=Agendamento)
+def _invalidar_agendamento(sender, instance, **kwargs):
+    invalidar_recursos(instance.id_recurso_id)
+
+
+@receiver([post_save, post_delete], sender=AgendamentoPai)
+def _invalidar_agendamento_pai(sender, instance, **kwargs):
+    # A série (status_serie / regra) também gera horários aprovados
+    invalidar_recursos(instance.id_recurso_id)
+
+
+@receiver([post_save, post_delete], sender=UsoImediato)
+def _invalidar_uso_imediato(sender, instance, **kwargs):
+    # Usos imediatos entram no quadro de ocupação (ver booking.ocupacao)
+    invalidar_recursos(instance.id_recurso_id)
+
+
+@receiver([post_save, post_delete], sender=Recurso)
+def _invalidar_recurso(sender, instance, **kwargs):
+    invalidar_recursos(instance.pk)
+
+
+@receiver(post_save, sender=UsoImediato)
+def _registrar_expiracao_uso(sender, instance, **kwargs):
+    # Um uso que vence antes da próxima verificação a antecipa
+    if instance.ativo:
+        registrar_expiracao(instance.expira_em)
@@ -1,3 +1,4 @@
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from unittest.mock import patch
@@ -18,6 +19,17 @@ class BookingAPITestCase(BaseTestCase):
         self.agendamento_pendente = Agendamento.objects.create(agendamento_pai=self.agendamento_pai, data_inicio=date(2025, 10, 1), hora_inicio=time(10, 0), data_fim=date(2025, 10, 1), hora_fim=time(12, 0), status_agendamento='pendente')
         self.agendamento_aprovado = Agendamento.objects.create(agendamento_pai=self.agendamento_pai, data_inicio=date(2025, 10, 2), hora_inicio=time(14, 0), data_fim=date(2025, 10, 2), hora_fim=time(16, 0), status_agendamento='aprovado')
 
+    def _levar_ao_futuro(self):
+        """
+        Move os agendamentos do setUp para o mesmo dia do ano seguinte ao atual
+        (só se aprova horário que não passou). O pendente fica em `self.futuro`
+        e o aprovado no dia seguinte.
+        """
+        self.futuro = date(timezone.localdate().year + 1, 10, 1)
+        for agendamento in (self.agendamento_pendente, self.agendamento_aprovado):
+            agendamento.data_inicio = agendamento.data_fim = agendamento.data_inicio.replace(year=self.futuro.year)
+            agendamento.save()
+
     def test_criar_agendamento_como_servidor(self):
         self.client.force_authenticate(user=self.server_user)
         url = reverse('criar-agendamento')
@@ -29,6 +41,240 @@ class BookingAPITestCase(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(AgendamentoPai.objects.filter(finalidade="Nova Aula").exists())
 
+    @patch('booking.views.notificar_admins')
+    def test_criar_agendamento_indica_conflitos_com_aprovados(self, mock_notif):
+        self.client.force_authenticate(user=self.another_user)
+        data = {
+            "id_recurso": self.recurso.id_recurso, "id_responsavel": self.another_user.id_usuario,
+            "datas_agendamento": [
+                {"data_inicio": "2025-10-02", "hora_inicio": "15:00", "data_fim": "2025-10-02", "hora_fim": "17:00"},
+                {"data_inicio": "2025-10-03", "hora_inicio": "15:00", "data_fim": "2025-10-03", "hora_fim": "17:00"},
+            ]
+        }
+        response = self.client.post(reverse('criar-agendamento'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        conflitos = {filho['data_inicio']: filho['conflito'] for filho in response.data['agendamentos_filhos']}
+        self.assertEqual(conflitos, {'2025-10-02': True, '2025-10-03': False})
+
+        data['estrito'] = True
+        response = self.client.post(reverse('criar-agendamento'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(AgendamentoPai.objects.filter(id_usuario=self.another_user).count(), 1)
+
+    @patch('booking.views.notificar_admins')
+    def test_criar_agendamento_em_lote_com_consultas_constantes(self, mock_notif):
+        """O número de consultas da criação não depende da quantidade de datas."""
+        self.client.force_authenticate(user=self.server_user)
+        url = reverse('criar-agendamento')
+
+        def payload(quantidade):
+            datas = [date(2026, 3, 2) + timedelta(days=i) for i in range(quantidade)]
+            return {
+                "id_recurso": self.recurso.id_recurso, "finalidade": "Série", "id_responsavel": self.server_user.id_usuario,
+                "datas_agendamento": [{"data_inicio": str(d), "hora_inicio": "10:00", "data_fim": str(d), "hora_fim": "12:00"} for d in datas]
+            }
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as poucas:
+            self.client.post(url, payload(2), format='json')
+        with CaptureQueriesContext(connection) as muitas:
+            response = self.client.post(url, payload(100), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(muitas), len(poucas))
+        pai = AgendamentoPai.objects.get(pk=response.data['id_agendamento_pai'])
+        self.assertEqual(pai.agendamentos_filhos.filter(id_recurso=self.recurso).count(), 100)
+
+    def test_email_apos_criacao_nao_recarrega_filhos(self):
+        from booking.serializers import AgendamentoPaiCreateSerializer
+        from notification.utils import _build_email_html
+        serializer = AgendamentoPaiCreateSerializer(data={
+            "id_recurso": self.recurso.id_recurso, "finalidade": "Aula", "id_responsavel": self.server_user.id_usuario,
+            "datas_agendamento": [{"data_inicio": "2026-03-02", "hora_inicio": "10:00", "data_fim": "2026-03-02", "hora_fim": "12:00"}]
+        })
+        serializer.is_valid(raise_exception=True)
+        pai = serializer.save(id_usuario=self.server_user)
+        with self.assertNumQueries(0):
+            html = _build_email_html(pai, 'Nova solicitação', filhos=serializer.filhos_criados)
+        self.assertIn('02/03/2026', html)
+        self.assertEqual(serializer.data['agendamentos_filhos'][0]['data_inicio'], '2026-03-02')
+
+    @patch('booking.views.notificar_admins')
+    def test_criar_agendamento_com_recorrencia(self, mock_notif):
+        self.client.force_authenticate(user=self.server_user)
+        url = reverse('criar-agendamento')
+        data = {
+            "id_recurso": self.recurso.id_recurso, "finalidade": "Disciplina", "id_responsavel": self.server_user.id_usuario,
+            "recorrencia": {
+                "data_inicio": "2026-03-02", "hora_inicio": "08:00", "hora_fim": "10:00",
+                "dias_semana": [0, 2], "ate": "2026-03-31", "excecoes": ["2026-03-04"]
+            }
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        pai = AgendamentoPai.objects.get(pk=response.data['id_agendamento_pai'])
+        datas = list(pai.agendamentos_filhos.order_by('data_inicio').values_list('data_inicio', flat=True))
+        # Segundas e quartas de março/2026, sem 04/03
+        self.assertEqual(len(datas), 8)
+        self.assertNotIn(date(2026, 3, 4), datas)
+        self.assertEqual(pai.regra_recorrencia['dias_semana'], [0, 2])
+
+    @patch('booking.views.notificar_admins')
+    def test_serie_sem_limite_materializa_apenas_o_horizonte(self, mock_notif):
+        from booking.series import horizonte
+        self.client.force_authenticate(user=self.server_user)
+        segunda = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())
+        data = {
+            "id_recurso": self.recurso.id_recurso, "id_responsavel": self.server_user.id_usuario,
+            "recorrencia": {"data_inicio": segunda.isoformat(), "hora_inicio": "08:00", "hora_fim": "10:00", "dias_semana": [0]}
+        }
+        response = self.client.post(reverse('criar-agendamento'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        pai = AgendamentoPai.objects.get(pk=response.data['id_agendamento_pai'])
+        self.assertEqual(pai.materializado_ate, horizonte())
+        self.assertEqual(pai.status_serie, 'pendente')
+        self.assertEqual(pai.agendamentos_filhos.count(), (horizonte() - segunda).days // 7 + 1)
+
+    @patch('booking.views.notificar_admins')
+    def test_materializar_series_segue_apos_falha_em_uma_serie(self, mock_notif):
+        from django.db import IntegrityError
+        from booking.series import horizonte, materializar_series
+        self.client.force_authenticate(user=self.server_user)
+        segunda = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())
+        recorrencia = {"data_inicio": segunda.isoformat(), "hora_inicio": "08:00", "hora_fim": "10:00", "dias_semana": [0]}
+        data = {"id_recurso": self.recurso.id_recurso, "id_responsavel": self.server_user.id_usuario, "recorrencia": recorrencia}
+        ids = [
+            self.client.post(reverse('criar-agendamento'), {**data, "recorrencia": {**recorrencia, "hora_inicio": inicio, "hora_fim": fim}}, format='json').data['id_agendamento_pai']
+            for inicio, fim in (("08:00", "10:00"), ("14:00", "16:00"))
+        ]
+        bulk_create = Agendamento.objects.bulk_create
+        chamadas = []
+
+        def falha_na_primeira(objetos, *args, **kwargs):
+            chamadas.append(objetos)
+            if len(chamadas) == 1:
+                raise IntegrityError('agendamento_aprovado_sem_sobreposicao')
+            return bulk_create(objetos, *args, **kwargs)
+
+        hoje = timezone.localdate() + timedelta(weeks=2)
+        with patch.object(Agendamento.objects, 'bulk_create', side_effect=falha_na_primeira), \
+                patch('booking.series.travar_recursos') as mock_trava, \
+                self.assertLogs('booking.series', 'ERROR'):
+            self.assertEqual(materializar_series(hoje=hoje), 2)
+        mock_trava.assert_called_with(self.recurso.id_recurso)
+
+        avancadas = AgendamentoPai.objects.filter(pk__in=ids, materializado_ate=horizonte(hoje))
+        self.assertEqual(avancadas.count(), 1)
+
+    @patch('booking.views.criar_e_enviar_notificacao')
+    @patch('booking.views.notificar_admins')
+    def test_serie_aprovada_responde_conflitos_e_disponibilidade_pela_regra(self, mock_notif, mock_email):
+        from booking.series import horizonte, materializar_series
+        self.client.force_authenticate(user=self.server_user)
+        segunda = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())
+        data = {
+            "id_recurso": self.recurso.id_recurso, "id_responsavel": self.server_user.id_usuario,
+            "recorrencia": {"data_inicio": segunda.isoformat(), "hora_inicio": "08:00", "hora_fim": "10:00", "dias_semana": [0]}
+        }
+        pai_id = self.client.post(reverse('criar-agendamento'), data, format='json').data['id_agendamento_pai']
+
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('admin-gerenciar-agendamento-pai', kwargs={'id_agendamento_pai': pai_id})
+        response = self.client.put(url, {'status_agendamento': 'aprovado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(AgendamentoPai.objects.get(pk=pai_id).status_serie, 'aprovado')
+
+        # Ocorrência ainda não gravada, além do horizonte
+        futura = segunda + timedelta(weeks=20)
+        self.assertGreater(futura, horizonte())
+        self.assertFalse(Agendamento.objects.filter(data_inicio=futura).exists())
+
+        outro_pai = AgendamentoPai.objects.create(id_usuario=self.another_user, id_recurso=self.recurso, id_responsavel=self.another_user)
+        pendente = Agendamento.objects.create(agendamento_pai=outro_pai, data_inicio=futura, hora_inicio=time(9, 0), data_fim=futura, hora_fim=time(11, 0), status_agendamento='pendente')
+        url = reverse('admin-atualizar-status-agendamento', kwargs={'id_agendamento': pendente.id_agendamento})
+        response = self.client.patch(url, {'status_agendamento': 'aprovado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        url = reverse('recurso-disponibilidade', kwargs={'recurso_id': self.recurso.id_recurso})
+        response = self.client.get(url, {'ano': futura.year, 'mes': futura.month})
+        self.assertIn({'start': '08:00', 'end': '10:00'}, response.data[futura.isoformat()])
+
+        # O avanço do horizonte grava as novas ocorrências já aprovadas
+        materializar_series(hoje=futura - timedelta(weeks=1))
+        self.assertTrue(Agendamento.objects.filter(agendamento_pai_id=pai_id, data_inicio=futura, status_agendamento='aprovado').exists())
+
+    @override_settings(EMAIL_HOST_USER='')
+    @patch('booking.views.notificar_admins')
+    def test_lote_deixa_de_fora_serie_com_conflito_e_notifica(self, mock_notif):
+        from notification.models import Notificacao
+        self.client.force_authenticate(user=self.server_user)
+        segunda = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())
+        data = {
+            "id_recurso": self.recurso.id_recurso, "id_responsavel": self.server_user.id_usuario,
+            "recorrencia": {"data_inicio": segunda.isoformat(), "hora_inicio": "08:00", "hora_fim": "10:00", "dias_semana": [0]}
+        }
+        com_conflito = self.client.post(reverse('criar-agendamento'), data, format='json').data['id_agendamento_pai']
+        sem_conflito = self.client.post(reverse('criar-agendamento'), {
+            **data, "recorrencia": {**data['recorrencia'], "hora_inicio": "14:00", "hora_fim": "16:00"}
+        }, format='json').data['id_agendamento_pai']
+
+        # Aprovado além do horizonte, colidindo só com a primeira série
+        futura = segunda + timedelta(weeks=20)
+        outro_pai = AgendamentoPai.objects.create(id_usuario=self.another_user, id_recurso=self.recurso, id_responsavel=self.another_user)
+        Agendamento.objects.create(agendamento_pai=outro_pai, data_inicio=futura, hora_inicio=time(9, 0), data_fim=futura, hora_fim=time(11, 0), status_agendamento='aprovado')
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.post(reverse('admin-decidir-agendamentos-lote'), {
+            'status_agendamento': 'aprovado', 'ids_agendamento_pai': [com_conflito, sem_conflito]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['series_com_conflito'], [com_conflito])
+
+        # Nada da série com conflito é aprovado; a outra é aprovada inteira
+        self.assertFalse(Agendamento.objects.filter(agendamento_pai_id=com_conflito).exclude(status_agendamento='pendente').exists())
+        self.assertEqual(AgendamentoPai.objects.get(pk=com_conflito).status_serie, 'pendente')
+        self.assertFalse(Agendamento.objects.filter(agendamento_pai_id=sem_conflito).exclude(status_agendamento='aprovado').exists())
+        self.assertEqual(AgendamentoPai.objects.get(pk=sem_conflito).status_serie, 'aprovado')
+
+        self.assertIn('conflito', Notificacao.objects.get(agendamento_pai_id=com_conflito).mensagem)
+        self.assertIn('ocorrências futuras aprovadas', Notificacao.objects.get(agendamento_pai_id=sem_conflito).mensagem)
+
+    @override_settings(EMAIL_HOST_USER='')
+    @patch('booking.views.notificar_admins')
+    def test_lote_confere_series_do_proprio_lote_alem_do_horizonte(self, mock_notif):
+        self.client.force_authenticate(user=self.server_user)
+        segunda = timezone.localdate() + timedelta(days=7 - timezone.localdate().weekday())
+        recorrencia = {"data_inicio": segunda.isoformat(), "hora_inicio": "08:00", "hora_fim": "10:00", "dias_semana": [0]}
+        data = {"id_recurso": self.recurso.id_recurso, "id_responsavel": self.server_user.id_usuario, "recorrencia": recorrencia}
+        primeira = self.client.post(reverse('criar-agendamento'), data, format='json').data['id_agendamento_pai']
+        # Mesmo horário, mas só a partir de depois do horizonte: nada gravado colide com a primeira
+        depois = segunda + timedelta(weeks=20)
+        segunda_serie = self.client.post(reverse('criar-agendamento'), {
+            **data, "recorrencia": {**recorrencia, "data_inicio": depois.isoformat(), "hora_inicio": "09:00", "hora_fim": "11:00"}
+        }, format='json').data['id_agendamento_pai']
+        # Horário avulso gravado além do horizonte, colidindo com as ocorrências da primeira série
+        avulso_pai = AgendamentoPai.objects.create(id_usuario=self.another_user, id_recurso=self.recurso, id_responsavel=self.another_user)
+        avulso = Agendamento.objects.create(agendamento_pai=avulso_pai, data_inicio=depois + timedelta(weeks=1), hora_inicio=time(7, 0), data_fim=depois + timedelta(weeks=1), hora_fim=time(9, 0))
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.post(reverse('admin-decidir-agendamentos-lote'), {
+            'status_agendamento': 'aprovado', 'ids_agendamento_pai': [primeira, segunda_serie, avulso_pai.pk]
+        }, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['series_com_conflito'], [segunda_serie])
+        self.assertEqual(AgendamentoPai.objects.get(pk=primeira).status_serie, 'aprovado')
+        self.assertEqual(AgendamentoPai.objects.get(pk=segunda_serie).status_serie, 'pendente')
+        avulso.refresh_from_db()
+        self.assertEqual(avulso.status_agendamento, 'negado')
+
+    def test_expandir_regra_com_intervalo_e_quantidade(self):
+        from booking.recorrencia import expandir_regra
+        regra = {'data_inicio': date(2026, 3, 4), 'dias_semana': [0, 2], 'intervalo': 2, 'quantidade': 4, 'excecoes': [date(2026, 3, 16)]}
+        # 04/03 (qua), 16/03 (seg, exceção mas conta), 18/03, 30/03
+        self.assertEqual(list(expandir_regra(regra)), [date(2026, 3, 4), date(2026, 3, 18), date(2026, 3, 30)])
+
     def test_criar_agendamento_sem_autenticacao(self):
         url = reverse('criar-agendamento')
         response = self.client.post(url, {}, format='json')
@@ -41,6 +287,61 @@ class BookingAPITestCase(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
 
+    def test_listar_minhas_reservas_paginado_por_cursor(self):
+        for i in range(4):
+            AgendamentoPai.objects.create(id_usuario=self.server_user, id_recurso=self.recurso, finalidade=f"Aula {i}", id_responsavel=self.server_user)
+        self.client.force_authenticate(user=self.server_user)
+        url = reverse('listar-agendamentos')
+
+        vistos = []
+        response = self.client.get(url, {'tamanho': 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            vistos.extend(item['id_agendamento_pai'] for item in response.data)
+            if 'rel="next"' not in response.get('Link', ''):
+                break
+            proxima = response['Link'].split('<', 1)[1].split('>', 1)[0]
+            response = self.client.get(proxima)
+
+        esperado = list(AgendamentoPai.objects.filter(id_usuario=self.server_user).order_by('-data_criacao', '-id_agendamento_pai').values_list('id_agendamento_pai', flat=True))
+        self.assertEqual(vistos, esperado)
+
+        # A última página aponta de volta para a anterior
+        anterior = [link for link in response['Link'].split(', ') if 'rel="prev"' in link][0]
+        response = self.client.get(anterior.split('<', 1)[1].split('>', 1)[0])
+        self.assertEqual([item['id_agendamento_pai'] for item in response.data], esperado[2:4])
+
+        response = self.client.get(url, {'cursor': 'invalido'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_listar_minhas_reservas_sem_tamanho_vem_inteira(self):
+        for i in range(4):
+            AgendamentoPai.objects.create(id_usuario=self.server_user, id_recurso=self.recurso, finalidade=f"Aula {i}", id_responsavel=self.server_user)
+        self.client.force_authenticate(user=self.server_user)
+        with patch('alocai.paginacao.PaginacaoPorChave.tamanho_pagina', 2):
+            response = self.client.get(reverse('listar-agendamentos'), HTTP_ORIGIN='http://localhost:3000')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 5)
+        # Sem paginação, a ordem continua a da chave: mais recentes primeiro
+        ids = [pai['id_agendamento_pai'] for pai in response.data]
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertNotIn('Link', response)
+        self.assertIn('Link', response['Access-Control-Expose-Headers'])
+
+    def test_admin_lista_agendamentos_com_consultas_constantes(self):
+        for i in range(5):
+            pai = AgendamentoPai.objects.create(id_usuario=self.another_user, id_recurso=self.recurso, finalidade=f"Aula {i}", id_responsavel=self.another_user)
+            Agendamento.objects.create(agendamento_pai=pai, data_inicio=date(2026, 3, 2 + i), hora_inicio=time(8, 0), data_fim=date(2026, 3, 2 + i), hora_fim=time(10, 0), status_agendamento='aprovado', gerenciado_por=self.admin_user)
+        self.client.force_authenticate(user=self.admin_user)
+
+        # Solicitações (com recurso e solicitante) + filhos (com gerenciado_por)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('admin-listar-agendamentos'))
+        self.assertEqual(len(response.data), 6)
+        gerenciados = [pai for pai in response.data if pai['gerenciado_info']]
+        self.assertEqual(len(gerenciados), 5)
+        self.assertEqual(gerenciados[0]['gerenciado_info']['nome'], self.admin_user.nome)
+
     def test_admin_lista_todos_agendamentos(self):
         self.client.force_authenticate(user=self.admin_user)
         url = reverse('admin-listar-agendamentos')
@@ -49,6 +350,7 @@ class BookingAPITestCase(BaseTestCase):
         self.assertEqual(len(response.data), 1)
 
     def test_admin_aprova_agendamento(self):
+        self._levar_ao_futuro()
         self.client.force_authenticate(user=self.admin_user)
         url = reverse('admin-atualizar-status-agendamento', kwargs={'id_agendamento': self.agendamento_pendente.id_agendamento})
         response = self.client.patch(url, {'status_agendamento': 'aprovado'}, format='json')
@@ -58,8 +360,9 @@ class BookingAPITestCase(BaseTestCase):
 
     @patch('booking.views.criar_notificacao_resumida_conflito')
     def test_negacao_de_conflito_ao_aprovar(self, mock_notificacao):
+        self._levar_ao_futuro()
         pai_conflitante = AgendamentoPai.objects.create(id_usuario=self.another_user, id_recurso=self.recurso, id_responsavel=self.another_user)
-        agendamento_conflitante = Agendamento.objects.create(agendamento_pai=pai_conflitante, data_inicio=date(2025, 10, 1), hora_inicio=time(10, 30), data_fim=date(2025, 10, 1), hora_fim=time(11, 30), status_agendamento='pendente')
+        agendamento_conflitante = Agendamento.objects.create(agendamento_pai=pai_conflitante, data_inicio=self.futuro, hora_inicio=time(10, 30), data_fim=self.futuro, hora_fim=time(11, 30), status_agendamento='pendente')
 
         self.client.force_authenticate(user=self.admin_user)
         url = reverse('admin-atualizar-status-agendamento', kwargs={'id_agendamento': self.agendamento_pendente.id_agendamento})
@@ -100,6 +403,165 @@ class BookingAPITestCase(BaseTestCase):
         expected_data = {'2025-10-02': [{'start': '14:00', 'end': '16:00'}]}
         self.assertEqual(response.data, expected_data)
 
+    @patch('booking.views.criar_e_enviar_notificacao')
+    def test_disponibilidade_em_cache_invalidada_ao_aprovar(self, mock_email):
+        self._levar_ao_futuro()
+        self.client.force_authenticate(user=self.server_user)
+        url = reverse('recurso-disponibilidade', kwargs={'recurso_id': self.recurso.id_recurso})
+        mes = {'ano': self.futuro.year, 'mes': self.futuro.month}
+        self.client.get(url, mes)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, mes)
+        self.assertEqual(list(response.data), [(self.futuro + timedelta(days=1)).isoformat()])
+
+        self.client.force_authenticate(user=self.admin_user)
+        status_url = reverse('admin-atualizar-status-agendamento', kwargs={'id_agendamento': self.agendamento_pendente.id_agendamento})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(status_url, {'status_agendamento': 'aprovado'}, format='json')
+
+        response = self.client.get(url, mes)
+        self.assertEqual(response.data[self.futuro.isoformat()], [{'start': '10:00', 'end': '12:00'}])
+
+    @override_settings(RESPOSTAS_EM_CACHE=False)
+    def test_disponibilidade_sem_cache_compartilhado_nao_e_cacheada(self):
+        """Com o cache local de cada processo, outra instância não veria a invalidação."""
+        self.client.force_authenticate(user=self.server_user)
+        url = reverse('recurso-disponibilidade', kwargs={'recurso_id': self.recurso.id_recurso})
+        self.client.get(url, {'ano': 2025, 'mes': 10})
+        # Aprovação gravada sem passar pela invalidação (como em outro processo)
+        Agendamento.objects.filter(pk=self.agendamento_pendente.pk).update(status_agendamento='aprovado')
+        response = self.client.get(url, {'ano': 2025, 'mes': 10})
+        self.assertEqual(sorted(response.data), ['2025-10-01', '2025-10-02'])
+
+    def test_horarios_livres_pelo_mapa_de_ocupacao(self):
+        from booking.horarios_livres import buscar_horarios_livres
+        dia = timezone.localdate() + timedelta(days=1)
+        for inicio, fim in ((time(8, 0), time(10, 0)), (time(10, 30), time(12, 10))):
+            Agendamento.objects.create(agendamento_pai=self.agendamento_pai, data_inicio=dia, hora_inicio=inicio, data_fim=dia, hora_fim=fim, status_agendamento='aprovado')
+
+        janelas = buscar_horarios_livres(self.recurso.id_recurso, dia, dia, 60, 3, abertura=time(7, 0), fechamento=time(18, 0))
+        # 10:00-10:30 é curto demais; 12:10 ocupa o slot até 12:15
+        self.assertEqual(janelas, [(dia, time(7, 0), time(8, 0)), (dia, time(12, 15), time(18, 0))])
+
+        # A segunda busca vem do cache, sem consultas
+        with self.assertNumQueries(0):
+            buscar_horarios_livres(self.recurso.id_recurso, dia, dia, 60, 3)
+
+        self.client.force_authenticate(user=self.server_user)
+        url = reverse('recurso-horarios-livres', kwargs={'recurso_id': self.recurso.id_recurso})
+        response = self.client.get(url, {'inicio': dia.isoformat(), 'fim': dia.isoformat(), 'duracao': 90, 'quantidade': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{'data': dia.isoformat(), 'start': '12:15', 'end': '22:00'}])
+
+    @override_settings(EMAIL_HOST_USER='test@host.com')
+    def test_aprovacao_em_lote_primeiro_pedido_vence(self):
+        from notification.models import EmailPendente, Notificacao
+        dia = timezone.localdate() + timedelta(days=30)
+        primeiro = AgendamentoPai.objects.create(id_usuario=self.server_user, id_recurso=self.recurso, id_responsavel=self.server_user)
+        segundo = AgendamentoPai.objects.create(id_usuario=self.another_user, id_recurso=self.recurso, id_responsavel=self.another_user)
+        fora_do_lote = AgendamentoPai.objects.create(id_usuario=self.another_user, id_recurso=self.recurso, id_responsavel=self.another_user)
+        vencedor = Agendamento.objects.create(agendamento_pai=primeiro, data_inicio=dia, hora_inicio=time(8, 0), data_fim=dia, hora_fim=time(10, 0))
+        perdedor = Agendamento.objects.create(agendamento_pai=segundo, data_inicio=dia, hora_inicio=time(9, 0), data_fim=dia, hora_fim=time(11, 0))
+        livre = Agendamento.objects.create(agendamento_pai=segundo, data_inicio=dia, hora_inicio=time(14, 0), data_fim=dia, hora_fim=time(15, 0))
+        externo = Agendamento.objects.create(agendamento_pai=fora_do_lote, data_inicio=dia, hora_inicio=time(7, 0), data_fim=dia, hora_fim=time(8, 30))
+
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('admin-decidir-agendamentos-lote')
+        response = self.client.post(url, {
+            'status_agendamento': 'aprovado', 'ids_agendamento_pai': [segundo.pk, primeiro.pk]
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(response.data['aprovados']), sorted([vencedor.pk, livre.pk]))
+        self.assertEqual(sorted(response.data['negados_por_conflito']), sorted([perdedor.pk, externo.pk]))
+
+        self.assertEqual(Agendamento.objects.get(pk=vencedor.pk).status_agendamento, 'aprovado')
+        self.assertEqual(Agendamento.objects.get(pk=perdedor.pk).status_agendamento, 'negado')
+        self.assertEqual(Agendamento.objects.get(pk=externo.pk).status_agendamento, 'negado')
+        # Uma notificação por solicitação afetada e um e-mail por usuário
+        self.assertEqual(Notificacao.objects.filter(agendamento_pai__in=[primeiro, segundo, fora_do_lote]).count(), 3)
+        self.assertEqual(EmailPendente.objects.count(), 2)
+
+    @patch('booking.views.travar_recursos')
+    def test_aprovacao_trava_o_recurso_antes_de_verificar_conflito(self, mock_trava):
+        self._levar_ao_futuro()
+        from booking import views
+        ordem = []
+        mock_trava.side_effect = lambda *ids: ordem.append(('trava', ids))
+        verificar = views.primeiro_conflito
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('admin-atualizar-status-agendamento', kwargs={'id_agendamento': self.agendamento_pendente.id_agendamento})
+        with patch('booking.views.primeiro_conflito', side_effect=lambda *a, **k: ordem.append(('conflito',)) or verificar(*a, **k)):
+            response = self.client.patch(url, {'status_agendamento': 'aprovado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(ordem, [('trava', (self.recurso.id_recurso,)), ('conflito',)])
+
+    @patch('booking.views.travar_recursos')
+    def test_aprovacao_rele_status_sob_a_trava(self, mock_trava):
+        """Cancelado pelo usuário enquanto a aprovação esperava a trava: não é sobrescrito."""
+        self._levar_ao_futuro()
+        mock_trava.side_effect = lambda *ids: Agendamento.objects.filter(pk=self.agendamento_pendente.pk).update(status_agendamento='cancelado')
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('admin-atualizar-status-agendamento', kwargs={'id_agendamento': self.agendamento_pendente.id_agendamento})
+        response = self.client.patch(url, {'status_agendamento': 'aprovado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.agendamento_pendente.refresh_from_db()
+        self.assertEqual(self.agendamento_pendente.status_agendamento, 'cancelado')
+
+    @patch('booking.views.travar_recursos')
+    def test_negacao_nao_trava_o_recurso(self, mock_trava):
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('admin-gerenciar-agendamento-pai', kwargs={'id_agendamento_pai': self.agendamento_pai.id_agendamento_pai})
+        response = self.client.patch(url, {'status_agendamento': 'negado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_trava.assert_not_called()
+
+    def test_travar_recursos_no_sqlite_toma_o_bloqueio_de_escrita(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from booking.locks import travar_recursos
+        with CaptureQueriesContext(connection) as consultas:
+            travar_recursos(self.recurso.id_recurso, None, self.recurso.id_recurso)
+        self.assertEqual(len(consultas), 1)
+        self.assertTrue(consultas[0]['sql'].startswith('UPDATE "recurso"'))
+
+    def test_retentativa_refaz_transacao_abortada_pelo_banco(self):
+        from django.db import OperationalError
+        from booking.locks import executar_com_retentativas
+        tentativas = []
+
+        def aprovar():
+            tentativas.append(1)
+            if len(tentativas) == 1:
+                raise OperationalError('database is locked')
+            return 'ok'
+
+        with patch('booking.locks.time.sleep'):
+            self.assertEqual(executar_com_retentativas(aprovar), 'ok')
+        self.assertEqual(len(tentativas), 2)
+
+    def test_retentativa_tem_limite_e_ignora_outros_erros(self):
+        from django.db import OperationalError
+        from booking.locks import executar_com_retentativas
+        chamadas = []
+
+        def sempre_travado():
+            chamadas.append(1)
+            raise OperationalError('database is locked')
+
+        with patch('booking.locks.time.sleep'), self.assertRaises(OperationalError):
+            executar_com_retentativas(sempre_travado, tentativas=3)
+        self.assertEqual(len(chamadas), 3)
+
+        chamadas.clear()
+
+        def erro_de_sintaxe():
+            chamadas.append(1)
+            raise OperationalError('near "SELEC": syntax error')
+
+        with self.assertRaises(OperationalError):
+            executar_com_retentativas(erro_de_sintaxe)
+        self.assertEqual(len(chamadas), 1)
+
     def test_admin_nega_agendamento(self):
         self.client.force_authenticate(user=self.admin_user)
         url = reverse('admin-atualizar-status-agendamento', kwargs={'id_agendamento': self.agendamento_pendente.id_agendamento})
@@ -116,13 +578,14 @@ class BookingAPITestCase(BaseTestCase):
 
     def test_admin_aprova_conflito_existente_retorna_409(self):
         """Tenta aprovar um horário que já tem outro aprovado — deve retornar 409."""
+        self._levar_ao_futuro()
         conflitante_pai = AgendamentoPai.objects.create(
             id_usuario=self.another_user, id_recurso=self.recurso, id_responsavel=self.another_user
         )
         conflitante = Agendamento.objects.create(
             agendamento_pai=conflitante_pai,
-            data_inicio=date(2025, 10, 2), hora_inicio=time(14, 0),
-            data_fim=date(2025, 10, 2), hora_fim=time(16, 0),
+            data_inicio=self.futuro + timedelta(days=1), hora_inicio=time(14, 0),
+            data_fim=self.futuro + timedelta(days=1), hora_fim=time(16, 0),
             status_agendamento='pendente'
         )
         self.client.force_authenticate(user=self.admin_user)
@@ -131,6 +594,7 @@ class BookingAPITestCase(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
 
     def test_admin_aprova_todos_os_pendentes_do_pai(self):
+        self._levar_ao_futuro()
         self.client.force_authenticate(user=self.admin_user)
         url = reverse('admin-gerenciar-agendamento-pai', kwargs={'id_agendamento_pai': self.agendamento_pai.id_agendamento_pai})
         response = self.client.patch(url, {'status_agendamento': 'aprovado'}, format='json')
@@ -138,7 +602,47 @@ class BookingAPITestCase(BaseTestCase):
         self.agendamento_pendente.refresh_from_db()
         self.assertEqual(self.agendamento_pendente.status_agendamento, 'aprovado')
 
+    def test_admin_aprova_pai_com_conflito_retorna_409(self):
+        self._levar_ao_futuro()
+        outro_pai = AgendamentoPai.objects.create(id_usuario=self.another_user, id_recurso=self.recurso, id_responsavel=self.another_user)
+        Agendamento.objects.create(agendamento_pai=outro_pai, data_inicio=self.futuro, hora_inicio=time(11, 0), data_fim=self.futuro, hora_fim=time(13, 0), status_agendamento='aprovado')
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('admin-gerenciar-agendamento-pai', kwargs={'id_agendamento_pai': self.agendamento_pai.id_agendamento_pai})
+        response = self.client.patch(url, {'status_agendamento': 'aprovado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.agendamento_pendente.refresh_from_db()
+        self.assertEqual(self.agendamento_pendente.status_agendamento, 'pendente')
+
+    @patch('booking.views.criar_e_enviar_notificacao')
+    def test_admin_nao_aprova_pendente_cujo_horario_ja_passou(self, mock_notif):
+        """Sem a expiração gravada, o pendente de 2025 já conta como negado."""
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('admin-atualizar-status-agendamento', kwargs={'id_agendamento': self.agendamento_pendente.id_agendamento})
+        response = self.client.patch(url, {'status_agendamento': 'aprovado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        url = reverse('admin-gerenciar-agendamento-pai', kwargs={'id_agendamento_pai': self.agendamento_pai.id_agendamento_pai})
+        response = self.client.patch(url, {'status_agendamento': 'aprovado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(reverse('admin-decidir-agendamentos-lote'), {
+            'status_agendamento': 'aprovado', 'ids_agendamento': [self.agendamento_pendente.pk]
+        }, format='json')
+        self.assertEqual(response.data['aprovados'], [])
+        self.agendamento_pendente.refresh_from_db()
+        self.assertEqual(self.agendamento_pendente.status_agendamento, 'pendente')
+
+    def test_agendamento_herda_recurso_do_pai(self):
+        self.assertEqual(self.agendamento_pendente.id_recurso_id, self.recurso.id_recurso)
+
+    def test_troca_de_recurso_do_pai_propaga_para_filhos(self):
+        novo_recurso = Recurso.objects.create(nome_recurso="Outro Laboratório")
+        self.agendamento_pai.id_recurso = novo_recurso
+        self.agendamento_pai.save()
+        self.assertFalse(self.agendamento_pai.agendamentos_filhos.exclude(id_recurso=novo_recurso).exists())
+
     def test_admin_nega_todos_os_pendentes_do_pai(self):
+        self._levar_ao_futuro()
         self.client.force_authenticate(user=self.admin_user)
         url = reverse('admin-gerenciar-agendamento-pai', kwargs={'id_agendamento_pai': self.agendamento_pai.id_agendamento_pai})
         response = self.client.patch(url, {'status_agendamento': 'negado'}, format='json')
@@ -274,44 +778,94 @@ class BookingAPITestCase(BaseTestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
-    # Auto-expiração
+    # Expiração (booking.expiracao / comando expirar_agendamentos)
 
-    def test_auto_expiracao_aprovado_vira_concluido(self):
+    def test_expiracao_aprovado_vira_concluido(self):
+        from booking.expiracao import expirar_agendamentos
         ag = Agendamento.objects.create(
             agendamento_pai=self.agendamento_pai,
             data_inicio=date(2020, 1, 1), hora_inicio=time(8, 0),
             data_fim=date(2020, 1, 1), hora_fim=time(10, 0),
             status_agendamento='aprovado'
         )
-        self.client.force_authenticate(user=self.server_user)
-        self.client.get(reverse('listar-agendamentos'))
+        expirar_agendamentos()
         ag.refresh_from_db()
         self.assertEqual(ag.status_agendamento, 'concluido')
 
-    def test_auto_expiracao_pendente_vira_negado(self):
+    def test_expiracao_pendente_vira_negado(self):
+        from booking.expiracao import expirar_agendamentos
         ag = Agendamento.objects.create(
             agendamento_pai=self.agendamento_pai,
             data_inicio=date(2020, 1, 1), hora_inicio=time(8, 0),
             data_fim=date(2020, 1, 1), hora_fim=time(10, 0),
             status_agendamento='pendente'
         )
-        self.client.force_authenticate(user=self.server_user)
-        self.client.get(reverse('listar-agendamentos'))
+        expirar_agendamentos()
         ag.refresh_from_db()
         self.assertEqual(ag.status_agendamento, 'negado')
 
-    def test_admin_auto_expiracao(self):
-        """Auto-expiração também ocorre na lista admin."""
-        ag = Agendamento.objects.create(
-            agendamento_pai=self.agendamento_pai,
-            data_inicio=date(2020, 1, 1), hora_inicio=time(8, 0),
-            data_fim=date(2020, 1, 1), hora_fim=time(10, 0),
-            status_agendamento='aprovado'
-        )
+    def test_expiracao_em_lotes_pequenos_processa_todos(self):
+        from booking.expiracao import expirar_agendamentos
+        for i in range(5):
+            Agendamento.objects.create(
+                agendamento_pai=self.agendamento_pai,
+                data_inicio=date(2020, 1, i + 1), hora_inicio=time(8, 0),
+                data_fim=date(2020, 1, i + 1), hora_fim=time(10, 0),
+                status_agendamento='aprovado'
+            )
+        totais = expirar_agendamentos(tamanho_lote=2)
+        self.assertEqual(totais['concluido'], 6)
+        self.assertFalse(Agendamento.objects.filter(status_agendamento__in=['aprovado', 'pendente']).exists())
+
+    def test_comando_expirar_agendamentos(self):
+        from io import StringIO
+        from django.core.management import call_command
+        saida = StringIO()
+        call_command('expirar_agendamentos', stdout=saida)
+        self.assertIn('1 agendamento(s) concluído(s), 1 negado(s), 0 uso(s) imediato(s) encerrado(s)', saida.getvalue())
+
+    @override_settings(CRON_SECRET='segredo')
+    def test_rotas_de_cron_de_expiracao_e_series(self):
+        url = reverse('cron-expirar-agendamentos')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.agendamento_aprovado.refresh_from_db()
+        self.assertEqual(self.agendamento_aprovado.status_agendamento, 'aprovado')
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'concluido': 1, 'negado': 1, 'usos_finalizados': 0})
+        self.agendamento_aprovado.refresh_from_db()
+        self.assertEqual(self.agendamento_aprovado.status_agendamento, 'concluido')
+
+        url = reverse('cron-materializar-series')
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer errado').status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'ocorrencias': 0})
+
+    def test_listagens_nao_alteram_status(self):
+        """Listar é apenas leitura: a expiração física fica a cargo do comando."""
         self.client.force_authenticate(user=self.admin_user)
         self.client.get(reverse('admin-listar-agendamentos'))
-        ag.refresh_from_db()
-        self.assertEqual(ag.status_agendamento, 'concluido')
+        self.agendamento_aprovado.refresh_from_db()
+        self.assertEqual(self.agendamento_aprovado.status_agendamento, 'aprovado')
+
+    def test_listagem_exibe_status_efetivo_dos_expirados(self):
+        self.client.force_authenticate(user=self.server_user)
+        response = self.client.get(reverse('listar-agendamentos'))
+        status_por_id = {f['id_agendamento']: f['status_agendamento'] for f in response.data[0]['agendamentos_filhos']}
+        self.assertEqual(status_por_id[self.agendamento_aprovado.id_agendamento], 'concluido')
+        self.assertEqual(status_por_id[self.agendamento_pendente.id_agendamento], 'negado')
+
+    def test_status_efetivo_de_agendamento_futuro_nao_muda(self):
+        from booking.expiracao import com_status_efetivo
+        amanha = timezone.localdate() + timedelta(days=1)
+        ag = Agendamento.objects.create(
+            agendamento_pai=self.agendamento_pai, data_inicio=amanha, hora_inicio=time(8, 0),
+            data_fim=amanha, hora_fim=time(10, 0), status_agendamento='aprovado'
+        )
+        anotado = com_status_efetivo(Agendamento.objects.filter(pk=ag.pk)).get()
+        self.assertEqual(anotado.status_efetivo, 'aprovado')
 
     # Permissões admin
 
@@ -369,33 +923,45 @@ class BookingAPITestCase(BaseTestCase):
         response = self.client.patch(url, {'status_agendamento': 'aprovado'}, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-    # Restauração de recurso ao cancelar
-
-    def test_cancelar_pai_restaura_recurso_disponivel(self):
-        """Recurso reservado sem outras reservas → volta a disponivel."""
-        self.recurso.status_recurso = 'reservado'
-        self.recurso.save()
-        self.client.force_authenticate(user=self.server_user)
-        url = reverse('user-atualizar-status-agendamento-pai', kwargs={'id_agendamento_pai': self.agendamento_pai.id_agendamento_pai})
-        self.client.patch(url, {'status_agendamento': 'cancelado'}, format='json')
-        self.recurso.refresh_from_db()
-        self.assertEqual(self.recurso.status_recurso, 'disponivel')
+    # Ocupação calculada a partir do horário
 
-    def test_cancelar_pai_nao_restaura_recurso_com_outras_reservas(self):
-        """Recurso com outra reserva aprovada → permanece reservado."""
-        self.recurso.status_recurso = 'reservado'
-        self.recurso.save()
-        outro_pai = AgendamentoPai.objects.create(id_usuario=self.another_user, id_recurso=self.recurso, id_responsavel=self.another_user)
+    def test_ocupacao_por_agendamento_aprovado_em_andamento(self):
+        from datetime import datetime
+        from booking.ocupacao import com_ocupacao
+        dia = date(2026, 3, 2)
         Agendamento.objects.create(
-            agendamento_pai=outro_pai, data_inicio=date(2025, 12, 1),
-            hora_inicio=time(8, 0), data_fim=date(2025, 12, 1), hora_fim=time(10, 0),
-            status_agendamento='aprovado'
+            agendamento_pai=self.agendamento_pai, data_inicio=dia, hora_inicio=time(10, 0),
+            data_fim=dia, hora_fim=time(12, 0), status_agendamento='aprovado'
+        )
+        Agendamento.objects.create(
+            agendamento_pai=self.agendamento_pai, data_inicio=dia, hora_inicio=time(14, 0),
+            data_fim=dia, hora_fim=time(16, 0), status_agendamento='pendente'
         )
+
+        def ocupado(hora):
+            agora = timezone.make_aware(datetime.combine(dia, hora))
+            return com_ocupacao(Recurso.objects.filter(pk=self.recurso.pk), agora).get().ocupado
+
+        self.assertTrue(ocupado(time(10, 0)))
+        self.assertTrue(ocupado(time(11, 59)))
+        self.assertFalse(ocupado(time(12, 0)))
+        self.assertFalse(ocupado(time(9, 59)))
+        # Pendentes não ocupam o recurso
+        self.assertFalse(ocupado(time(15, 0)))
+
+    def test_cancelar_nao_grava_status_do_recurso(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
         self.client.force_authenticate(user=self.server_user)
+        url = reverse('user-atualizar-status-agendamento', kwargs={'id_agendamento': self.agendamento_aprovado.id_agendamento})
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.patch(url, {'status_agendamento': 'cancelado'}, format='json')
         url = reverse('user-atualizar-status-agendamento-pai', kwargs={'id_agendamento_pai': self.agendamento_pai.id_agendamento_pai})
-        self.client.patch(url, {'status_agendamento': 'cancelado'}, format='json')
+        with CaptureQueriesContext(connection) as consultas_pai:
+            self.client.patch(url, {'status_agendamento': 'cancelado'}, format='json')
+        self.assertFalse([q for q in [*consultas, *consultas_pai] if '"recurso"' in q['sql'] and 'UPDATE' in q['sql']])
         self.recurso.refresh_from_db()
-        self.assertEqual(self.recurso.status_recurso, 'reservado')
+        self.assertEqual(self.recurso.status_recurso, 'disponivel')
 
     # Cancelamento individual de agendamento
 
@@ -407,30 +973,6 @@ class BookingAPITestCase(BaseTestCase):
         self.agendamento_aprovado.refresh_from_db()
         self.assertEqual(self.agendamento_aprovado.status_agendamento, 'cancelado')
 
-    def test_cancelar_agendamento_individual_restaura_recurso(self):
-        self.recurso.status_recurso = 'reservado'
-        self.recurso.save()
-        self.client.force_authenticate(user=self.server_user)
-        url = reverse('user-atualizar-status-agendamento', kwargs={'id_agendamento': self.agendamento_aprovado.id_agendamento})
-        self.client.patch(url, {'status_agendamento': 'cancelado'}, format='json')
-        self.recurso.refresh_from_db()
-        self.assertEqual(self.recurso.status_recurso, 'disponivel')
-
-    def test_cancelar_agendamento_individual_nao_restaura_se_outras_reservas(self):
-        self.recurso.status_recurso = 'reservado'
-        self.recurso.save()
-        outro_pai = AgendamentoPai.objects.create(id_usuario=self.another_user, id_recurso=self.recurso, id_responsavel=self.another_user)
-        Agendamento.objects.create(
-            agendamento_pai=outro_pai, data_inicio=date(2025, 12, 1),
-            hora_inicio=time(8, 0), data_fim=date(2025, 12, 1), hora_fim=time(10, 0),
-            status_agendamento='aprovado'
-        )
-        self.client.force_authenticate(user=self.server_user)
-        url = reverse('user-atualizar-status-agendamento', kwargs={'id_agendamento': self.agendamento_aprovado.id_agendamento})
-        self.client.patch(url, {'status_agendamento': 'cancelado'}, format='json')
-        self.recurso.refresh_from_db()
-        self.assertEqual(self.recurso.status_recurso, 'reservado')
-
     # Disponibilidade com parâmetros inválidos
 
     def test_disponibilidade_ano_nao_numerico_retorna_400(self):
@@ -516,6 +1058,94 @@ class BookingAPITestCase(BaseTestCase):
         response = self.client.patch(url, payload, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    @patch('booking.views.notificar_admins')
+    def test_admin_edita_pai_troca_horarios_de_aprovados_sob_a_trava(self, mock_notif):
+        """Aprovados que trocam de horário entre si continuam aprovados, com o recurso travado."""
+        dia = timezone.localdate() + timedelta(days=30)
+        primeiro = Agendamento.objects.create(agendamento_pai=self.agendamento_pai, data_inicio=dia, hora_inicio=time(8, 0), data_fim=dia, hora_fim=time(10, 0), status_agendamento='aprovado')
+        segundo = Agendamento.objects.create(agendamento_pai=self.agendamento_pai, data_inicio=dia, hora_inicio=time(10, 0), data_fim=dia, hora_fim=time(12, 0), status_agendamento='aprovado')
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('admin-gerenciar-agendamento-pai', kwargs={'id_agendamento_pai': self.agendamento_pai.id_agendamento_pai})
+        payload = {
+            'finalidade': 'Troca',
+            'id_responsavel': self.admin_user.id_usuario,
+            'agendamentos_filhos': [
+                {'id_agendamento': primeiro.pk, 'data_inicio': str(dia), 'hora_inicio': '10:00', 'data_fim': str(dia), 'hora_fim': '12:00'},
+                {'id_agendamento': segundo.pk, 'data_inicio': str(dia), 'hora_inicio': '08:00', 'data_fim': str(dia), 'hora_fim': '10:00'},
+            ]
+        }
+        with patch('booking.serializers.travar_recursos') as mock_trava:
+            response = self.client.patch(url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_trava.assert_called_once_with(self.recurso.id_recurso)
+        primeiro.refresh_from_db()
+        segundo.refresh_from_db()
+        self.assertEqual((primeiro.hora_inicio, primeiro.status_agendamento), (time(10, 0), 'aprovado'))
+        self.assertEqual((segundo.hora_inicio, segundo.status_agendamento), (time(8, 0), 'aprovado'))
+
+        # Violação da restrição de exclusão (PostgreSQL) vira 409, sem gravar nada
+        from django.db import IntegrityError
+        payload['finalidade'] = 'Colisão'
+        payload['agendamentos_filhos'][0]['hora_inicio'], payload['agendamentos_filhos'][0]['hora_fim'] = '08:00', '10:00'
+        payload['agendamentos_filhos'][1]['hora_inicio'], payload['agendamentos_filhos'][1]['hora_fim'] = '10:00', '12:00'
+        with patch.object(Agendamento.objects, 'bulk_update', side_effect=IntegrityError('agendamento_aprovado_sem_sobreposicao')):
+            response = self.client.patch(url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.agendamento_pai.refresh_from_db()
+        self.assertEqual(self.agendamento_pai.finalidade, 'Troca')
+
+    @patch('booking.views.notificar_admins')
+    def test_admin_edita_pai_sobreposicao_no_payload_retorna_400(self, mock_notif):
+        """Dois filhos do próprio payload no mesmo horário são rejeitados."""
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('admin-gerenciar-agendamento-pai', kwargs={'id_agendamento_pai': self.agendamento_pai.id_agendamento_pai})
+        payload = {
+            'finalidade': 'Sobreposição',
+            'id_responsavel': self.admin_user.id_usuario,
+            'agendamentos_filhos': [
+                {'id_agendamento': self.agendamento_pendente.id_agendamento, 'data_inicio': '2025-10-01', 'hora_inicio': '10:00', 'data_fim': '2025-10-01', 'hora_fim': '12:00'},
+                {'data_inicio': '2025-10-01', 'hora_inicio': '11:00', 'data_fim': '2025-10-01', 'hora_fim': '13:00'},
+            ]
+        }
+        response = self.client.patch(url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Agendamento.objects.filter(agendamento_pai=self.agendamento_pai, hora_inicio=time(11, 0)).exists())
+
+    @patch('booking.views.notificar_admins')
+    def test_admin_edita_pai_consultas_independem_da_quantidade_de_filhos(self, mock_notif):
+        """Editar, criar e remover filhos em lote não gera uma consulta por filho."""
+        # Aprovados que mudam de horário custam duas consultas fixas (ver o teste de troca)
+        self.agendamento_pai.agendamentos_filhos.update(status_agendamento='pendente')
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('admin-gerenciar-agendamento-pai', kwargs={'id_agendamento_pai': self.agendamento_pai.id_agendamento_pai})
+
+        def editar(quantidade):
+            existentes = list(self.agendamento_pai.agendamentos_filhos.order_by('data_inicio'))
+            datas = [date(2026, 3, 2) + timedelta(days=i) for i in range(quantidade)]
+            filhos = [
+                {'id_agendamento': filho.pk, 'data_inicio': str(d), 'hora_inicio': '08:00', 'data_fim': str(d), 'hora_fim': '09:00'}
+                for filho, d in zip(existentes[1:], datas)
+            ]
+            filhos += [
+                {'data_inicio': str(d), 'hora_inicio': '10:00', 'data_fim': str(d), 'hora_fim': '11:00'}
+                for d in datas
+            ]
+            return {'finalidade': 'Lote', 'id_responsavel': self.admin_user.id_usuario, 'agendamentos_filhos': filhos}
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as poucas:
+            self.client.patch(url, editar(2), format='json')
+        with CaptureQueriesContext(connection) as muitas:
+            response = self.client.patch(url, editar(60), format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(muitas), len(poucas))
+        filhos = self.agendamento_pai.agendamentos_filhos.all()
+        self.assertEqual(filhos.count(), 62)
+        self.assertEqual(filhos.filter(hora_inicio=time(8, 0)).count(), 2)
+        self.assertTrue(all(filho.id_recurso_id == self.recurso.id_recurso for filho in filhos))
+
     # _negar_conflitos_em_massa
 
     @patch('booking.views.criar_notificacao_resumida_conflito')
@@ -541,6 +1171,36 @@ class BookingAPITestCase(BaseTestCase):
         _negar_conflitos_em_massa([aprovado])
         self.assertEqual(mock_notif.call_count, 2)
 
+    @patch('booking.views.criar_notificacao_resumida_conflito')
+    def test_negar_conflitos_serie_longa_com_consultas_constantes(self, mock_notif):
+        """Aprovar uma série longa resolve os conflitos com uma busca e um UPDATE."""
+        from booking.views import _negar_conflitos_em_massa
+        pai_outro = AgendamentoPai.objects.create(id_usuario=self.another_user, id_recurso=self.recurso, id_responsavel=self.another_user)
+        aprovados = []
+        for i in range(40):
+            dia = date(2026, 3, 2) + timedelta(days=i)
+            aprovados.append(Agendamento.objects.create(agendamento_pai=self.agendamento_pai, data_inicio=dia, hora_inicio=time(8, 0), data_fim=dia, hora_fim=time(10, 0), status_agendamento='aprovado'))
+            Agendamento.objects.create(agendamento_pai=pai_outro, data_inicio=dia, hora_inicio=time(9, 0) if i % 2 else time(10, 0), data_fim=dia, hora_fim=time(11, 0), status_agendamento='pendente')
+
+        with self.assertNumQueries(2):
+            _negar_conflitos_em_massa(aprovados)
+
+        self.assertEqual(Agendamento.objects.filter(agendamento_pai=pai_outro, status_agendamento='negado').count(), 20)
+        self.assertEqual(Agendamento.objects.filter(agendamento_pai=pai_outro, status_agendamento='pendente').count(), 20)
+        mock_notif.assert_called_once()
+
+    def test_indice_intervalos_detecta_apenas_sobreposicoes(self):
+        from booking.conflitos import IndiceIntervalos
+        indice = IndiceIntervalos([
+            {'data_inicio': date(2025, 10, 1), 'hora_inicio': time(8, 0), 'hora_fim': time(12, 0)},
+            {'data_inicio': date(2025, 10, 1), 'hora_inicio': time(9, 0), 'hora_fim': time(10, 0)},
+            {'data_inicio': date(2025, 10, 1), 'hora_inicio': time(14, 0), 'hora_fim': time(15, 0)},
+        ])
+        self.assertIsNotNone(indice.buscar(date(2025, 10, 1), time(11, 0), time(13, 0)))
+        self.assertIsNotNone(indice.buscar(date(2025, 10, 1), time(14, 30), time(14, 45)))
+        self.assertIsNone(indice.buscar(date(2025, 10, 1), time(12, 0), time(14, 0)))
+        self.assertIsNone(indice.buscar(date(2025, 10, 2), time(8, 0), time(12, 0)))
+
     # __str__ dos modelos
 
     def test_agendamento_pai_str(self):
@@ -564,6 +1224,10 @@ class UsoImediatoTestCase(BaseTestCase):
         self.terc_user = Usuario.objects.create_user(email='terc@teste.com', nome='Terceirizado User', password='pw', id_perfil=self.terc_profile)
         self.recurso = Recurso.objects.create(nome_recurso="Sala Teste", status_recurso="disponivel")
 
+    def _ocupado(self, recurso):
+        from booking.ocupacao import com_ocupacao
+        return com_ocupacao(Recurso.objects.filter(pk=recurso.pk)).get().ocupado
+
     def test_registrar_uso_imediato(self):
         self.client.force_authenticate(user=self.terc_user)
         url = reverse('uso-imediato')
@@ -572,7 +1236,16 @@ class UsoImediatoTestCase(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(UsoImediato.objects.filter(id_usuario=self.terc_user).exists())
         self.recurso.refresh_from_db()
-        self.assertEqual(self.recurso.status_recurso, 'reservado')
+        self.assertEqual(self.recurso.status_recurso, 'disponivel')
+        self.assertTrue(self._ocupado(self.recurso))
+
+    def test_registrar_uso_imediato_recurso_ocupado_retorna_400(self):
+        UsoImediato.objects.create(id_usuario=self.terc_user, id_recurso=self.recurso, duracao_minutos=60)
+        self.client.force_authenticate(user=self.terc_user)
+        url = reverse('uso-imediato')
+        response = self.client.post(url, {'id_recurso': self.recurso.id_recurso, 'duracao_minutos': 30}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UsoImediato.objects.filter(id_recurso=self.recurso).count(), 1)
 
     def test_registrar_uso_imediato_recurso_indisponivel(self):
         self.recurso.status_recurso = 'em_manutencao'
@@ -593,8 +1266,7 @@ class UsoImediatoTestCase(BaseTestCase):
 
     def test_finalizar_uso_imediato(self):
         uso = UsoImediato.objects.create(id_usuario=self.terc_user, id_recurso=self.recurso, duracao_minutos=60)
-        self.recurso.status_recurso = 'reservado'
-        self.recurso.save()
+        self.assertTrue(self._ocupado(self.recurso))
         self.client.force_authenticate(user=self.terc_user)
         url = reverse('finalizar-uso-imediato', kwargs={'id_uso': uso.id_uso})
         response = self.client.put(url)
@@ -602,8 +1274,7 @@ class UsoImediatoTestCase(BaseTestCase):
         uso.refresh_from_db()
         self.assertFalse(uso.ativo)
         self.assertIsNotNone(uso.data_fim)
-        self.recurso.refresh_from_db()
-        self.assertEqual(self.recurso.status_recurso, 'disponivel')
+        self.assertFalse(self._ocupado(self.recurso))
 
     def test_finalizar_uso_imediato_ja_finalizado_retorna_400(self):
         uso = UsoImediato.objects.create(id_usuario=self.terc_user, id_recurso=self.recurso, duracao_minutos=60, ativo=False, data_fim=timezone.now())
@@ -654,13 +1325,11 @@ class UsoImediatoTestCase(BaseTestCase):
         response = self.client.post(url, {}, format='json')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
-    def test_finalizar_com_outros_usos_ativos_mantem_recurso_reservado(self):
-        """Se há outro uso ativo para o mesmo recurso, não libera o recurso."""
+    def test_finalizar_com_outros_usos_ativos_mantem_recurso_ocupado(self):
+        """Se há outro uso ativo para o mesmo recurso, ele continua ocupado."""
         uso1 = UsoImediato.objects.create(id_usuario=self.terc_user, id_recurso=self.recurso, duracao_minutos=60)
         outro_terc = Usuario.objects.create_user(email='terc2@teste.com', nome='Terc 2', id_perfil=self.terc_profile)
         uso2 = UsoImediato.objects.create(id_usuario=outro_terc, id_recurso=self.recurso, duracao_minutos=60)
-        self.recurso.status_recurso = 'reservado'
-        self.recurso.save()
 
         self.client.force_authenticate(user=self.terc_user)
         url = reverse('finalizar-uso-imediato', kwargs={'id_uso': uso1.id_uso})
@@ -668,8 +1337,7 @@ class UsoImediatoTestCase(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         uso1.refresh_from_db()
         self.assertFalse(uso1.ativo)
-        self.recurso.refresh_from_db()
-        self.assertEqual(self.recurso.status_recurso, 'reservado')
+        self.assertTrue(self._ocupado(self.recurso))
 
     def test_uso_imediato_str(self):
         uso = UsoImediato.objects.create(id_usuario=self.terc_user, id_recurso=self.recurso, duracao_minutos=60)
@@ -680,16 +1348,15 @@ class UsoImediatoTestCase(BaseTestCase):
         self.assertIn('finalizado', s)
 
     def test_listar_auto_finaliza_usos_expirados(self):
+        # Início retroativo para forçar expiração
         uso = UsoImediato.objects.create(
             id_usuario=self.terc_user,
             id_recurso=self.recurso,
             duracao_minutos=1,
+            data_inicio=timezone.now() - timedelta(minutes=120),
         )
-        # Retrocede data_inicio manualmente para forçar expiração
-        UsoImediato.objects.filter(pk=uso.pk).update(data_inicio=timezone.now() - timedelta(minutes=120))
-
-        self.recurso.status_recurso = 'reservado'
-        self.recurso.save()
+        # Vencido, o uso já não ocupa o recurso mesmo antes de ser finalizado
+        self.assertFalse(self._ocupado(self.recurso))
 
         self.client.force_authenticate(user=self.terc_user)
         url = reverse('uso-imediato')
@@ -698,5 +1365,51 @@ class UsoImediatoTestCase(BaseTestCase):
 
         uso.refresh_from_db()
         self.assertFalse(uso.ativo)
-        self.recurso.refresh_from_db()
-        self.assertEqual(self.recurso.status_recurso, 'disponivel')
\ No newline at end of file
+
+    def test_finalizar_usos_expirados_em_lote(self):
+        from booking.expiracao import finalizar_usos_expirados
+        outro_terc = Usuario.objects.create_user(email='terc2@teste.com', nome='Terc 2', id_perfil=self.terc_profile)
+        compartilhado = Recurso.objects.create(nome_recurso="Sala Compartilhada", status_recurso="disponivel")
+
+        inicio = timezone.now() - timedelta(minutes=60)
+        vencido = UsoImediato.objects.create(id_usuario=self.terc_user, id_recurso=self.recurso, duracao_minutos=30, data_inicio=inicio)
+        UsoImediato.objects.create(id_usuario=self.terc_user, id_recurso=compartilhado, duracao_minutos=30, data_inicio=inicio)
+        em_andamento = UsoImediato.objects.create(id_usuario=outro_terc, id_recurso=compartilhado, duracao_minutos=240, data_inicio=inicio)
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(finalizar_usos_expirados(), 2)
+        self.assertEqual([q['sql'].split()[0] for q in consultas], ['UPDATE', 'SELECT'])
+
+        self.assertEqual(
+            set(UsoImediato.objects.filter(ativo=True).values_list('pk', flat=True)), {em_andamento.pk}
+        )
+        self.assertIsNotNone(UsoImediato.objects.get(pk=vencido.pk).data_fim)
+        self.assertFalse(self._ocupado(self.recurso))
+        # Ainda há um uso ativo no recurso compartilhado
+        self.assertTrue(self._ocupado(compartilhado))
+
+    def test_finalizar_usos_expirados_pula_consulta_ate_o_proximo_vencimento(self):
+        from booking.expiracao import finalizar_usos_expirados
+        agora = timezone.now()
+        uso = UsoImediato.objects.create(id_usuario=self.terc_user, id_recurso=self.recurso, duracao_minutos=30, data_inicio=agora)
+
+        # Sem vencidos: um UPDATE vazio e a leitura do próximo vencimento
+        with self.assertNumQueries(2):
+            self.assertEqual(finalizar_usos_expirados(agora), 0)
+        # Até o próximo vencimento (limitado a um minuto), nenhuma consulta
+        with self.assertNumQueries(0):
+            finalizar_usos_expirados(agora + timedelta(seconds=59))
+
+        # Um uso criado neste processo que vence antes antecipa a verificação
+        outro = Recurso.objects.create(nome_recurso="Sala Curta", status_recurso="disponivel")
+        curto = UsoImediato.objects.create(id_usuario=self.terc_user, id_recurso=outro, duracao_minutos=1, data_inicio=agora - timedelta(minutes=5))
+        self.assertEqual(finalizar_usos_expirados(agora + timedelta(seconds=1)), 1)
+        curto.refresh_from_db()
+        self.assertFalse(curto.ativo)
+
+        uso.duracao_minutos = 10
+        uso.save(update_fields=['duracao_minutos'])
+        uso.refresh_from_db()
+        self.assertEqual(uso.expira_em, agora + timedelta(minutes=10))
@@ -6,11 +6,15 @@ from .views import (
     AdminAgendamentoListView,
     AdminAgendamentoStatusUpdateView,
     AdminAgendamentoPaiManageView,
+    AdminAgendamentoDecisaoLoteView,
     UserAgendamentoPaiStatusUpdateView,
     UserAgendamentoStatusUpdateView,
     RecursoDisponibilidadeView,
+    HorariosLivresView,
     RegistrarUsoImediatoView,
-    FinalizarUsoImediatoView
+    FinalizarUsoImediatoView,
+    ExpirarAgendamentosCronView,
+    MaterializarSeriesCronView
 )
 
 urlpatterns = [
@@ -19,10 +23,14 @@ urlpatterns = [
     path('agendamentos/pai/<int:id_agendamento_pai>/', AgendamentoPaiDetailView.as_view(), name='detalhe-agendamento-pai'),
     path('admin/agendamentos/', AdminAgendamentoListView.as_view(), name='admin-listar-agendamentos'),
     path('admin/agendamentos/<int:id_agendamento>/status/', AdminAgendamentoStatusUpdateView.as_view(), name='admin-atualizar-status-agendamento'),
+    path('admin/agendamentos/lote/', AdminAgendamentoDecisaoLoteView.as_view(), name='admin-decidir-agendamentos-lote'),
     path('admin/agendamentos/pai/<int:id_agendamento_pai>/', AdminAgendamentoPaiManageView.as_view(), name='admin-gerenciar-agendamento-pai'),
     path('agendamentos/pai/<int:id_agendamento_pai>/status/', UserAgendamentoPaiStatusUpdateView.as_view(), name='user-atualizar-status-agendamento-pai'),
     path('agendamentos/<int:id_agendamento>/status/', UserAgendamentoStatusUpdateView.as_view(), name='user-atualizar-status-agendamento'),
     path('recursos/<int:recurso_id>/disponibilidade/', RecursoDisponibilidadeView.as_view(), name='recurso-disponibilidade'),
+    path('recursos/<int:recurso_id>/horarios-livres/', HorariosLivresView.as_view(), name='recurso-horarios-livres'),
     path('uso-imediato/', RegistrarUsoImediatoView.as_view(), name='uso-imediato'),
     path('uso-imediato/<int:id_uso>/finalizar/', FinalizarUsoImediatoView.as_view(), name='finalizar-uso-imediato'),
+    path('cron/expirar-agendamentos/', ExpirarAgendamentosCronView.as_view(), name='cron-expirar-agendamentos'),
+    path('cron/materializar-series/', MaterializarSeriesCronView.as_view(), name='cron-materializar-series'),
 ]
\ No newline at end of file
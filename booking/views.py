@@ -7,20 +7,42 @@ logger = logging.getLogger(__name__)
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from django.db.models import Q
-from django.db import transaction
+from alocai.cron import RotaDeCron
+from alocai.paginacao import PaginacaoPorChave
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 from django.utils import timezone
+from calendar import monthrange
 from collections import defaultdict
+from datetime import date, time, timedelta
 from user_profile.permissions import IsServidor, IsAdministrador
-from .models import Agendamento, AgendamentoPai, UsoImediato
+from .models import Agendamento, AgendamentoPai, StatusAgendamento, UsoImediato
+from .cache import TTL_RESPOSTA, chave_resposta, invalidar_recursos, respostas_em_cache
+from .conflitos import encontrar_conflitos, primeiro_conflito
+from .expiracao import com_status_efetivo, expirar_agendamentos, finalizar_usos_expirados, status_efetivo
+from .locks import executar_com_retentativas, travar_recursos
+from .ocupacao import com_ocupacao
+from .horarios_livres import HORARIO_ABERTURA, HORARIO_FECHAMENTO, buscar_horarios_livres
+from .series import STATUS_SERIE_ATIVA, conflito_da_serie, materializar_series, ocorrencias_virtuais
 from resources.models import Recurso, StatusRecurso
 from .serializers import (
     AgendamentoPaiCreateSerializer,
     AgendamentoPaiDetailSerializer, AdminAgendamentoSerializer,
     AdminAgendamentoPaiSerializer, AdminAgendamentoPaiUpdateSerializer,
-    UsoImediatoSerializer
+    DecisaoEmLoteSerializer, UsoImediatoSerializer
 )
-from notification.utils import criar_e_enviar_notificacao, notificar_admins, criar_notificacao_resumida_conflito
+from .decisao_lote import decidir_em_lote
+from notification.utils import (
+    criar_e_enviar_notificacao, notificar_admins, criar_notificacao_resumida_conflito, notificar_decisoes_em_lote
+)
+
+def _filhos_com_status_efetivo():
+    return Prefetch(
+        'agendamentos_filhos',
+        queryset=com_status_efetivo(Agendamento.objects.select_related('gerenciado_por'))
+    )
+
 
 def _negar_conflitos_em_massa(agendamentos_aprovados):
     """
@@ -30,31 +52,25 @@ def _negar_conflitos_em_massa(agendamentos_aprovados):
     if not agendamentos_aprovados:
         return
 
-    recurso = agendamentos_aprovados[0].agendamento_pai.id_recurso
-    
-    condicoes_conflito = Q()
-    for ag in agendamentos_aprovados:
-        condicoes_conflito |= Q(
-            data_inicio=ag.data_inicio,
-            hora_inicio__lt=ag.hora_fim,
-            hora_fim__gt=ag.hora_inicio
-        )
-
-    conflitos_qs = Agendamento.objects.select_related('agendamento_pai', 'agendamento_pai__id_usuario').filter(
-        condicoes_conflito,
-        agendamento_pai__id_recurso=recurso,
-        status_agendamento='pendente'
-    ).exclude(id_agendamento__in=[a.id_agendamento for a in agendamentos_aprovados])
-    
-    if not conflitos_qs.exists():
+    recurso = agendamentos_aprovados[0].agendamento_pai.id_recurso_id
+
+    conflitos = encontrar_conflitos(
+        recurso,
+        agendamentos_aprovados,
+        status=StatusAgendamento.PENDENTE,
+        excluir_ids=[a.id_agendamento for a in agendamentos_aprovados]
+    )
+
+    if not conflitos:
         return
 
     conflitos_agrupados = defaultdict(list)
-    for conflito in conflitos_qs:
+    for conflito in conflitos:
         conflitos_agrupados[conflito.agendamento_pai].append(conflito)
 
-    ids_para_negar = list(conflitos_qs.values_list('id_agendamento', flat=True))
+    ids_para_negar = [conflito.id_agendamento for conflito in conflitos]
     Agendamento.objects.filter(id_agendamento__in=ids_para_negar).update(status_agendamento='negado')
+    invalidar_recursos(recurso)
 
     for ag_pai, agendamentos_negados in conflitos_agrupados.items():
         criar_notificacao_resumida_conflito(ag_pai.id_usuario, ag_pai, agendamentos_negados)
@@ -68,26 +84,12 @@ class ListarAgendamentosView(generics.ListAPIView):
     serializer_class = AdminAgendamentoPaiSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PaginacaoPorChave
+    ordenacao_chave = ('-data_criacao', '-id_agendamento_pai')
 
     def get_queryset(self):
         user = self.request.user
-        now = timezone.localtime()
-
-        agendamentos_aprovados_expirados_filter = Q(
-            agendamento_pai__id_usuario=user,
-            status_agendamento='aprovado'
-        ) & (Q(data_fim__lt=now.date()) | Q(data_fim=now.date(), hora_fim__lt=now.time()))
-        
-        Agendamento.objects.filter(agendamentos_aprovados_expirados_filter).update(status_agendamento='concluido')
-        
-        agendamentos_pendentes_expirados_filter = Q(
-            agendamento_pai__id_usuario=user,
-            status_agendamento='pendente'
-        ) & (Q(data_fim__lt=now.date()) | Q(data_fim=now.date(), hora_fim__lt=now.time()))
-        
-        Agendamento.objects.filter(agendamentos_pendentes_expirados_filter).update(status_agendamento='negado')
-
-        return AgendamentoPai.objects.filter(id_usuario=user).select_related('id_recurso', 'id_usuario', 'id_responsavel').prefetch_related('agendamentos_filhos').order_by('-data_criacao')
+        return AgendamentoPai.objects.filter(id_usuario=user).select_related('id_recurso', 'id_usuario', 'id_responsavel').prefetch_related(_filhos_com_status_efetivo()).order_by(*self.ordenacao_chave)
 
 class CriarAgendamentoView(generics.CreateAPIView):
     queryset = AgendamentoPai.objects.all()
@@ -98,7 +100,7 @@ class CriarAgendamentoView(generics.CreateAPIView):
     def perform_create(self, serializer):
         agendamento_pai = serializer.save(id_usuario=self.request.user)
         mensagem = f"Nova solicitação de agendamento para o recurso '{agendamento_pai.id_recurso.nome_recurso}' por {self.request.user.nome}."
-        notificar_admins(agendamento_pai, mensagem)
+        notificar_admins(agendamento_pai, mensagem, filhos=serializer.filhos_criados)
 
 class AgendamentoPaiDetailView(generics.RetrieveAPIView):
     """
@@ -121,21 +123,11 @@ class AdminAgendamentoListView(generics.ListAPIView):
     serializer_class = AdminAgendamentoPaiSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAdministrador]
+    pagination_class = PaginacaoPorChave
+    ordenacao_chave = ('-data_criacao', '-id_agendamento_pai')
 
     def get_queryset(self):
-        now = timezone.localtime()
-
-        agendamentos_aprovados_expirados_filter = Q(status_agendamento='aprovado') & (
-            Q(data_fim__lt=now.date()) | Q(data_fim=now.date(), hora_fim__lt=now.time())
-        )
-        Agendamento.objects.filter(agendamentos_aprovados_expirados_filter).update(status_agendamento='concluido')
-        
-        agendamentos_pendentes_expirados_filter = Q(status_agendamento='pendente') & (
-            Q(data_fim__lt=now.date()) | Q(data_fim=now.date(), hora_fim__lt=now.time())
-        )
-        Agendamento.objects.filter(agendamentos_pendentes_expirados_filter).update(status_agendamento='negado')
-
-        return AgendamentoPai.objects.select_related('id_recurso', 'id_usuario').prefetch_related('agendamentos_filhos').order_by('-data_criacao')
+        return AgendamentoPai.objects.select_related('id_recurso', 'id_usuario').prefetch_related(_filhos_com_status_efetivo()).order_by(*self.ordenacao_chave)
 
 class AdminAgendamentoStatusUpdateView(generics.UpdateAPIView):
     """
@@ -154,18 +146,29 @@ class AdminAgendamentoStatusUpdateView(generics.UpdateAPIView):
         if novo_status not in ['aprovado', 'negado', 'cancelado']:
             return Response({"error": "Status inválido. Use 'aprovado', 'negado' ou 'cancelado'."}, status=status.HTTP_400_BAD_REQUEST)
         
-        with transaction.atomic():
+        if novo_status == 'aprovado' and status_efetivo(instance) != instance.status_agendamento:
+            return Response({"error": "O horário deste agendamento já passou."}, status=status.HTTP_400_BAD_REQUEST)
+
+        def aplicar():
+            if novo_status == 'aprovado':
+                travar_recursos(instance.id_recurso_id)
+            # Relê o status sob a trava: o usuário pode ter cancelado desde a leitura
+            atual = Agendamento.objects.select_for_update().only('status_agendamento').get(pk=instance.pk)
+            if atual.status_agendamento != instance.status_agendamento:
+                return Response(
+                    {"error": "O agendamento foi alterado por outra operação. Atualize e tente novamente."},
+                    status=status.HTTP_409_CONFLICT
+                )
+
             if novo_status == 'aprovado':
                 ag_pai = instance.agendamento_pai
-                conflitos = Agendamento.objects.filter(
-                    agendamento_pai__id_recurso=ag_pai.id_recurso,
-                    data_inicio=instance.data_inicio,
-                    hora_inicio__lt=instance.hora_fim,
-                    hora_fim__gt=instance.hora_inicio,
-                    status_agendamento='aprovado'
-                ).exclude(id_agendamento=instance.id_agendamento)
-                
-                if conflitos.exists():
+                conflito = primeiro_conflito(
+                    ag_pai.id_recurso_id,
+                    [instance],
+                    excluir_ids=[instance.id_agendamento]
+                )
+
+                if conflito:
                     return Response(
                         {"error": "Este horário já foi aprovado para outro agendamento."},
                         status=status.HTTP_409_CONFLICT
@@ -173,8 +176,16 @@ class AdminAgendamentoStatusUpdateView(generics.UpdateAPIView):
 
             instance.status_agendamento = novo_status
             instance.gerenciado_por = request.user
-            instance.save()
-            
+            try:
+                with transaction.atomic():
+                    instance.save(update_fields=['status_agendamento', 'gerenciado_por', 'data_ultima_atualizacao'])
+            except IntegrityError:
+                # Restrição de exclusão do PostgreSQL: outro admin aprovou o horário antes
+                return Response(
+                    {"error": "Este horário já foi aprovado para outro agendamento."},
+                    status=status.HTTP_409_CONFLICT
+                )
+
             agendamento_pai = instance.agendamento_pai
             mensagem = f"O status do seu agendamento para '{agendamento_pai.id_recurso.nome_recurso}' no dia {instance.data_inicio.strftime('%d/%m/%Y')} foi atualizado para '{novo_status}'."
             criar_e_enviar_notificacao(agendamento_pai.id_usuario, agendamento_pai, mensagem)
@@ -182,6 +193,10 @@ class AdminAgendamentoStatusUpdateView(generics.UpdateAPIView):
             if novo_status == 'aprovado':
                 _negar_conflitos_em_massa([instance])
 
+        resposta = executar_com_retentativas(aplicar)
+        if resposta is not None:
+            return resposta
+
         return Response(self.get_serializer(instance).data)
 
 class AdminAgendamentoPaiManageView(generics.RetrieveUpdateDestroyAPIView):
@@ -212,27 +227,120 @@ class AdminAgendamentoPaiManageView(generics.RetrieveUpdateDestroyAPIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            with transaction.atomic():
-                agendamentos_pendentes = instance.agendamentos_filhos.filter(status_agendamento='pendente')
-                agendamentos_para_atualizar = list(agendamentos_pendentes)
-
-                if agendamentos_para_atualizar:
-                    agendamentos_pendentes.update(
-                        status_agendamento=novo_status,
-                        gerenciado_por=request.user
-                    )
-                    
+            def aplicar():
+                if novo_status == 'aprovado':
+                    travar_recursos(instance.id_recurso_id)
+                # Relê a série sob a trava, para decidir pelo status_serie atual
+                instance.status_serie = AgendamentoPai.objects.select_for_update().values_list(
+                    'status_serie', flat=True
+                ).get(pk=instance.pk)
+                # Pendentes cujo horário já passou contam como negados, mesmo antes da expiração gravada
+                agendamentos_para_atualizar = list(
+                    com_status_efetivo(instance.agendamentos_filhos.all())
+                    .filter(status_efetivo=StatusAgendamento.PENDENTE)
+                )
+                agendamentos_pendentes = Agendamento.objects.filter(
+                    id_agendamento__in=[agendamento.pk for agendamento in agendamentos_para_atualizar],
+                    status_agendamento=StatusAgendamento.PENDENTE
+                )
+                # Série longa: a decisão vale também para as ocorrências ainda não gravadas
+                serie_pendente = instance.status_serie == StatusAgendamento.PENDENTE
+
+                if agendamentos_para_atualizar or serie_pendente:
+                    if novo_status == 'aprovado' and (
+                        primeiro_conflito(instance.id_recurso_id, agendamentos_para_atualizar)
+                        or (serie_pendente and conflito_da_serie(instance))
+                    ):
+                        return Response(
+                            {"error": "Um ou mais horários desta solicitação já foram aprovados para outro agendamento."},
+                            status=status.HTTP_409_CONFLICT
+                        )
+
+                    try:
+                        with transaction.atomic():
+                            agendamentos_pendentes.update(
+                                status_agendamento=novo_status,
+                                gerenciado_por=request.user
+                            )
+                            if serie_pendente:
+                                AgendamentoPai.objects.filter(pk=instance.pk).update(status_serie=novo_status)
+                            invalidar_recursos(instance.id_recurso_id)
+                    except IntegrityError:
+                        return Response(
+                            {"error": "Um ou mais horários desta solicitação já foram aprovados para outro agendamento."},
+                            status=status.HTTP_409_CONFLICT
+                        )
+
                     if novo_status == 'aprovado':
                         _negar_conflitos_em_massa(agendamentos_para_atualizar)
                     
                     mensagem = f"Todos os horários pendentes da sua solicitação para '{instance.id_recurso.nome_recurso}' foram atualizados para '{novo_status}'."
                     criar_e_enviar_notificacao(instance.id_usuario, instance, mensagem)
 
+            resposta = executar_com_retentativas(aplicar)
+            if resposta is not None:
+                return resposta
+
             instance.refresh_from_db()
             serializer = AdminAgendamentoPaiSerializer(instance)
             return Response(serializer.data)
-        
-        return super().update(request, *args, **kwargs)
+
+        try:
+            return super().update(request, *args, **kwargs)
+        except IntegrityError:
+            # Restrição de exclusão do PostgreSQL: um horário foi aprovado para outro agendamento
+            return Response(
+                {"error": "Um ou mais horários desta solicitação já foram aprovados para outro agendamento."},
+                status=status.HTTP_409_CONFLICT
+            )
+
+class AdminAgendamentoDecisaoLoteView(APIView):
+    """
+    Endpoint para o administrador aprovar ou negar, em uma única transação,
+    os horários pendentes de várias solicitações e/ou horários avulsos
+    (ver booking.decisao_lote)
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAdministrador]
+
+    def post(self, request):
+        serializer = DecisaoEmLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+
+        try:
+            resultado = executar_com_retentativas(lambda: decidir_em_lote(
+                dados['status_agendamento'], request.user,
+                ids_agendamento_pai=dados['ids_agendamento_pai'], ids_agendamento=dados['ids_agendamento']
+            ))
+        except IntegrityError:
+            return Response(
+                {"error": "Um ou mais horários do lote já foram aprovados para outro agendamento."},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        rotulos = {
+            'aprovados': 'horário(s) aprovado(s)',
+            'negados': 'horário(s) negado(s)',
+            'negados_por_conflito': 'horário(s) negado(s) por conflito',
+        }
+        decisoes = defaultdict(dict)
+        for chave, rotulo in rotulos.items():
+            for agendamento in resultado[chave]:
+                decisoes[agendamento.agendamento_pai].setdefault(rotulo, []).append(agendamento)
+        # Decisões sobre a série inteira, mesmo sem horário gravado pendente
+        rotulo_serie = 'ocorrências futuras aprovadas' if dados['status_agendamento'] == 'aprovado' else 'ocorrências futuras negadas'
+        for pai in resultado['series_decididas']:
+            decisoes[pai].setdefault(rotulo_serie, [])
+        for pai in resultado['series_com_conflito']:
+            decisoes[pai].setdefault('não aprovada: a série tem conflito com horários já aprovados', [])
+        notificar_decisoes_em_lote(decisoes)
+
+        return Response({
+            **{chave: [agendamento.id_agendamento for agendamento in resultado[chave]] for chave in rotulos},
+            'series_com_conflito': [pai.id_agendamento_pai for pai in resultado['series_com_conflito']],
+        })
+
 
 class UserAgendamentoPaiStatusUpdateView(generics.UpdateAPIView):
     """
@@ -255,20 +363,11 @@ class UserAgendamentoPaiStatusUpdateView(generics.UpdateAPIView):
         # Apenas horários aprovados ou pendentes podem ser alterados para concluído/cancelado
         status_para_alterar = ['aprovado', 'pendente']
         instance.agendamentos_filhos.filter(status_agendamento__in=status_para_alterar).update(status_agendamento=novo_status)
-
-        # Se cancelou, verifica se o recurso pode voltar a ficar disponível
-        if novo_status == 'cancelado':
-            recurso = instance.id_recurso
-            # Só restaura DISPONÍVEL se estiver RESERVADO e sem outras reservas aprovadas
-            if recurso.status_recurso == StatusRecurso.RESERVADO:
-                outras_reservas_ativas = Agendamento.objects.filter(
-                    agendamento_pai__id_recurso=recurso,
-                    status_agendamento='aprovado'
-                ).exists()
-
-                if not outras_reservas_ativas:
-                    recurso.status_recurso = StatusRecurso.DISPONIVEL
-                    recurso.save(update_fields=['status_recurso'])
+        # Encerra também as ocorrências ainda não gravadas de uma série longa
+        AgendamentoPai.objects.filter(
+            pk=instance.pk, status_serie__in=STATUS_SERIE_ATIVA
+        ).update(status_serie=novo_status)
+        invalidar_recursos(instance.id_recurso_id)
 
         instance.refresh_from_db()
         return Response(self.get_serializer(instance).data)
@@ -297,26 +396,14 @@ class UserAgendamentoStatusUpdateView(generics.UpdateAPIView):
 
         instance.status_agendamento = novo_status
         instance.save()
-        
-        if novo_status == 'cancelado':
-            recurso = instance.agendamento_pai.id_recurso
-            # Só restaura DISPONÍVEL se estiver RESERVADO e sem outras reservas aprovadas
-            if recurso.status_recurso == StatusRecurso.RESERVADO:
-                outras_reservas_ativas = Agendamento.objects.filter(
-                    agendamento_pai__id_recurso=recurso,
-                    status_agendamento='aprovado'
-                ).exists()
-
-                if not outras_reservas_ativas:
-                    recurso.status_recurso = StatusRecurso.DISPONIVEL
-                    recurso.save(update_fields=['status_recurso'])
 
         return Response(self.get_serializer(instance).data)
 
 class RecursoDisponibilidadeView(APIView):
     """
     Retorna os intervalos de horários já agendados e aprovados para um recurso
-    em um mês/ano específico.
+    em um mês/ano específico. A resposta fica em cache sob a versão atual do
+    recurso (ver booking.cache).
     """
     permission_classes = [permissions.IsAuthenticated]
 
@@ -324,16 +411,28 @@ class RecursoDisponibilidadeView(APIView):
         try:
             ano = int(request.query_params.get('ano'))
             mes = int(request.query_params.get('mes'))
+            primeiro_dia = date(ano, mes, 1)
         except (TypeError, ValueError):
             return Response({'error': 'Parâmetros "ano" e "mes" são obrigatórios.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
+            chave = chave_resposta('disponibilidade', recurso_id, ano, mes) if respostas_em_cache() else None
+            booked_slots = cache.get(chave) if chave else None
+            if booked_slots is not None:
+                return Response(booked_slots)
+
+            # Intervalo de datas em vez de __year/__month, para usar o índice de aprovados
+            ultimo_dia = primeiro_dia.replace(day=monthrange(ano, mes)[1])
             agendamentos_aprovados = Agendamento.objects.filter(
-                agendamento_pai__id_recurso=recurso_id,
-                data_inicio__year=ano,
-                data_inicio__month=mes,
+                id_recurso=recurso_id,
+                data_inicio__range=(primeiro_dia, ultimo_dia),
                 status_agendamento='aprovado'
             ).values('data_inicio', 'hora_inicio', 'hora_fim')
+            # Séries aprovadas ainda não gravadas além do horizonte são respondidas pela regra
+            agendamentos_aprovados = list(agendamentos_aprovados) + [
+                {'data_inicio': ocorrencia.data_inicio, 'hora_inicio': ocorrencia.hora_inicio, 'hora_fim': ocorrencia.hora_fim}
+                for ocorrencia in ocorrencias_virtuais(recurso_id, primeiro_dia, ultimo_dia)
+            ]
 
             booked_slots = defaultdict(list)
             for agendamento in agendamentos_aprovados:
@@ -343,12 +442,54 @@ class RecursoDisponibilidadeView(APIView):
                     'end': agendamento['hora_fim'].strftime('%H:%M')
                 })
 
+            booked_slots = dict(booked_slots)
+            if chave:
+                cache.set(chave, booked_slots, TTL_RESPOSTA)
             return Response(booked_slots)
         except Exception:
             logger.exception('Erro ao consultar disponibilidade do recurso %s', recurso_id)
             return Response({'error': 'Erro interno ao consultar disponibilidade.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class HorariosLivresView(APIView):
+    """
+    Retorna as primeiras janelas livres de um recurso com pelo menos `duracao`
+    minutos entre `inicio` e `fim`, dentro do horário de funcionamento
+    (`abertura` e `fechamento`).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, recurso_id):
+        params = request.query_params
+        hoje = timezone.localdate()
+        try:
+            inicio = date.fromisoformat(params['inicio']) if 'inicio' in params else hoje
+            fim = date.fromisoformat(params['fim']) if 'fim' in params else inicio + timedelta(days=30)
+            duracao = int(params.get('duracao', 60))
+            quantidade = int(params.get('quantidade', 5))
+            abertura = time.fromisoformat(params['abertura']) if 'abertura' in params else HORARIO_ABERTURA
+            fechamento = time.fromisoformat(params['fechamento']) if 'fechamento' in params else HORARIO_FECHAMENTO
+        except ValueError:
+            return Response(
+                {'error': 'Parâmetros inválidos. Use datas AAAA-MM-DD, horários HH:MM e números inteiros.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if fim < inicio or (fim - inicio).days > 366:
+            return Response({'error': 'O período deve ter "fim" após "inicio" e no máximo 366 dias.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= duracao <= 24 * 60 or not 1 <= quantidade <= 50 or fechamento <= abertura:
+            return Response(
+                {'error': 'Use "duracao" entre 1 e 1440 minutos, "quantidade" entre 1 e 50 e "fechamento" após "abertura".'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        janelas = buscar_horarios_livres(recurso_id, inicio, fim, duracao, quantidade, abertura, fechamento)
+        return Response([
+            {'data': dia.strftime('%Y-%m-%d'), 'start': inicio_janela.strftime('%H:%M'), 'end': fim_janela.strftime('%H:%M')}
+            for dia, inicio_janela, fim_janela in janelas
+        ])
+
+
 class RegistrarUsoImediatoView(APIView):
     """
     POST: Registra uso imediato de um recurso (Terceirizado).
@@ -360,28 +501,24 @@ class RegistrarUsoImediatoView(APIView):
         serializer = UsoImediatoSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        # Verifica se o recurso está disponível (com lock pessimista)
+        # Verifica se o recurso está disponível e livre agora, com o recurso travado
         recurso_id = serializer.validated_data['id_recurso'].pk
         with transaction.atomic():
-            recurso = Recurso.objects.select_for_update().get(pk=recurso_id)
-            if recurso.status_recurso != StatusRecurso.DISPONIVEL:
+            travar_recursos(recurso_id)
+            recurso = com_ocupacao(Recurso.objects.filter(pk=recurso_id)).get()
+            if recurso.status_recurso != StatusRecurso.DISPONIVEL or recurso.ocupado:
                 return Response(
                     {'error': 'Este recurso não está disponível no momento.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            recurso.status_recurso = StatusRecurso.RESERVADO
-            recurso.save(update_fields=['status_recurso'])
             uso = serializer.save(id_usuario=request.user, id_recurso=recurso)
 
         return Response(UsoImediatoSerializer(uso).data, status=status.HTTP_201_CREATED)
 
     def get(self, request):
         # Auto-finaliza usos expirados
-        usos_ativos = UsoImediato.objects.filter(id_usuario=request.user, ativo=True)
-        for uso in usos_ativos:
-            if uso.expirado:
-                uso.finalizar()
+        finalizar_usos_expirados()
 
         usos = UsoImediato.objects.filter(id_usuario=request.user)
         serializer = UsoImediatoSerializer(usos, many=True)
@@ -404,4 +541,18 @@ class FinalizarUsoImediatoView(APIView):
             return Response({'error': 'Este uso já foi finalizado.'}, status=status.HTTP_400_BAD_REQUEST)
 
         uso.finalizar()
-        return Response(UsoImediatoSerializer(uso).data)
\ No newline at end of file
+        return Response(UsoImediatoSerializer(uso).data)
+
+
+class ExpirarAgendamentosCronView(RotaDeCron):
+    """Expira agendamentos e usos imediatos vencidos (o mesmo que `python manage.py expirar_agendamentos`)."""
+
+    def executar(self):
+        return {**expirar_agendamentos(), 'usos_finalizados': finalizar_usos_expirados()}
+
+
+class MaterializarSeriesCronView(RotaDeCron):
+    """Avança o horizonte das séries longas (o mesmo que `python manage.py materializar_series`)."""
+
+    def executar(self):
+        return {'ocorrencias': materializar_series()}
@@ -7,4 +7,15 @@ pip install -r requirements.txt
 python manage.py check --deploy
 python manage.py collectstatic --no-input
 python manage.py migrate
-python manage.py create_admin
\ No newline at end of file
+python manage.py create_admin
+
+# Tarefas periódicas. Na Vercel elas são os crons de vercel.json, que exigem a
+# variável CRON_SECRET no projeto (sem ela as rotas respondem 401 e nada roda):
+#   GET /api/cron/enviar-emails/          a cada 5 min (saída email_pendente)
+#   GET /api/cron/expirar-agendamentos/   a cada 5 min (expiração de status)
+#   GET /api/cron/materializar-series/    diário (horizonte das séries longas)
+# O plano Hobby só aceita crons diários: nele, use um agendador externo
+# chamando as mesmas rotas com "Authorization: Bearer $CRON_SECRET".
+# Fora da Vercel, mantenha em execução "python manage.py enviar_emails --loop"
+# e "python manage.py expirar_agendamentos --loop", e agende diariamente
+# "python manage.py materializar_series".
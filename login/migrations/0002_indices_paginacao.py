@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('login', '0001_initial'),
+        ('user_profile', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['nome', 'id_usuario'], name='usuario_nome_idx'),
+        ),
+    ]
@@ -56,4 +56,5 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False)
 
     class Meta:
-        db_table = 'usuario'
\ No newline at end of file
+        db_table = 'usuario'
+        indexes = [models.Index(fields=['nome', 'id_usuario'], name='usuario_nome_idx')]
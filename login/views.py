@@ -16,6 +16,7 @@ from django.contrib.auth import authenticate
 from rest_framework_simplejwt.views import TokenRefreshView
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from django.conf import settings
+from alocai.paginacao import PaginacaoPorChave
 
 from .models import Usuario
 from user_profile.models import PerfilAcesso
@@ -324,9 +325,13 @@ class UserListView(generics.ListAPIView):
     """
     Endpoint para o admin listar todos os usuários.
     """
-    queryset = Usuario.objects.all().order_by('nome')
     serializer_class = UserAdminSerializer
     permission_classes = [IsAdministrador]
+    pagination_class = PaginacaoPorChave
+    ordenacao_chave = ('nome', 'id_usuario')
+
+    def get_queryset(self):
+        return Usuario.objects.order_by(*self.ordenacao_chave)
 
 def health_check(request):
     """
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Notificacao
+from .models import EmailPendente, Notificacao
 
 
 @admin.register(Notificacao)
@@ -12,3 +12,12 @@ class NotificacaoAdmin(admin.ModelAdmin):
     def mensagem_curta(self, obj):
         return obj.mensagem[:80] + '...' if len(obj.mensagem) > 80 else obj.mensagem
     mensagem_curta.short_description = 'Mensagem'
+
+
+
+@admin.register(EmailPendente)
+class EmailPendenteAdmin(admin.ModelAdmin):
+    list_display = ('id_email', 'destinatario', 'assunto', 'tentativas', 'proxima_tentativa', 'enviado_em')
+    list_filter = ('enviado_em', 'data_criacao')
+    search_fields = ('destinatario', 'assunto')
+    readonly_fields = ('data_criacao',)
@@ -0,0 +1,149 @@
+"""
+Envio dos e-mails de notificação.
+
+As notificações não falam com o servidor SMTP: gravam um EmailPendente na
+mesma transação da Notificacao (ver notification.utils), e o comando
+`python manage.py enviar_emails` esvazia essa saída em lotes, fora do ciclo
+das requisições. Cada lote usa uma única conexão com o servidor.
+
+Em produção (Vercel) a saída é esvaziada pela rota de cron
+/api/cron/enviar-emails/ (ver vercel.json), protegida por CRON_SECRET; em
+servidores próprios, pelo comando em modo --loop ou agendado.
+
+Um e-mail que falha volta para a fila com espera crescente (ESPERA_INICIAL,
+dobrando a cada tentativa) até MAX_TENTATIVAS; depois disso fica na tabela,
+com o último erro, sem novas tentativas. Só erros da própria mensagem contam
+como tentativa: se a conexão com o servidor não abre, o lote é adiado por
+ESPERA_CONEXAO sem consumir tentativas, de modo que uma indisponibilidade do
+SMTP não descarta a fila.
+
+Antes de enviar, o lote é reservado adiantando `proxima_tentativa` em
+RESERVA, para que dois workers não enviem o mesmo e-mail; se o worker morrer
+no meio do lote, os e-mails ainda não enviados voltam à fila quando a reserva
+vence. Cada envio bem-sucedido é gravado na hora, para que nenhum e-mail já
+entregue seja reenviado.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import EmailPendente
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_LOTE = 50
+MAX_TENTATIVAS = 5
+ESPERA_INICIAL = timedelta(minutes=1)
+RESERVA = timedelta(minutes=10)
+ESPERA_CONEXAO = timedelta(minutes=1)
+
+
+def _reservar_lote(agora, tamanho_lote):
+    """Seleciona os e-mails devidos e adia sua próxima tentativa em RESERVA."""
+    with transaction.atomic():
+        pendentes = EmailPendente.objects.filter(
+            enviado_em__isnull=True, tentativas__lt=MAX_TENTATIVAS, proxima_tentativa__lte=agora
+        ).order_by('proxima_tentativa', 'id_email')
+        if connection.features.has_select_for_update_skip_locked:
+            pendentes = pendentes.select_for_update(skip_locked=True)
+        lote = list(pendentes[:tamanho_lote])
+        if lote:
+            EmailPendente.objects.filter(pk__in=[email.pk for email in lote]).update(proxima_tentativa=agora + RESERVA)
+    return lote
+
+
+def _montar_mensagem(email, conexao):
+    mensagem = EmailMultiAlternatives(
+        subject=email.assunto,
+        body=email.mensagem,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[email.destinatario],
+        connection=conexao
+    )
+    if email.html:
+        mensagem.attach_alternative(email.html, 'text/html')
+    return mensagem
+
+
+def _registrar_falha(email, erro, agora):
+    email.tentativas += 1
+    email.erro = str(erro)
+    email.proxima_tentativa = agora + ESPERA_INICIAL * 2 ** (email.tentativas - 1)
+    logger.warning(
+        'Falha ao enviar e-mail de notificação para %s (tentativa %s de %s): %s',
+        email.destinatario, email.tentativas, MAX_TENTATIVAS, erro
+    )
+
+
+def _marcar_enviado(email):
+    EmailPendente.objects.filter(pk=email.pk).update(enviado_em=timezone.now(), erro='')
+
+
+def enviar_emails_pendentes(tamanho_lote=TAMANHO_LOTE, agora=None, fim=None):
+    """
+    Envia um lote de e-mails devidos por uma única conexão. Retorna um dict
+    com as quantidades 'enviados' e 'falhas'.
+
+    `fim` (em time.monotonic()) interrompe o lote: os e-mails reservados e
+    ainda não enviados voltam imediatamente para a fila.
+    """
+    agora = agora or timezone.now()
+    lote = _reservar_lote(agora, tamanho_lote)
+    if not lote:
+        return {'enviados': 0, 'falhas': 0}
+
+    conexao = get_connection(fail_silently=False)
+    try:
+        conexao.open()
+    except Exception as erro:
+        # Sem conexão, o lote inteiro volta para a fila sem consumir tentativas
+        logger.warning('Falha ao conectar ao servidor de e-mail; %s e-mail(s) adiado(s): %s', len(lote), erro)
+        EmailPendente.objects.filter(pk__in=[email.pk for email in lote]).update(
+            erro=str(erro), proxima_tentativa=agora + ESPERA_CONEXAO
+        )
+        return {'enviados': 0, 'falhas': len(lote)}
+
+    enviados, falhas = [], []
+    try:
+        # Um envio por mensagem, na mesma conexão, para saber qual falhou
+        for posicao, email in enumerate(lote):
+            if fim is not None and time.monotonic() >= fim:
+                devolvidos = [pendente.pk for pendente in lote[posicao:]]
+                EmailPendente.objects.filter(pk__in=devolvidos).update(proxima_tentativa=agora)
+                break
+            try:
+                conexao.send_messages([_montar_mensagem(email, conexao)])
+            except Exception as erro:
+                _registrar_falha(email, erro, agora)
+                falhas.append(email)
+            else:
+                _marcar_enviado(email)
+                enviados.append(email)
+    finally:
+        conexao.close()
+
+    if falhas:
+        EmailPendente.objects.bulk_update(falhas, ['tentativas', 'erro', 'proxima_tentativa'])
+
+    return {'enviados': len(enviados), 'falhas': len(falhas)}
+
+
+def esvaziar_fila(tamanho_lote=TAMANHO_LOTE, prazo_segundos=None):
+    """
+    Envia lotes até não restar e-mail devido ou, com `prazo_segundos`, até o
+    prazo acabar (para caber no tempo de uma função serverless). Retorna o
+    total de 'enviados' e 'falhas'.
+    """
+    fim = time.monotonic() + prazo_segundos if prazo_segundos is not None else None
+    totais = {'enviados': 0, 'falhas': 0}
+    while True:
+        lote = enviar_emails_pendentes(tamanho_lote=tamanho_lote, fim=fim)
+        totais['enviados'] += lote['enviados']
+        totais['falhas'] += lote['falhas']
+        if lote['enviados'] + lote['falhas'] < tamanho_lote or (fim is not None and time.monotonic() >= fim):
+            return totais
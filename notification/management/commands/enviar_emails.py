@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notification.envio import TAMANHO_LOTE, esvaziar_fila
+
+
+class Command(BaseCommand):
+    help = 'Envia os e-mails de notificação pendentes, em lotes, por uma única conexão por lote.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Executa continuamente, aguardando --intervalo segundos entre as execuções.'
+        )
+        parser.add_argument('--intervalo', type=int, default=10, help='Segundos entre execuções no modo --loop.')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help='Quantidade máxima de e-mails por conexão.')
+
+    def handle(self, *args, **options):
+        while True:
+            totais = esvaziar_fila(tamanho_lote=options['lote'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{totais['enviados']} e-mail(s) enviado(s), {totais['falhas']} falha(s)."
+            ))
+            if not options['loop']:
+                return
+            time.sleep(options['intervalo'])
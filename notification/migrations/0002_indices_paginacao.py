@@ -0,0 +1,20 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0010_indices_paginacao'),
+        ('notification', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacao',
+            index=models.Index(fields=['destinatario', 'data_criacao', 'id_notificacao'], name='notificacao_destinatario_idx'),
+        ),
+    ]
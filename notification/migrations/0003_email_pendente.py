@@ -0,0 +1,34 @@
+# Generated by Django 5.2.2 on 2026-10-18 12:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification', '0002_indices_paginacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailPendente',
+            fields=[
+                ('id_email', models.AutoField(primary_key=True, serialize=False)),
+                ('destinatario', models.EmailField(max_length=254)),
+                ('assunto', models.CharField(max_length=255)),
+                ('mensagem', models.TextField()),
+                ('html', models.TextField(blank=True)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now)),
+                ('enviado_em', models.DateTimeField(blank=True, null=True)),
+                ('erro', models.TextField(blank=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'email_pendente',
+                'ordering': ['proxima_tentativa', 'id_email'],
+                'indexes': [models.Index(condition=models.Q(('enviado_em__isnull', True)), fields=['proxima_tentativa', 'id_email'], name='email_pendente_fila_idx')],
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from booking.models import AgendamentoPai
 
 class Notificacao(models.Model):
@@ -23,6 +24,42 @@ class Notificacao(models.Model):
     class Meta:
         db_table = 'notificacao'
         ordering = ['-data_criacao']
+        indexes = [
+            models.Index(
+                fields=['destinatario', 'data_criacao', 'id_notificacao'],
+                name='notificacao_destinatario_idx'
+            ),
+        ]
 
     def __str__(self):
-        return f"Notificação para {self.destinatario.nome}: {self.mensagem}"
\ No newline at end of file
+        return f"Notificação para {self.destinatario.nome}: {self.mensagem}"
+
+class EmailPendente(models.Model):
+    """
+    Saída de e-mails: gravada na mesma transação da notificação e enviada
+    depois pelo comando `enviar_emails` (ver notification.envio).
+    """
+    id_email = models.AutoField(primary_key=True)
+    destinatario = models.EmailField()
+    assunto = models.CharField(max_length=255)
+    mensagem = models.TextField()
+    html = models.TextField(blank=True)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+    erro = models.TextField(blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'email_pendente'
+        ordering = ['proxima_tentativa', 'id_email']
+        indexes = [
+            models.Index(
+                fields=['proxima_tentativa', 'id_email'],
+                name='email_pendente_fila_idx',
+                condition=models.Q(enviado_em__isnull=True)
+            ),
+        ]
+
+    def __str__(self):
+        return f"E-mail para {self.destinatario}: {self.assunto}"
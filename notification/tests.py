@@ -1,10 +1,11 @@
 from django.urls import reverse
+from django.test import override_settings
 from rest_framework import status
 from unittest.mock import patch
 from login.models import Usuario
 from resources.models import Recurso
 from booking.models import AgendamentoPai
-from .models import Notificacao
+from .models import EmailPendente, Notificacao
 from .utils import criar_e_enviar_notificacao
 from alocai.test_base import BaseTestCase
 
@@ -46,18 +47,21 @@ class NotificationAPITestCase(BaseTestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
-    @patch('notification.utils.threading.Thread')
-    def test_utilitario_criar_e_enviar_notificacao(self, mock_thread):
+    @override_settings(EMAIL_HOST_USER='test@host.com')
+    def test_utilitario_criar_e_enviar_notificacao(self):
         recurso = Recurso.objects.create(nome_recurso="Recurso para Notif")
         ag_pai = AgendamentoPai.objects.create(id_usuario=self.server_user, id_recurso=recurso, id_responsavel=self.server_user)
 
         criar_e_enviar_notificacao(self.server_user, ag_pai, "Mensagem de teste")
         
         self.assertTrue(Notificacao.objects.filter(destinatario=self.server_user, mensagem="Mensagem de teste").exists())
-        self.assertTrue(mock_thread.called)
+        email = EmailPendente.objects.get()
+        self.assertEqual(email.destinatario, self.server_user.email)
+        self.assertIn('Mensagem de teste', email.html)
+        self.assertIsNone(email.enviado_em)
 
-    @patch('notification.utils.threading.Thread')
-    def test_notificar_admins_cria_notificacao_por_admin(self, mock_thread):
+    @override_settings(EMAIL_HOST_USER='test@host.com')
+    def test_notificar_admins_cria_notificacao_por_admin(self):
         from notification.utils import notificar_admins
         recurso = Recurso.objects.create(nome_recurso="Recurso Admins")
         ag_pai = AgendamentoPai.objects.create(id_usuario=self.server_user, id_recurso=recurso, id_responsavel=self.server_user)
@@ -65,9 +69,10 @@ class NotificationAPITestCase(BaseTestCase):
         notificar_admins(ag_pai, "Nova solicitação")
 
         self.assertEqual(Notificacao.objects.filter(agendamento_pai=ag_pai).count(), 1)
+        self.assertEqual(list(EmailPendente.objects.values_list('destinatario', flat=True)), [self.admin_user.email])
 
-    @patch('notification.utils.threading.Thread')
-    def test_criar_notificacao_resumida_conflito(self, mock_thread):
+    @override_settings(EMAIL_HOST_USER='')
+    def test_criar_notificacao_resumida_conflito(self):
         from notification.utils import criar_notificacao_resumida_conflito
         from booking.models import Agendamento
         from datetime import date, time
@@ -82,6 +87,7 @@ class NotificationAPITestCase(BaseTestCase):
         criar_notificacao_resumida_conflito(self.server_user, ag_pai, [ag1])
 
         self.assertEqual(Notificacao.objects.filter(destinatario=self.server_user, agendamento_pai=ag_pai).count(), 1)
+        self.assertFalse(EmailPendente.objects.exists())
 
     def test_marcar_notificacao_individual_como_lida(self):
         self.client.force_authenticate(user=self.server_user)
@@ -201,6 +207,78 @@ class NotificationUtilsTestCase(BaseTestCase):
         html = _build_email_html(self.ag_pai, 'Msg', saudacao='Olá Admin,')
         self.assertIn('Olá Admin,', html)
 
+    def _criar_serie(self, quantidade):
+        from booking.models import Agendamento
+        from datetime import date, time, timedelta
+        inicio = date(2025, 3, 3)
+        Agendamento.objects.bulk_create([
+            Agendamento(
+                agendamento_pai=self.ag_pai, id_recurso=self.recurso,
+                data_inicio=inicio + timedelta(weeks=i), hora_inicio=time(8, 0),
+                data_fim=inicio + timedelta(weeks=i), hora_fim=time(10, 0)
+            )
+            for i in range(quantidade)
+        ])
+
+    def test_build_email_html_resume_serie_longa_por_agregacao(self):
+        from notification.utils import _build_email_html
+        self._criar_serie(12)
+        pai = AgendamentoPai.objects.select_related('id_usuario', 'id_recurso').get(pk=self.ag_pai.pk)
+
+        # Primeiros horários e agregação (quantidade, primeira e última data)
+        with self.assertNumQueries(2):
+            html = _build_email_html(pai, 'Mensagem')
+        self.assertIn('12 agendamentos', html)
+        self.assertIn('03/03/2025', html)
+        self.assertIn('19/05/2025', html)
+
+    def test_build_email_html_resume_serie_parcial_pela_regra(self):
+        from datetime import date
+        from notification.utils import _build_email_html
+        # 20 segundas a partir de 03/03/2025, das quais só 6 gravadas até o horizonte
+        self._criar_serie(6)
+        self.ag_pai.regra_recorrencia = {
+            'data_inicio': '2025-03-03', 'hora_inicio': '08:00:00', 'hora_fim': '10:00:00',
+            'dias_semana': [0], 'quantidade': 20,
+        }
+        self.ag_pai.materializado_ate = date(2025, 4, 7)
+        self.ag_pai.save()
+        pai = AgendamentoPai.objects.select_related('id_usuario', 'id_recurso').get(pk=self.ag_pai.pk)
+
+        with self.assertNumQueries(0):
+            html = _build_email_html(pai, 'Mensagem', filhos=[])
+        self.assertIn('20 agendamentos', html)
+        self.assertIn('03/03/2025', html)
+        self.assertIn('14/07/2025', html)
+
+        # Sem término, o resumo não enumera a regra indefinidamente
+        pai.regra_recorrencia.pop('quantidade')
+        self.assertIn('mais de 1000 agendamentos', _build_email_html(pai, 'Mensagem'))
+
+    @override_settings(EMAIL_HOST_USER='test@host.com')
+    def test_notificar_admins_consultas_nao_crescem_com_admins_nem_serie(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from notification.utils import notificar_admins
+
+        def consultas():
+            pai = AgendamentoPai.objects.get(pk=self.ag_pai.pk)
+            with CaptureQueriesContext(connection) as contexto:
+                notificar_admins(pai, 'Nova solicitação')
+            return len([q for q in contexto.captured_queries if 'SAVEPOINT' not in q['sql']])
+
+        self._criar_serie(8)
+        base = consultas()
+        for i in range(4):
+            Usuario.objects.create_user(email=f'admin{i}@teste.com', nome=f'Admin {i}', password='pw', id_perfil=self.admin_profile)
+        self._criar_serie(30)
+
+        self.assertEqual(consultas(), base)
+        emails = list(EmailPendente.objects.filter(destinatario='admin0@teste.com'))
+        self.assertEqual(len(emails), 1)
+        self.assertIn('Olá Admin 0,', emails[0].html)
+        self.assertIn('38 agendamentos', emails[0].html)
+
     @patch('notification.utils._disparar_email')
     def test_criar_e_enviar_notificacao_com_email_host(self, mock_email):
         from django.test import override_settings
@@ -230,4 +308,155 @@ class NotificationUtilsTestCase(BaseTestCase):
         )
         with override_settings(EMAIL_HOST_USER='test@host.com'):
             criar_notificacao_resumida_conflito(self.server_user, self.ag_pai, [ag])
-        mock_email.assert_called_once()
\ No newline at end of file
+        mock_email.assert_called_once()
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class EnvioEmailsTestCase(BaseTestCase):
+
+    def _enfileirar(self, quantidade):
+        from notification.utils import _disparar_email
+        for i in range(quantidade):
+            _disparar_email(f'Assunto {i}', f'Texto {i}', f'dest{i}@teste.com', f'<p>Texto {i}</p>')
+
+    def test_envia_lote_por_uma_conexao(self):
+        from django.core import mail
+        from notification.envio import enviar_emails_pendentes
+        self._enfileirar(3)
+
+        with patch('notification.envio.get_connection', wraps=mail.get_connection) as mock_conexao:
+            totais = enviar_emails_pendentes()
+
+        self.assertEqual(totais, {'enviados': 3, 'falhas': 0})
+        mock_conexao.assert_called_once()
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['dest0@teste.com', 'dest1@teste.com', 'dest2@teste.com'])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertFalse(EmailPendente.objects.filter(enviado_em__isnull=True).exists())
+
+        # Já enviados não são reenviados
+        self.assertEqual(enviar_emails_pendentes(), {'enviados': 0, 'falhas': 0})
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_respeita_tamanho_do_lote(self):
+        from django.core import mail
+        from notification.envio import enviar_emails_pendentes
+        self._enfileirar(3)
+
+        self.assertEqual(enviar_emails_pendentes(tamanho_lote=2)['enviados'], 2)
+        self.assertEqual(enviar_emails_pendentes(tamanho_lote=2)['enviados'], 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_falha_volta_para_fila_com_espera_crescente(self):
+        from django.core import mail
+        from django.core.mail.backends.locmem import EmailBackend
+        from django.utils import timezone
+        from notification.envio import ESPERA_INICIAL, MAX_TENTATIVAS, enviar_emails_pendentes
+        self._enfileirar(1)
+        agora = timezone.now()
+
+        with patch.object(EmailBackend, 'send_messages', side_effect=OSError('SMTP indisponível')):
+            self.assertEqual(enviar_emails_pendentes(agora=agora), {'enviados': 0, 'falhas': 1})
+        email = EmailPendente.objects.get()
+        self.assertEqual(email.tentativas, 1)
+        self.assertEqual(email.proxima_tentativa, agora + ESPERA_INICIAL)
+        self.assertIn('SMTP indisponível', email.erro)
+
+        # Antes da próxima tentativa nada é enviado
+        self.assertEqual(enviar_emails_pendentes(agora=agora)['enviados'], 0)
+
+        depois = email.proxima_tentativa
+        with patch.object(EmailBackend, 'send_messages', side_effect=OSError('SMTP indisponível')):
+            enviar_emails_pendentes(agora=depois)
+        email.refresh_from_db()
+        self.assertEqual(email.proxima_tentativa, depois + ESPERA_INICIAL * 2)
+
+        self.assertEqual(enviar_emails_pendentes(agora=email.proxima_tentativa)['enviados'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+        # Esgotadas as tentativas, o e-mail deixa a fila
+        self._enfileirar(1)
+        EmailPendente.objects.filter(enviado_em__isnull=True).update(tentativas=MAX_TENTATIVAS)
+        self.assertEqual(enviar_emails_pendentes(), {'enviados': 0, 'falhas': 0})
+
+    def test_falha_de_conexao_adia_sem_consumir_tentativas(self):
+        from django.core import mail
+        from django.core.mail.backends.locmem import EmailBackend
+        from django.utils import timezone
+        from notification.envio import ESPERA_CONEXAO, MAX_TENTATIVAS, enviar_emails_pendentes
+        self._enfileirar(2)
+        agora = timezone.now()
+
+        # Uma indisponibilidade longa do servidor não esgota as tentativas
+        with patch.object(EmailBackend, 'open', side_effect=OSError('conexão recusada')):
+            for _ in range(MAX_TENTATIVAS + 1):
+                self.assertEqual(enviar_emails_pendentes(agora=agora)['falhas'], 2)
+                agora += ESPERA_CONEXAO
+        self.assertFalse(EmailPendente.objects.exclude(tentativas=0).exists())
+        self.assertIn('conexão recusada', EmailPendente.objects.first().erro)
+
+        self.assertEqual(enviar_emails_pendentes(agora=agora)['enviados'], 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_envio_gravado_a_cada_email(self):
+        from django.core.mail.backends.locmem import EmailBackend
+        from notification.envio import enviar_emails_pendentes
+        self._enfileirar(3)
+        enviar = EmailBackend.send_messages
+        chamadas = []
+
+        def morre_no_segundo(backend, mensagens):
+            chamadas.append(mensagens)
+            if len(chamadas) == 2:
+                raise SystemExit('função encerrada')
+            return enviar(backend, mensagens)
+
+        # Se o processo morrer no meio do lote, o que já saiu não volta para a fila
+        with patch.object(EmailBackend, 'send_messages', morre_no_segundo), self.assertRaises(SystemExit):
+            enviar_emails_pendentes()
+        self.assertEqual(EmailPendente.objects.filter(enviado_em__isnull=False).count(), 1)
+
+    def test_prazo_devolve_o_resto_do_lote_a_fila(self):
+        import time
+        from django.core import mail
+        from django.utils import timezone
+        from notification.envio import enviar_emails_pendentes
+        self._enfileirar(2)
+        agora = timezone.now()
+
+        self.assertEqual(enviar_emails_pendentes(agora=agora, fim=time.monotonic()), {'enviados': 0, 'falhas': 0})
+        self.assertEqual(len(mail.outbox), 0)
+        # Sem esperar a reserva vencer
+        self.assertEqual(EmailPendente.objects.filter(proxima_tentativa=agora, tentativas=0).count(), 2)
+        self.assertEqual(enviar_emails_pendentes(agora=agora)['enviados'], 2)
+
+    def test_comando_esvazia_a_fila(self):
+        from io import StringIO
+        from django.core import mail
+        from django.core.management import call_command
+        self._enfileirar(5)
+        saida = StringIO()
+
+        call_command('enviar_emails', '--lote', '2', stdout=saida)
+
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertIn('5 e-mail(s) enviado(s), 0 falha(s).', saida.getvalue())
+
+    @override_settings(CRON_SECRET='segredo')
+    def test_rota_de_cron_exige_o_segredo(self):
+        from django.core import mail
+        self._enfileirar(2)
+        url = reverse('cron-enviar-emails')
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer errado').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(len(mail.outbox), 0)
+
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'enviados': 2, 'falhas': 0})
+        self.assertEqual(len(mail.outbox), 2)
+
+    @override_settings(CRON_SECRET='')
+    def test_rota_de_cron_desativada_sem_segredo(self):
+        response = self.client.get(reverse('cron-enviar-emails'), HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
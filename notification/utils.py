@@ -1,47 +1,66 @@
 import html
-import logging
-import threading
-from django.core.mail import send_mail
+from collections import defaultdict
+from itertools import islice
 from django.conf import settings
 from django.db import transaction
-from .models import Notificacao
+from django.db.models import Count, Max, Min
+from .models import EmailPendente, Notificacao
+from booking.recorrencia import LIMITE_OCORRENCIAS, expandir_regra, regra_de_json
 from login.models import Usuario
 
-logger = logging.getLogger(__name__)
 
-
-def _send_mail_async(subject, message, from_email, recipient_list, html_message):
-    try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=from_email,
-            recipient_list=recipient_list,
-            fail_silently=False,
-            html_message=html_message
-        )
-    except Exception as e:
-        logger.warning('Falha ao enviar e-mail de notificação para %s: %s', recipient_list, e)
+def _email_pendente(subject, mensagem_texto, destinatario_email, html_message):
+    return EmailPendente(
+        destinatario=destinatario_email,
+        assunto=subject,
+        mensagem=mensagem_texto,
+        html=html_message
+    )
 
 
 def _disparar_email(subject, mensagem_texto, destinatario_email, html_message):
-    thread = threading.Thread(
-        target=_send_mail_async,
-        args=(subject, mensagem_texto, settings.DEFAULT_FROM_EMAIL, [destinatario_email], html_message),
-        daemon=True
+    """
+    Coloca o e-mail na saída (EmailPendente), na transação corrente. O envio é
+    feito pelo comando `enviar_emails` (ver notification.envio).
+    """
+    _email_pendente(subject, mensagem_texto, destinatario_email, html_message).save()
+
+
+# Acima disso, os horários são resumidos em quantidade e período
+LIMITE_HORARIOS_LISTADOS = 5
+
+# Posição da saudação no corpo renderizado; o conteúdo vindo do banco é
+# escapado, então o comentário não aparece em nenhum outro lugar do HTML
+_MARCADOR_SAUDACAO = '<!-- saudacao -->'
+
+
+def _periodo_html(quantidade, primeira_data, ultima_data):
+    return (
+        f'<p>Esta solicitação contém <strong>{quantidade} agendamentos</strong> '
+        f'no período de <strong>{primeira_data.strftime("%d/%m/%Y")}</strong> '
+        f'até <strong>{ultima_data.strftime("%d/%m/%Y")}</strong>.</p>'
     )
-    thread.start()
 
 
-def _build_horarios_html(agendamentos):
-    """Renderiza a lista de horários de um agendamento como HTML."""
-    if len(agendamentos) > 5:
-        primeira_data = agendamentos[0].data_inicio.strftime('%d/%m/%Y')
-        ultima_data = agendamentos[-1].data_inicio.strftime('%d/%m/%Y')
+def _periodo_da_regra_html(agendamento_pai):
+    """
+    Resumo de uma série gravada só até o horizonte (ver booking.series): a
+    quantidade e o período vêm da regra, não das ocorrências já gravadas.
+    """
+    regra = regra_de_json(agendamento_pai.regra_recorrencia)
+    datas = list(islice(expandir_regra(regra), LIMITE_OCORRENCIAS + 1))
+    if len(datas) > LIMITE_OCORRENCIAS:
         return (
-            f'<p>Esta solicitação contém <strong>{len(agendamentos)} agendamentos</strong> '
-            f'no período de <strong>{primeira_data}</strong> até <strong>{ultima_data}</strong>.</p>'
+            f'<p>Esta solicitação contém <strong>mais de {LIMITE_OCORRENCIAS} agendamentos</strong> '
+            f'a partir de <strong>{datas[0].strftime("%d/%m/%Y")}</strong>.</p>'
         )
+    return _periodo_html(len(datas), datas[0], datas[-1])
+
+
+def _build_horarios_html(agendamentos):
+    """Renderiza a lista de horários de um agendamento como HTML."""
+    if len(agendamentos) > LIMITE_HORARIOS_LISTADOS:
+        return _periodo_html(len(agendamentos), agendamentos[0].data_inicio, agendamentos[-1].data_inicio)
     items = ''.join(
         f'<li>{ag.data_inicio.strftime("%d/%m/%Y")} das {ag.hora_inicio.strftime("%H:%M")} às {ag.hora_fim.strftime("%H:%M")}</li>'
         for ag in agendamentos
@@ -49,25 +68,46 @@ def _build_horarios_html(agendamentos):
     return f'<ul>{items}</ul>'
 
 
-def _build_email_html(agendamento_pai, mensagem, saudacao=''):
-    """Constrói o corpo HTML padrão de notificação de agendamento."""
+def _horarios_do_pai_html(agendamento_pai, filhos=None):
+    """
+    Horários de uma solicitação como HTML, sem carregar a série inteira: os
+    primeiros LIMITE_HORARIOS_LISTADOS + 1 horários decidem entre listar e
+    resumir, e o resumo vem de uma agregação (quantidade, primeira e última
+    data). `filhos`, quando informado (ex.: recém-criados em lote), dispensa
+    as consultas. Séries ainda não gravadas por inteiro são resumidas pela
+    regra.
+    """
+    if agendamento_pai.materializado_ate is not None and agendamento_pai.regra_recorrencia:
+        return _periodo_da_regra_html(agendamento_pai)
+    if filhos is not None:
+        return _build_horarios_html(sorted(filhos, key=lambda ag: (ag.data_inicio, ag.hora_inicio)))
+
+    filhos = agendamento_pai.agendamentos_filhos.order_by('data_inicio', 'hora_inicio')
+    primeiros = list(filhos.only('agendamento_pai', 'data_inicio', 'hora_inicio', 'hora_fim')[:LIMITE_HORARIOS_LISTADOS + 1])
+    if len(primeiros) <= LIMITE_HORARIOS_LISTADOS:
+        return _build_horarios_html(primeiros)
+
+    resumo = filhos.aggregate(quantidade=Count('pk'), primeira=Min('data_inicio'), ultima=Max('data_inicio'))
+    return _periodo_html(resumo['quantidade'], resumo['primeira'], resumo['ultima'])
+
+
+def _corpo_email_html(agendamento_pai, mensagem, filhos=None):
+    """
+    Renderiza o corpo HTML padrão de notificação de agendamento uma vez por
+    evento, com a saudação por destinatário a ser aplicada por `_com_saudacao`.
+    """
     solicitante = html.escape(agendamento_pai.id_usuario.nome)
     recurso = html.escape(agendamento_pai.id_recurso.nome_recurso)
     finalidade = html.escape(agendamento_pai.finalidade or '')
     observacoes = html.escape(agendamento_pai.observacoes or '') if agendamento_pai.observacoes else ''
-
-    agendamentos = list(
-        agendamento_pai.agendamentos_filhos.order_by('data_inicio', 'hora_inicio')
-    )
-    horarios_html = _build_horarios_html(agendamentos)
+    horarios_html = _horarios_do_pai_html(agendamento_pai, filhos)
 
     obs_html = f'<p><strong>Observações:</strong> {observacoes}</p>' if observacoes else ''
-    saudacao_html = f'<p>{html.escape(saudacao)}</p>' if saudacao else ''
 
     return f"""
     <html>
         <body style="font-family: sans-serif;">
-            {saudacao_html}
+            {_MARCADOR_SAUDACAO}
             <p>{html.escape(mensagem)}</p>
             <hr>
             <h3 style="color: #333;">Detalhes do Agendamento:</h3>
@@ -83,6 +123,16 @@ def _build_email_html(agendamento_pai, mensagem, saudacao=''):
     """
 
 
+def _com_saudacao(corpo_html, saudacao=''):
+    saudacao_html = f'<p>{html.escape(saudacao)}</p>' if saudacao else ''
+    return corpo_html.replace(_MARCADOR_SAUDACAO, saudacao_html, 1)
+
+
+def _build_email_html(agendamento_pai, mensagem, saudacao='', filhos=None):
+    """Constrói o corpo HTML padrão de notificação de agendamento."""
+    return _com_saudacao(_corpo_email_html(agendamento_pai, mensagem, filhos), saudacao)
+
+
 def criar_notificacao_resumida_conflito(destinatario, agendamento_pai_conflitante, agendamentos_negados):
     """
     Cria uma única notificação e envia um email resumido para múltiplos conflitos
@@ -91,46 +141,104 @@ def criar_notificacao_resumida_conflito(destinatario, agendamento_pai_conflitant
     recurso_nome = agendamento_pai_conflitante.id_recurso.nome_recurso
     mensagem_curta = f"{quantidade} de seus horários para '{recurso_nome}' foram negados por conflito."
 
-    # Cria a notificação curta no sistema
-    Notificacao.objects.create(
-        destinatario=destinatario,
-        agendamento_pai=agendamento_pai_conflitante,
-        mensagem=mensagem_curta
-    )
+    with transaction.atomic():
+        # Cria a notificação curta no sistema
+        Notificacao.objects.create(
+            destinatario=destinatario,
+            agendamento_pai=agendamento_pai_conflitante,
+            mensagem=mensagem_curta
+        )
+
+        if settings.EMAIL_HOST_USER:
+            horarios_html = _build_horarios_html(agendamentos_negados)
+            html_message = f"""
+            <html>
+                <body style="font-family: sans-serif;">
+                    <p>{html.escape(mensagem_curta)}</p>
+                    <p>Os seguintes horários não puderam ser aprovados pois outro agendamento foi confirmado para o mesmo recurso e horário:</p>
+                    {horarios_html}
+                    <p><br>Para mais detalhes, acesse o sistema Alocaí.</p>
+                </body>
+            </html>
+            """
+            _disparar_email('Alocaí - Conflito de Agendamento', mensagem_curta, destinatario.email, html_message)
+
+
+def notificar_decisoes_em_lote(decisoes):
+    """
+    Notifica os solicitantes das decisões tomadas em lote.
 
+    `decisoes` mapeia cada agendamento pai a um dict {rótulo: [agendamentos]},
+    ex.: {'aprovado(s)': [...], 'negado(s) por conflito': [...]}; um rótulo com
+    lista vazia entra na mensagem sem quantidade (decisões sobre a série). Cria uma
+    notificação por solicitação, todas em um único INSERT, e enfileira um
+    e-mail de resumo por usuário.
+    """
+    notificacoes = []
+    secoes_por_usuario = defaultdict(list)
+
+    for agendamento_pai, grupos in decisoes.items():
+        recurso = agendamento_pai.id_recurso.nome_recurso
+        partes = ', '.join(
+            f"{len(agendamentos)} {rotulo}" if agendamentos else rotulo for rotulo, agendamentos in grupos.items()
+        )
+        mensagem = f"Sua solicitação para '{recurso}' foi analisada: {partes or 'série atualizada'}."
+        notificacoes.append(Notificacao(
+            destinatario=agendamento_pai.id_usuario,
+            agendamento_pai=agendamento_pai,
+            mensagem=mensagem
+        ))
+
+        grupos_html = ''.join(
+            f'<p><strong>{html.escape(rotulo.capitalize())}:</strong></p>{_build_horarios_html(sorted(agendamentos, key=lambda ag: (ag.data_inicio, ag.hora_inicio)))}'
+            for rotulo, agendamentos in grupos.items() if agendamentos
+        )
+        secoes_por_usuario[agendamento_pai.id_usuario].append(
+            f'<h3 style="color: #333;">{html.escape(recurso)}</h3><p>{html.escape(mensagem)}</p>{grupos_html}'
+        )
+
+    emails = []
     if settings.EMAIL_HOST_USER:
-        horarios_html = _build_horarios_html(agendamentos_negados)
-        html_message = f"""
-        <html>
-            <body style="font-family: sans-serif;">
-                <p>{html.escape(mensagem_curta)}</p>
-                <p>Os seguintes horários não puderam ser aprovados pois outro agendamento foi confirmado para o mesmo recurso e horário:</p>
-                {horarios_html}
-                <p><br>Para mais detalhes, acesse o sistema Alocaí.</p>
-            </body>
-        </html>
-        """
-        _disparar_email('Alocaí - Conflito de Agendamento', mensagem_curta, destinatario.email, html_message)
+        for usuario, secoes in secoes_por_usuario.items():
+            mensagem = f"{len(secoes)} de suas solicitações foram analisadas."
+            html_message = f"""
+            <html>
+                <body style="font-family: sans-serif;">
+                    <p>Olá {html.escape(usuario.nome)},</p>
+                    <p>{html.escape(mensagem)}</p>
+                    <hr>
+                    {''.join(secoes)}
+                    <p><br>Para mais detalhes, acesse o sistema Alocaí.</p>
+                </body>
+            </html>
+            """
+            emails.append(_email_pendente('Alocaí - Solicitações Analisadas', mensagem, usuario.email, html_message))
+
+    with transaction.atomic():
+        Notificacao.objects.bulk_create(notificacoes)
+        EmailPendente.objects.bulk_create(emails)
 
 
 def criar_e_enviar_notificacao(destinatario, agendamento_pai, mensagem):
     """
     Cria uma notificação curta no banco de dados e envia um email detalhado
     """
-    Notificacao.objects.create(
-        destinatario=destinatario,
-        agendamento_pai=agendamento_pai,
-        mensagem=mensagem
-    )
+    with transaction.atomic():
+        Notificacao.objects.create(
+            destinatario=destinatario,
+            agendamento_pai=agendamento_pai,
+            mensagem=mensagem
+        )
 
-    # Constrói e envia o email detalhado
-    if settings.EMAIL_HOST_USER:
-        html_message = _build_email_html(agendamento_pai, mensagem)
-        _disparar_email('Alocaí - Notificação de Agendamento', mensagem, destinatario.email, html_message)
+        # Constrói e enfileira o email detalhado
+        if settings.EMAIL_HOST_USER:
+            html_message = _build_email_html(agendamento_pai, mensagem)
+            _disparar_email('Alocaí - Notificação de Agendamento', mensagem, destinatario.email, html_message)
 
-def notificar_admins(agendamento_pai, mensagem):
+def notificar_admins(agendamento_pai, mensagem, filhos=None):
     """
-    Cria notificações e envia emails para todos os admins
+    Cria notificações e enfileira emails para todos os admins. `filhos` são os
+    agendamentos da solicitação, quando quem chama já os tem em mãos.
     """
     admins = Usuario.objects.select_related('id_perfil').filter(id_perfil__nome_perfil='Administrador')
 
@@ -145,7 +253,13 @@ def notificar_admins(agendamento_pai, mensagem):
         ]
         Notificacao.objects.bulk_create(notificacoes)
 
-        for admin in admins:
-            if settings.EMAIL_HOST_USER:
-                html_message = _build_email_html(agendamento_pai, mensagem, saudacao=f'Olá {admin.nome},')
-                _disparar_email('Alocaí - Nova Solicitação de Agendamento', mensagem, admin.email, html_message)
\ No newline at end of file
+        if settings.EMAIL_HOST_USER and notificacoes:
+            # Um corpo para todos os admins; só a saudação muda
+            corpo_html = _corpo_email_html(agendamento_pai, mensagem, filhos)
+            EmailPendente.objects.bulk_create([
+                _email_pendente(
+                    'Alocaí - Nova Solicitação de Agendamento', mensagem, admin.email,
+                    _com_saudacao(corpo_html, f'Olá {admin.nome},')
+                )
+                for admin in admins
+            ])
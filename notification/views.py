@@ -1,14 +1,19 @@
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
+from alocai.cron import RotaDeCron
+from alocai.paginacao import PaginacaoPorChave
+from .envio import esvaziar_fila
 from .models import Notificacao
 from .serializers import NotificacaoSerializer
 
 class ListarNotificacoesView(generics.ListAPIView):
     serializer_class = NotificacaoSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PaginacaoPorChave
+    ordenacao_chave = ('-data_criacao', '-id_notificacao')
 
     def get_queryset(self):
-        return Notificacao.objects.filter(destinatario=self.request.user)
+        return Notificacao.objects.filter(destinatario=self.request.user).order_by(*self.ordenacao_chave)
 
 class MarcarNotificacoesComoLidasView(generics.UpdateAPIView):
     serializer_class = NotificacaoSerializer
@@ -46,4 +51,17 @@ class GerenciarNotificacaoView(generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Notificacao.objects.filter(destinatario=self.request.user)
\ No newline at end of file
+        return Notificacao.objects.filter(destinatario=self.request.user)
+
+
+# Tempo máximo de envio por chamada, abaixo do limite das funções da Vercel,
+# e lotes pequenos para que a reserva de cada um caiba nesse prazo
+PRAZO_CRON_SEGUNDOS = 8
+TAMANHO_LOTE_CRON = 10
+
+
+class EnviarEmailsCronView(RotaDeCron):
+    """Esvazia a saída de e-mails (o mesmo que `python manage.py enviar_emails`)."""
+
+    def executar(self):
+        return esvaziar_fila(tamanho_lote=TAMANHO_LOTE_CRON, prazo_segundos=PRAZO_CRON_SEGUNDOS)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recurso',
+            index=models.Index(fields=['nome_recurso', 'id_recurso'], name='recurso_nome_idx'),
+        ),
+    ]
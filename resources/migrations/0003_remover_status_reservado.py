@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+def liberar_reservados(apps, schema_editor):
+    """A ocupação passa a ser calculada (booking.ocupacao); 'reservado' deixa de existir."""
+    Recurso = apps.get_model('resources', 'Recurso')
+    Recurso.objects.filter(status_recurso='reservado').update(status_recurso='disponivel')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0002_indices_paginacao'),
+    ]
+
+    operations = [
+        migrations.RunPython(liberar_reservados, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='recurso',
+            name='status_recurso',
+            field=models.CharField(choices=[('disponivel', 'Disponível'), ('em_manutencao', 'Em Manutenção'), ('indisponivel', 'Indisponível')], default='disponivel', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-18 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0003_remover_status_reservado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recurso',
+            name='status_recurso',
+            field=models.CharField(choices=[('disponivel', 'Disponível'), ('em_manutencao', 'Em Manutenção'), ('indisponivel', 'Indisponível'), ('reservado', 'Reservado (obsoleto)')], default='disponivel', max_length=20),
+        ),
+    ]
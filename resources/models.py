@@ -5,10 +5,23 @@ class StatusRecurso(models.TextChoices):
     DISPONIVEL = 'disponivel', 'Disponível'
     EM_MANUTENCAO = 'em_manutencao', 'Em Manutenção'
     INDISPONIVEL = 'indisponivel', 'Indisponível'
-    RESERVADO = 'reservado', 'Reservado'
+    # Obsoleto: "em uso agora" passou a ser o campo calculado `ocupado` (ver
+    # booking.ocupacao). Mantido para os clientes antigos: na escrita equivale
+    # a 'disponivel' (nunca é gravado) e no filtro `?status=` lista os ocupados.
+    RESERVADO = 'reservado', 'Reservado (obsoleto)'
+
+
+def status_a_gravar(status_recurso):
+    """Traduz o status obsoleto 'reservado' para o que é gravado."""
+    return StatusRecurso.DISPONIVEL if status_recurso == StatusRecurso.RESERVADO else status_recurso
 
 
 class Recurso(models.Model):
+    """
+    Espaço ou equipamento agendável. `status_recurso` é definido pelo
+    administrador; se o recurso está em uso agora é calculado a partir dos usos
+    e agendamentos (ver booking.ocupacao).
+    """
     id_recurso = models.AutoField(primary_key=True)
     nome_recurso = models.CharField(max_length=255)
     descricao = models.TextField(null=True, blank=True)
@@ -25,6 +38,7 @@ class Recurso(models.Model):
 
     class Meta:
         db_table = 'recurso'
+        indexes = [models.Index(fields=['nome_recurso', 'id_recurso'], name='recurso_nome_idx')]
 
     def __str__(self):
         return self.nome_recurso
\ No newline at end of file
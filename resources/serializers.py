@@ -1,24 +1,71 @@
+from itertools import islice
+
 from rest_framework import serializers
-from .models import Recurso
+from .models import Recurso, StatusRecurso, status_a_gravar
 from booking.models import Agendamento
+from booking.recorrencia import LIMITE_OCORRENCIAS, expandir_regra
 from booking.serializers import PublicAgendamentoSerializer
 
 
 class RecursoSerializer(serializers.ModelSerializer):
+    # Anotado pelas views com booking.ocupacao.com_ocupacao, sem consulta por recurso
+    ocupado = serializers.BooleanField(read_only=True)
+
     class Meta:
         model = Recurso
         fields = [
             'id_recurso', 'nome_recurso', 'descricao', 'capacidade',
-            'localizacao', 'status_recurso', 'politicas_uso_especificas',
+            'localizacao', 'status_recurso', 'ocupado', 'politicas_uso_especificas',
             'data_cadastro', 'data_atualizacao'
         ]
         read_only_fields = ('data_cadastro', 'data_atualizacao')
 
     def validate_status_recurso(self, value):
-        status_validos = ['disponivel', 'em_manutencao', 'indisponivel', 'reservado']
+        status_validos = StatusRecurso.values
         if value not in status_validos:
             raise serializers.ValidationError(f"Status inválido. Deve ser um dos seguintes: {', '.join(status_validos)}")
-        return value
+        return status_a_gravar(value)
+
+
+class BuscaRecursosLivresSerializer(serializers.Serializer):
+    """
+    Parâmetros da busca de recursos livres: um horário em um único dia (`data`)
+    ou em uma série semanal (`data_inicio`, `dias_semana` e `ate` ou `quantidade`).
+    """
+    capacidade = serializers.IntegerField(min_value=1, required=False)
+    localizacao = serializers.CharField(required=False)
+    hora_inicio = serializers.TimeField()
+    hora_fim = serializers.TimeField()
+    data = serializers.DateField(required=False)
+    data_inicio = serializers.DateField(required=False)
+    dias_semana = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=6), required=False, max_length=7
+    )
+    intervalo = serializers.IntegerField(min_value=1, max_value=52, default=1)
+    ate = serializers.DateField(required=False, default=None)
+    quantidade = serializers.IntegerField(min_value=1, required=False, default=None)
+
+    def validate(self, data):
+        if data['hora_fim'] <= data['hora_inicio']:
+            raise serializers.ValidationError(
+                f"hora_fim ({data['hora_fim']}) deve ser posterior a hora_inicio ({data['hora_inicio']})."
+            )
+
+        if 'data' in data:
+            data['datas'] = [data['data']]
+            return data
+
+        if 'data_inicio' not in data or not data.get('dias_semana'):
+            raise serializers.ValidationError("Informe 'data' ou 'data_inicio' e 'dias_semana'.")
+        if data['ate'] is None and data['quantidade'] is None:
+            raise serializers.ValidationError("Informe 'ate' ou 'quantidade' para limitar a recorrência.")
+
+        data['datas'] = list(islice(expandir_regra(data), LIMITE_OCORRENCIAS + 1))
+        if not data['datas']:
+            raise serializers.ValidationError('A regra não gera nenhuma ocorrência.')
+        if len(data['datas']) > LIMITE_OCORRENCIAS:
+            raise serializers.ValidationError(f'A regra gera mais de {LIMITE_OCORRENCIAS} ocorrências.')
+        return data
 
 
 class DashboardRecursoSerializer(serializers.ModelSerializer):
@@ -32,8 +79,13 @@ class DashboardRecursoSerializer(serializers.ModelSerializer):
         ]
 
     def get_agendamentos(self, obj):
+        # DashboardView já entrega os agendamentos da janela agrupados por recurso
+        if 'agendamentos_por_recurso' in self.context:
+            agendamentos = self.context['agendamentos_por_recurso'].get(obj.id_recurso, [])
+            return PublicAgendamentoSerializer(agendamentos, many=True).data
+
         agendamentos_aprovados = Agendamento.objects.filter(
-            agendamento_pai__id_recurso=obj.id_recurso,
+            id_recurso=obj.id_recurso,
             status_agendamento='aprovado'
         ).select_related('agendamento_pai').order_by('data_inicio', 'hora_inicio')
         return PublicAgendamentoSerializer(agendamentos_aprovados, many=True).data
\ No newline at end of file
@@ -75,12 +75,129 @@ class ResourcesAPITestCase(BaseTestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_dashboard_filtra_janela_em_consultas_constantes(self):
+        from booking.models import AgendamentoPai, Agendamento
+        from login.models import Usuario
+        from datetime import date, time
+        user = Usuario.objects.create_user(email='tmp@t.com', nome='Tmp')
+        for recurso in (self.recurso1, self.recurso2):
+            pai = AgendamentoPai.objects.create(id_usuario=user, id_recurso=recurso, id_responsavel=user)
+            for dia in (date(2025, 11, 3), date(2025, 12, 1)):
+                Agendamento.objects.create(agendamento_pai=pai, data_inicio=dia, hora_inicio=time(9, 0), data_fim=dia, hora_fim=time(10, 0), status_agendamento='aprovado')
+
+        url = reverse('dashboard')
+        # Recursos + agendamentos da janela
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'inicio': '2025-11-01', 'fim': '2025-11-30'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for recurso in response.data:
+            self.assertEqual([a['data_inicio'] for a in recurso['agendamentos']], ['2025-11-03'])
+
+        response = self.client.get(url, {'inicio': '2025-11-30', 'fim': '2025-11-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_dashboard_calendar_acessivel_sem_autenticacao(self):
         """Calendar do dashboard é público — qualquer um pode acessar."""
         url = reverse('dashboard-calendar')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_dashboard_calendar_filtra_periodo_e_recursos(self):
+        from booking.models import AgendamentoPai, Agendamento
+        from login.models import Usuario
+        from datetime import date, time
+        user = Usuario.objects.create_user(email='tmp@t.com', nome='Tmp')
+        for recurso in (self.recurso1, self.recurso2):
+            pai = AgendamentoPai.objects.create(id_usuario=user, id_recurso=recurso, finalidade='Aula', id_responsavel=user)
+            for dia in (date(2025, 11, 3), date(2025, 12, 1)):
+                Agendamento.objects.create(agendamento_pai=pai, data_inicio=dia, hora_inicio=time(9, 0), data_fim=dia, hora_fim=time(10, 0), status_agendamento='aprovado')
+
+        url = reverse('dashboard-calendar')
+        response = self.client.get(url, {'inicio': '2025-11-01', 'fim': '2025-11-30', 'recursos': str(self.recurso1.id_recurso)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data), ['2025-11-03'])
+        self.assertEqual(len(response.data['2025-11-03']), 1)
+        self.assertEqual(response.data['2025-11-03'][0]['recurso'], 'Laboratório A')
+        self.assertEqual(response.data['2025-11-03'][0]['start'], '09:00')
+
+        response = self.client.get(url, {'recursos': 'a,b'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_busca_recursos_livres_por_capacidade_e_horario(self):
+        from booking.models import AgendamentoPai, Agendamento
+        from login.models import Usuario
+        from datetime import date, time
+        grande = Recurso.objects.create(nome_recurso="Auditório", capacidade=80, localizacao="Bloco A", status_recurso="disponivel")
+        ocupado = Recurso.objects.create(nome_recurso="Laboratório C", capacidade=40, localizacao="Bloco A", status_recurso="disponivel")
+        Recurso.objects.create(nome_recurso="Sala pequena", capacidade=10, localizacao="Bloco A", status_recurso="disponivel")
+        user = Usuario.objects.create_user(email='tmp@t.com', nome='Tmp')
+        pai = AgendamentoPai.objects.create(id_usuario=user, id_recurso=ocupado, id_responsavel=user)
+        # Segunda-feira 16/03/2026, dentro da série pedida
+        Agendamento.objects.create(agendamento_pai=pai, data_inicio=date(2026, 3, 16), hora_inicio=time(9, 0), data_fim=date(2026, 3, 16), hora_fim=time(11, 0), status_agendamento='aprovado')
+
+        self.client.force_authenticate(user=self.server_user)
+        url = reverse('listar-recursos-livres')
+        params = {'capacidade': 30, 'localizacao': 'bloco a', 'hora_inicio': '08:00', 'hora_fim': '10:00'}
+        response = self.client.get(url, {**params, 'data_inicio': '2026-03-02', 'dias_semana': [0], 'quantidade': 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['id_recurso'] for r in response.data], [grande.id_recurso])
+
+        response = self.client.get(url, {**params, 'data': '2026-03-17'})
+        self.assertEqual({r['id_recurso'] for r in response.data}, {grande.id_recurso, ocupado.id_recurso})
+
+        response = self.client.get(url, {**params, 'data_inicio': '2026-03-02', 'dias_semana': [0]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_quadro_de_ocupacao_fica_em_cache_ate_a_proxima_fronteira(self):
+        from booking.models import AgendamentoPai, Agendamento, UsoImediato
+        from booking.ocupacao import quadro_de_ocupacao
+        from login.models import Usuario
+        from datetime import date, datetime, time
+        from django.utils import timezone
+        dia = date(2026, 3, 2)
+
+        def em(hora, minuto=0):
+            return timezone.make_aware(datetime.combine(dia, time(hora, minuto)))
+
+        user = Usuario.objects.create_user(email='tmp@t.com', nome='Tmp')
+        for recurso, inicio, fim in ((self.recurso1, 10, 12), (self.recurso2, 13, 14)):
+            pai = AgendamentoPai.objects.create(id_usuario=user, id_recurso=recurso, finalidade='Aula', id_responsavel=user)
+            Agendamento.objects.create(agendamento_pai=pai, data_inicio=dia, hora_inicio=time(inicio, 0), data_fim=dia, hora_fim=time(fim, 0), status_agendamento='aprovado')
+
+        quadro = quadro_de_ocupacao(em(10, 30))
+        self.assertEqual([(item['recurso'], item['tipo'], item['usuario'], item['fim']) for item in quadro], [('Laboratório A', 'agendamento', 'Tmp', em(12))])
+        # Nada começa nem termina antes das 12:00
+        with self.assertNumQueries(0):
+            self.assertEqual(quadro_de_ocupacao(em(11, 59)), quadro)
+        self.assertEqual(quadro_de_ocupacao(em(12)), [])
+
+        # Uma gravação invalida o quadro antes da fronteira (13:00)
+        with self.captureOnCommitCallbacks(execute=True):
+            UsoImediato.objects.create(id_usuario=user, id_recurso=self.recurso1, duracao_minutos=30, data_inicio=em(12, 10))
+        quadro = quadro_de_ocupacao(em(12, 15))
+        self.assertEqual([(item['tipo'], item['fim']) for item in quadro], [('uso_imediato', em(12, 40))])
+
+    def test_quadro_de_ocupacao_publico(self):
+        response = self.client.get(reverse('dashboard-ocupados'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+    def test_quadro_de_ocupacao_anonimo_nao_identifica_usuario(self):
+        from booking.models import UsoImediato
+        from login.models import Usuario
+        from user_profile.models import PerfilAcesso
+        terc_profile = PerfilAcesso.objects.create(nome_perfil='Terceirizado', visibilidade=True)
+        terc_user = Usuario.objects.create_user(email='terc_quadro@teste.com', nome='Terc Quadro', id_perfil=terc_profile)
+        UsoImediato.objects.create(id_usuario=terc_user, id_recurso=self.recurso1, duracao_minutos=60)
+
+        response = self.client.get(reverse('dashboard-ocupados'))
+        self.assertEqual([item['recurso'] for item in response.data], ['Laboratório A'])
+        self.assertNotIn('usuario', response.data[0])
+
+        self.client.force_authenticate(user=self.server_user)
+        response = self.client.get(reverse('dashboard-ocupados'))
+        self.assertEqual(response.data[0]['usuario'], 'Terc Quadro')
+
     def test_recurso_agendamentos_publico(self):
         """Endpoint de agendamentos de um recurso é público."""
         from booking.models import AgendamentoPai, Agendamento
@@ -147,7 +264,7 @@ class ResourcesAPITestCase(BaseTestCase):
     # Auto-finalização de usos imediatos expirados
 
     def test_listar_recursos_auto_finaliza_uso_imediato_expirado(self):
-        """Uso imediato expirado é finalizado e recurso liberado ao listar."""
+        """Uso imediato expirado é finalizado ao listar e não ocupa o recurso."""
         from booking.models import UsoImediato
         from login.models import Usuario
         from user_profile.models import PerfilAcesso
@@ -156,10 +273,10 @@ class ResourcesAPITestCase(BaseTestCase):
 
         terc_profile = PerfilAcesso.objects.create(nome_perfil='Terceirizado', visibilidade=True)
         terc_user = Usuario.objects.create_user(email='terc_res@teste.com', nome='Terc', id_perfil=terc_profile)
-        uso = UsoImediato.objects.create(id_usuario=terc_user, id_recurso=self.recurso1, duracao_minutos=1)
-        UsoImediato.objects.filter(pk=uso.pk).update(data_inicio=timezone.now() - timedelta(minutes=120))
-        self.recurso1.status_recurso = 'reservado'
-        self.recurso1.save()
+        uso = UsoImediato.objects.create(
+            id_usuario=terc_user, id_recurso=self.recurso1, duracao_minutos=1,
+            data_inicio=timezone.now() - timedelta(minutes=120)
+        )
 
         self.client.force_authenticate(user=self.server_user)
         response = self.client.get(reverse('listar-recursos'))
@@ -167,8 +284,62 @@ class ResourcesAPITestCase(BaseTestCase):
 
         uso.refresh_from_db()
         self.assertFalse(uso.ativo)
-        self.recurso1.refresh_from_db()
-        self.assertEqual(self.recurso1.status_recurso, 'disponivel')
+        listado = next(r for r in response.data if r['id_recurso'] == self.recurso1.id_recurso)
+        self.assertFalse(listado['ocupado'])
+
+    def test_respostas_de_escrita_trazem_ocupado_anotado(self):
+        from login.models import Usuario
+        from user_profile.models import PerfilAcesso
+        from booking.models import UsoImediato
+
+        terc_profile = PerfilAcesso.objects.create(nome_perfil='Terceirizado', visibilidade=True)
+        terc_user = Usuario.objects.create_user(email='terc_ocupado@teste.com', nome='Terc', id_perfil=terc_profile)
+        UsoImediato.objects.create(id_usuario=terc_user, id_recurso=self.recurso1, duracao_minutos=60)
+
+        self.client.force_authenticate(user=self.admin_user)
+        url = reverse('recurso-admin-alterar-status', kwargs={'pk': self.recurso1.pk})
+        response = self.client.post(url, {'status': 'em_manutencao'}, format='json')
+        self.assertTrue(response.data['recurso']['ocupado'])
+
+        url = reverse('recurso-admin-detail', kwargs={'pk': self.recurso1.pk})
+        response = self.client.patch(url, {'capacidade': 50}, format='json')
+        self.assertTrue(response.data['ocupado'])
+        response = self.client.post(reverse('recurso-admin-list'), {'nome_recurso': 'Novo'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.data['ocupado'])
+
+    def test_status_reservado_obsoleto_continua_aceito(self):
+        from login.models import Usuario
+        from user_profile.models import PerfilAcesso
+        from booking.models import UsoImediato
+        self.client.force_authenticate(user=self.admin_user)
+
+        response = self.client.get(reverse('recurso-admin-status-disponiveis'))
+        self.assertIn('reservado', response.data['status_disponiveis'])
+
+        # Na escrita equivale a 'disponivel'
+        url = reverse('recurso-admin-alterar-status', kwargs={'pk': self.recurso2.pk})
+        response = self.client.post(url, {'status': 'reservado'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['recurso']['status_recurso'], 'disponivel')
+        url = reverse('recurso-admin-detail', kwargs={'pk': self.recurso2.pk})
+        response = self.client.patch(url, {'status_recurso': 'reservado'}, format='json')
+        self.assertEqual(response.data['status_recurso'], 'disponivel')
+
+        # No filtro, lista os recursos em uso agora
+        terc_profile = PerfilAcesso.objects.create(nome_perfil='Terceirizado', visibilidade=True)
+        terc_user = Usuario.objects.create_user(email='terc_reservado@teste.com', nome='Terc', id_perfil=terc_profile)
+        UsoImediato.objects.create(id_usuario=terc_user, id_recurso=self.recurso1, duracao_minutos=60)
+        response = self.client.get(reverse('recurso-admin-list'), {'status': 'reservado'})
+        self.assertEqual([recurso['id_recurso'] for recurso in response.data], [self.recurso1.pk])
+
+    def test_listagem_de_recursos_nao_consulta_ocupacao_por_recurso(self):
+        for i in range(5):
+            Recurso.objects.create(nome_recurso=f"Sala {i}", status_recurso="disponivel")
+        self.client.force_authenticate(user=self.admin_user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('recurso-admin-list'))
+        self.assertTrue(all('ocupado' in recurso for recurso in response.data))
 
     # PATCH parcial de recurso
 
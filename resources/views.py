@@ -1,11 +1,22 @@
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
 from rest_framework import viewsets, status, permissions, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Recurso, StatusRecurso
-from .serializers import RecursoSerializer, DashboardRecursoSerializer
+from rest_framework.views import APIView
+from .models import Recurso, StatusRecurso, status_a_gravar
+from .serializers import BuscaRecursosLivresSerializer, RecursoSerializer, DashboardRecursoSerializer
 from rest_framework.permissions import AllowAny
+from alocai.paginacao import PaginacaoPorChave
 from user_profile.permissions import IsAdministrador
-from booking.models import Agendamento
+from booking.expiracao import finalizar_usos_expirados
+from booking.models import Agendamento, StatusAgendamento
+from booking.ocupacao import com_ocupacao, quadro_de_ocupacao
+from booking.series import ocorrencias_virtuais_dos_recursos
 from booking.serializers import PublicAgendamentoSerializer
 
 class RecursoListView(generics.ListAPIView):
@@ -17,16 +28,55 @@ class RecursoListView(generics.ListAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        # Auto-finaliza recursos de uso imediato expirados
-        from booking.models import UsoImediato
-        usos_expirados = UsoImediato.objects.select_related('id_recurso').filter(
-            ativo=True
+        # Registra o fim dos usos imediatos vencidos; a ocupação é calculada na anotação
+        finalizar_usos_expirados()
+
+        return com_ocupacao(Recurso.objects.filter(status_recurso=StatusRecurso.DISPONIVEL)).order_by('nome_recurso')
+
+class RecursosLivresView(RecursoListView):
+    """
+    Endpoint que lista os recursos disponíveis, com a capacidade e a
+    localização pedidas, livres em um horário de um dia ou de uma série
+    semanal (ver BuscaRecursosLivresSerializer).
+    """
+
+    def get_queryset(self):
+        busca = BuscaRecursosLivresSerializer(data=self.request.query_params)
+        busca.is_valid(raise_exception=True)
+        filtros = busca.validated_data
+        datas = filtros['datas']
+
+        recursos = super().get_queryset()
+        if 'capacidade' in filtros:
+            recursos = recursos.filter(capacidade__gte=filtros['capacidade'])
+        if 'localizacao' in filtros:
+            recursos = recursos.filter(localizacao__icontains=filtros['localizacao'])
+
+        # Anti-join: nenhum aprovado do recurso em uma das datas sobrepondo o horário
+        ocupado = Agendamento.objects.filter(
+            id_recurso=OuterRef('pk'),
+            status_agendamento=StatusAgendamento.APROVADO,
+            data_inicio__in=datas,
+            hora_inicio__lt=filtros['hora_fim'],
+            hora_fim__gt=filtros['hora_inicio']
         )
-        for uso in usos_expirados:
-            if uso.expirado:
-                uso.finalizar()
+        recursos = list(recursos.filter(~Exists(ocupado)))
+
+        # Séries aprovadas ainda não gravadas são conferidas pela regra
+        if recursos:
+            datas_pedidas = set(datas)
+            ocupados = {
+                ocorrencia.id_recurso_id
+                for ocorrencia in ocorrencias_virtuais_dos_recursos(
+                    [recurso.id_recurso for recurso in recursos], min(datas), max(datas)
+                )
+                if ocorrencia.data_inicio in datas_pedidas
+                and ocorrencia.hora_inicio < filtros['hora_fim']
+                and ocorrencia.hora_fim > filtros['hora_inicio']
+            }
+            recursos = [recurso for recurso in recursos if recurso.id_recurso not in ocupados]
+        return recursos
 
-        return Recurso.objects.filter(status_recurso=StatusRecurso.DISPONIVEL).order_by('nome_recurso')
 
 class RecursoAdminViewSet(viewsets.ModelViewSet):
     """
@@ -38,11 +88,23 @@ class RecursoAdminViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, IsAdministrador]
     
     def get_queryset(self):
-        queryset = Recurso.objects.all()
+        queryset = com_ocupacao(Recurso.objects.all())
         status_recurso = self.request.query_params.get('status', None)
-        if status_recurso:
+        if status_recurso == StatusRecurso.RESERVADO:
+            queryset = queryset.filter(ocupado=True)
+        elif status_recurso:
             queryset = queryset.filter(status_recurso=status_recurso)
         return queryset.order_by('nome_recurso')
+
+    def _recarregar(self, recurso):
+        """Relê o recurso gravado com a anotação `ocupado`, para a resposta."""
+        return com_ocupacao(Recurso.objects.filter(pk=recurso.pk)).get()
+
+    def perform_create(self, serializer):
+        serializer.instance = self._recarregar(serializer.save())
+
+    def perform_update(self, serializer):
+        serializer.instance = self._recarregar(serializer.save())
     
     @action(detail=True, methods=['post'])
     def alterar_status(self, request, pk=None):
@@ -62,12 +124,12 @@ class RecursoAdminViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        recurso.status_recurso = novo_status
+        recurso.status_recurso = status_a_gravar(novo_status)
         recurso.save(update_fields=['status_recurso'])
 
         return Response({
             "mensagem": f"Status do recurso atualizado para '{novo_status}' com sucesso",
-            "recurso": RecursoSerializer(recurso).data
+            "recurso": RecursoSerializer(self._recarregar(recurso)).data
         })
     
     @action(detail=False, methods=['get'])
@@ -76,36 +138,153 @@ class RecursoAdminViewSet(viewsets.ModelViewSet):
             "status_disponiveis": [choice[0] for choice in StatusRecurso.choices]
         })
 
+# Janela padrão do dashboard e maior janela aceita, em dias
+JANELA_DASHBOARD_DIAS = 28
+JANELA_MAXIMA_DIAS = 366
+
+
+def _janela_de_datas(request, padrao_inicio, padrao_fim):
+    """
+    Lê os parâmetros `inicio` e `fim` (AAAA-MM-DD) da requisição.
+    Retorna (inicio, fim) ou levanta ValueError com a mensagem de erro.
+    """
+    try:
+        inicio = date.fromisoformat(request.query_params['inicio']) if 'inicio' in request.query_params else padrao_inicio
+        fim = date.fromisoformat(request.query_params['fim']) if 'fim' in request.query_params else padrao_fim
+    except ValueError:
+        raise ValueError('Parâmetros "inicio" e "fim" devem estar no formato AAAA-MM-DD.')
+    if fim < inicio:
+        raise ValueError('"fim" não pode ser anterior a "inicio".')
+    if (fim - inicio).days > JANELA_MAXIMA_DIAS:
+        raise ValueError(f'A janela não pode passar de {JANELA_MAXIMA_DIAS} dias.')
+    return inicio, fim
+
+
+def _ids_de_recursos(request):
+    """Lê o parâmetro opcional `recursos` (ids separados por vírgula)."""
+    valor = request.query_params.get('recursos')
+    if not valor:
+        return []
+    try:
+        return [int(id_recurso) for id_recurso in valor.split(',')]
+    except ValueError:
+        raise ValueError('"recursos" deve ser uma lista de ids separados por vírgula.')
+
+
 class DashboardView(generics.ListAPIView):
     """
     Endpoint para a visualização do dashboard
-    (mostra recursos e os agendamentos aprovados)
+    (mostra recursos e os agendamentos aprovados entre `inicio` e `fim`,
+    por padrão de hoje até JANELA_DASHBOARD_DIAS dias à frente)
     """
     serializer_class = DashboardRecursoSerializer
     permission_classes = [AllowAny]
+    pagination_class = PaginacaoPorChave
+    ordenacao_chave = ('nome_recurso', 'id_recurso')
 
     def get_queryset(self):
-        return Recurso.objects.all().order_by('nome_recurso')
+        return Recurso.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        hoje = timezone.localdate()
+        try:
+            inicio, fim = _janela_de_datas(request, hoje, hoje + timedelta(days=JANELA_DASHBOARD_DIAS))
+        except ValueError as erro:
+            return Response({'error': str(erro)}, status=status.HTTP_400_BAD_REQUEST)
+
+        recursos = self.get_queryset().order_by(*self.ordenacao_chave)
+        pagina = self.paginate_queryset(recursos)
+        recursos = list(recursos) if pagina is None else pagina
+
+        # Uma única consulta para todos os recursos da página, agrupada em memória
+        agendamentos_por_recurso = defaultdict(list)
+        agendamentos = Agendamento.objects.filter(
+            id_recurso__in=[recurso.id_recurso for recurso in recursos],
+            status_agendamento='aprovado',
+            data_inicio__range=(inicio, fim)
+        ).select_related('agendamento_pai__id_recurso').order_by('data_inicio', 'hora_inicio')
+        for agendamento in agendamentos:
+            agendamentos_por_recurso[agendamento.id_recurso_id].append(agendamento)
+
+        context = self.get_serializer_context()
+        context['agendamentos_por_recurso'] = agendamentos_por_recurso
+        serializer = self.get_serializer_class()(recursos, many=True, context=context)
+        if pagina is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
 
 class CalendarAgendamentosView(generics.ListAPIView):
     """
-    Endpoint que retorna todos os agendamentos aprovados
-    para serem exibidos no calendário do dashboard
+    Endpoint que retorna os agendamentos aprovados entre `inicio` e `fim`
+    (padrão: mês atual), opcionalmente apenas dos `recursos` informados,
+    agrupados por dia para o calendário do dashboard
+    """
+    permission_classes = [AllowAny]
+    pagination_class = PaginacaoPorChave
+    ordenacao_chave = ('data_inicio', 'hora_inicio', 'id_agendamento')
+
+    def get_queryset(self):
+        return Agendamento.objects.filter(status_agendamento='aprovado').select_related('id_recurso', 'agendamento_pai')
+
+    def list(self, request, *args, **kwargs):
+        hoje = timezone.localdate()
+        primeiro_dia = hoje.replace(day=1)
+        ultimo_dia = hoje.replace(day=monthrange(hoje.year, hoje.month)[1])
+        try:
+            inicio, fim = _janela_de_datas(request, primeiro_dia, ultimo_dia)
+            recursos = _ids_de_recursos(request)
+        except ValueError as erro:
+            return Response({'error': str(erro)}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.get_queryset().filter(data_inicio__range=(inicio, fim))
+        if recursos:
+            queryset = queryset.filter(id_recurso__in=recursos)
+
+        queryset = queryset.order_by(*self.ordenacao_chave)
+        pagina = self.paginate_queryset(queryset)
+        por_dia = defaultdict(list)
+        for agendamento in (queryset if pagina is None else pagina):
+            por_dia[agendamento.data_inicio.strftime('%Y-%m-%d')].append({
+                'id_agendamento': agendamento.id_agendamento,
+                'id_recurso': agendamento.id_recurso_id,
+                'recurso': agendamento.id_recurso.nome_recurso,
+                'finalidade': agendamento.agendamento_pai.finalidade,
+                'start': agendamento.hora_inicio.strftime('%H:%M'),
+                'end': agendamento.hora_fim.strftime('%H:%M'),
+                'data_fim': agendamento.data_fim.strftime('%Y-%m-%d'),
+            })
+        if pagina is None:
+            return Response(por_dia)
+        return self.get_paginated_response(por_dia)
+
+class RecursosOcupadosView(APIView):
+    """
+    Endpoint com o quadro dos recursos ocupados agora (usos imediatos e
+    agendamentos aprovados em andamento), para painéis que consultam com
+    frequência. Fica em cache até o próximo início ou fim de horário
+    (ver booking.ocupacao). Como os demais endpoints públicos, não identifica
+    o usuário para quem não está autenticado.
     """
-    queryset = Agendamento.objects.filter(status_agendamento='aprovado').order_by('data_inicio')
-    serializer_class = PublicAgendamentoSerializer
     permission_classes = [AllowAny]
 
+    def get(self, request):
+        itens = quadro_de_ocupacao()
+        if not request.user.is_authenticated:
+            itens = [{campo: valor for campo, valor in item.items() if campo != 'usuario'} for item in itens]
+        return Response(itens)
+
 class RecursoAgendamentosView(generics.ListAPIView):
     """
     Endpoint que retorna os agendamentos aprovados de um recurso
     """
     serializer_class = PublicAgendamentoSerializer
     permission_classes = [AllowAny]
+    pagination_class = PaginacaoPorChave
+    ordenacao_chave = ('data_inicio', 'hora_inicio', 'id_agendamento')
 
     def get_queryset(self):
         recurso_id = self.kwargs.get('id_recurso')
         return Agendamento.objects.filter(
-            agendamento_pai__id_recurso=recurso_id,
+            id_recurso=recurso_id,
             status_agendamento='aprovado'
-        ).order_by('data_inicio')
+        ).order_by(*self.ordenacao_chave)